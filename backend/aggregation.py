@@ -0,0 +1,330 @@
+"""
+Totales autoritativos de reportes (balance, registros, inventario)
+
+Las filas se convierten a arreglos columnares de centavos enteros (int64)
+y se suman con NumPy, de modo que los totales son exactos y no dependen de
+lo que calcule el cliente (ver frontend/src/utils/calculations.js).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+CLASIFICACIONES_DEUDORAS = ('Activo',)
+CLASIFICACIONES_ACREEDORAS = ('Pasivo', 'Capital')
+
+
+def to_cents(value):
+    """
+    Convertir un importe (número o texto) a centavos enteros
+    """
+    if value is None or value == '' or isinstance(value, bool):
+        return 0
+    try:
+        return int((Decimal(str(value)) * 100).to_integral_value(ROUND_HALF_UP))
+    except ArithmeticError:
+        return 0
+
+
+def _as_float(value):
+    # NaN marca los valores que se deben resolver con Decimal
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if value is None or value == '' or isinstance(value, bool):
+        return 0.0
+    return np.nan
+
+
+def cents_array(values):
+    """
+    Convertir una columna de importes a centavos exactos (int64)
+    
+    La conversión se hace vectorizada; solo los textos y los valores que
+    quedan a medio centavo (donde el redondeo binario es ambiguo) pasan
+    por Decimal.
+    """
+    try:
+        floats = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        floats = np.fromiter((_as_float(v) for v in values), dtype=np.float64, count=len(values))
+    
+    scaled = floats * 100
+    cents = np.rint(scaled)
+    
+    fraction = np.abs(scaled - np.trunc(scaled))
+    dudosos = np.flatnonzero(np.isnan(scaled) | (np.abs(fraction - 0.5) < 1e-6))
+    for i in dudosos:
+        cents[i] = to_cents(values[i])
+    
+    return cents.astype(np.int64)
+
+
+def factorize(values):
+    """
+    Asignar un código entero a cada valor distinto, en orden de aparición
+    """
+    labels = {}
+    codes = np.fromiter(
+        (labels.setdefault(v, len(labels)) for v in values),
+        dtype=np.int64, count=len(values)
+    )
+    return list(labels), codes
+
+
+def group_sum(codes, cents, size):
+    """
+    Sumar centavos por grupo
+    """
+    totals = np.zeros(size, dtype=np.int64)
+    np.add.at(totals, codes, cents)
+    return totals
+
+
+def _pesos(cents):
+    return int(cents) / 100
+
+
+def balance_totals(rows):
+    """
+    Totales de un Balance de Saldos: deudor, acreedor y subtotales por
+    clasificación
+    """
+    montos = cents_array([row.get('monto') for row in rows])
+    labels, codes = factorize([row.get('clasificacion') or '' for row in rows])
+    subtotales = group_sum(codes, montos, len(labels))
+    
+    deudor = sum(int(t) for label, t in zip(labels, subtotales) if label in CLASIFICACIONES_DEUDORAS)
+    acreedor = sum(int(t) for label, t in zip(labels, subtotales) if label in CLASIFICACIONES_ACREEDORAS)
+    
+    return {
+        'deudor': _pesos(deudor),
+        'acreedor': _pesos(acreedor),
+        'diferencia': _pesos(abs(deudor - acreedor)),
+        'balanced': deudor == acreedor,
+        'porClasificacion': {
+            label: _pesos(total) for label, total in zip(labels, subtotales) if label
+        }
+    }
+
+
+def registros_totals(rows):
+    """
+    Totales de Registros Contables: debe, haber, subtotales por
+    clasificación y asientos descuadrados
+    """
+    debe = cents_array([row.get('debe') for row in rows])
+    haber = cents_array([row.get('haber') for row in rows])
+    
+    labels, codes = factorize([row.get('clasificacion') or '' for row in rows])
+    debe_clasif = group_sum(codes, debe, len(labels))
+    haber_clasif = group_sum(codes, haber, len(labels))
+    
+    asientos, asiento_codes = factorize([row.get('noAsiento') for row in rows])
+    diferencias = group_sum(asiento_codes, debe - haber, len(asientos))
+    
+    total_debe = int(debe.sum())
+    total_haber = int(haber.sum())
+    
+    return {
+        'debe': _pesos(total_debe),
+        'haber': _pesos(total_haber),
+        'diferencia': _pesos(abs(total_debe - total_haber)),
+        'balanced': total_debe == total_haber,
+        'porClasificacion': {
+            label: {'debe': _pesos(d), 'haber': _pesos(h)}
+            for label, d, h in zip(labels, debe_clasif, haber_clasif) if label
+        },
+        'asientosDescuadrados': [
+            asiento for asiento, diferencia in zip(asientos, diferencias)
+            if diferencia != 0 and asiento is not None
+        ]
+    }
+
+
+def _to_float(value):
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return result if np.isfinite(result) else 0.0
+
+
+def _quantities(values):
+    return np.fromiter((_to_float(v) for v in values), dtype=np.float64, count=len(values))
+
+
+def inventory_totals(rows):
+    """
+    Totales de inventario: unidades y valor (unidades × costo unitario)
+    """
+    unidades = _quantities([row.get('unidades') for row in rows])
+    costos = cents_array([row.get('costoUnitario') for row in rows])
+    valores = np.rint(unidades * costos).astype(np.int64)
+    
+    return {
+        'totalUnidades': float(unidades.sum()),
+        'totalValor': _pesos(valores.sum())
+    }
+
+
+def process_totals(rows):
+    """
+    Totales de productos en proceso por elemento del costo
+    """
+    materiales = cents_array([row.get('materiales') for row in rows])
+    mano_obra = cents_array([row.get('manoObra') for row in rows])
+    gastos_f = cents_array([row.get('gastosF') for row in rows])
+    
+    return {
+        'cantidad': float(_quantities([row.get('cantidad') for row in rows]).sum()),
+        'materiales': _pesos(materiales.sum()),
+        'manoObra': _pesos(mano_obra.sum()),
+        'gastosF': _pesos(gastos_f.sum()),
+        'total': _pesos(materiales.sum() + mano_obra.sum() + gastos_f.sum())
+    }
+
+
+# Totales de sección que son cantidades y no importes
+QUANTITY_TOTALS = ('totalUnidades', 'cantidad')
+
+
+def _shift(pesos, cents):
+    return _pesos(to_cents(pesos) + int(cents))
+
+
+def _shift_by_label(current, rows, column, sign):
+    labels, codes = factorize([row.get('clasificacion') or '' for row in rows])
+    sums = group_sum(codes, cents_array([row.get(column) for row in rows]), len(labels))
+    for label, total in zip(labels, sums):
+        if label:
+            current[label] = _shift(current.get(label, 0), sign * total)
+
+
+def adjust_balance_totals(totals, old_rows, new_rows):
+    """
+    Ajustar los totales de un Balance de Saldos con solo las filas que
+    cambiaron (versión anterior y nueva de cada una)
+    """
+    por_clasificacion = dict(totals['porClasificacion'])
+    _shift_by_label(por_clasificacion, old_rows, 'monto', -1)
+    _shift_by_label(por_clasificacion, new_rows, 'monto', 1)
+    
+    deudor = sum(to_cents(v) for label, v in por_clasificacion.items() if label in CLASIFICACIONES_DEUDORAS)
+    acreedor = sum(to_cents(v) for label, v in por_clasificacion.items() if label in CLASIFICACIONES_ACREEDORAS)
+    
+    return {
+        'deudor': _pesos(deudor),
+        'acreedor': _pesos(acreedor),
+        'diferencia': _pesos(abs(deudor - acreedor)),
+        'balanced': deudor == acreedor,
+        'porClasificacion': por_clasificacion
+    }
+
+
+def adjust_registros_totals(totals, old_rows, new_rows, asiento_diffs):
+    """
+    Ajustar los totales de Registros Contables con las filas que cambiaron
+    
+    `asiento_diffs` trae la diferencia debe - haber (en centavos), ya con
+    los cambios aplicados, de cada asiento tocado.
+    """
+    total_debe = to_cents(totals['debe'])
+    total_haber = to_cents(totals['haber'])
+    debe_clasif = {label: v['debe'] for label, v in totals['porClasificacion'].items()}
+    haber_clasif = {label: v['haber'] for label, v in totals['porClasificacion'].items()}
+    
+    for sign, rows in ((-1, old_rows), (1, new_rows)):
+        total_debe += sign * int(cents_array([row.get('debe') for row in rows]).sum())
+        total_haber += sign * int(cents_array([row.get('haber') for row in rows]).sum())
+        _shift_by_label(debe_clasif, rows, 'debe', sign)
+        _shift_by_label(haber_clasif, rows, 'haber', sign)
+    
+    descuadrados = [
+        asiento for asiento in totals.get('asientosDescuadrados', [])
+        if asiento_diffs.get(asiento, 1) != 0
+    ]
+    descuadrados += [
+        asiento for asiento, diferencia in asiento_diffs.items()
+        if diferencia != 0 and asiento not in descuadrados
+    ]
+    
+    return {
+        'debe': _pesos(total_debe),
+        'haber': _pesos(total_haber),
+        'diferencia': _pesos(abs(total_debe - total_haber)),
+        'balanced': total_debe == total_haber,
+        'porClasificacion': {
+            label: {'debe': debe_clasif.get(label, 0), 'haber': haber_clasif.get(label, 0)}
+            for label in {**debe_clasif, **haber_clasif}
+        },
+        'asientosDescuadrados': descuadrados
+    }
+
+
+def adjust_section_totals(section, totals, old_rows, new_rows):
+    """
+    Ajustar los totales de una sección (inventario o proceso) sumando la
+    diferencia entre las filas nuevas y las anteriores
+    """
+    calculate = SECTION_TOTALS[section]
+    before = calculate(old_rows)
+    after = calculate(new_rows)
+    
+    adjusted = {}
+    for key in after:
+        if key in QUANTITY_TOTALS:
+            adjusted[key] = round(float(totals.get(key, 0)) + after[key] - before[key], 4)
+        else:
+            adjusted[key] = _shift(totals.get(key, 0), to_cents(after[key]) - to_cents(before[key]))
+    
+    return adjusted
+
+
+SECTION_TOTALS = {
+    'inventory': inventory_totals,
+    'process': process_totals,
+}
+
+
+def is_registros(rows):
+    """
+    Un reporte tipo lista es de registros si sus filas traen debe/haber
+    """
+    return any(isinstance(row, dict) and ('debe' in row or 'haber' in row) for row in rows)
+
+
+def compute_totals(document):
+    """
+    Calcular los totales de un documento de reporte según su forma
+    """
+    if isinstance(document, list):
+        rows = [row for row in document if isinstance(row, dict)]
+        return registros_totals(rows) if is_registros(rows) else balance_totals(rows)
+    
+    if isinstance(document, dict):
+        totals = {}
+        for section, calculate in SECTION_TOTALS.items():
+            value = document.get(section)
+            if isinstance(value, dict) and isinstance(value.get('rows'), list):
+                totals[section] = calculate([row for row in value['rows'] if isinstance(row, dict)])
+        return totals
+    
+    return {}
+
+
+def apply_totals(document, client_totals=None):
+    """
+    Reemplazar los totales enviados por el cliente por los calculados
+    
+    Se conservan las llaves del cliente que el servidor no calcula (por
+    ejemplo `asientos` o `movementsSummary` de registros). En documentos con
+    secciones también se actualizan los totales anidados.
+    """
+    totals = compute_totals(document)
+    
+    if isinstance(document, dict):
+        for section, section_totals in totals.items():
+            document[section]['totals'] = {
+                **(document[section].get('totals') or {}), **section_totals
+            }
+    
+    return {**(client_totals or {}), **totals}
@@ -1,12 +1,15 @@
-from flask import Flask, request, jsonify, redirect, url_for
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, redirect, stream_with_context, url_for
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, User, Report, CuentaContable
-from datetime import datetime
+from models import db, User, Report, CuentaContable, Job, LedgerBalance, apply_sqlite_pragmas
+from migrations import init_db, register_commands
+from datetime import date, datetime
 from oauthlib.oauth2 import WebApplicationClient
+from sqlalchemy import event
+import base64
+import hashlib
 import json
 import os
-import requests
+import time
 
 # Importar configuración y utilidades de autenticación
 from config import config
@@ -15,64 +18,36 @@ from auth_utils import (
     verify_jwt_token,
     verify_google_token,
     get_google_provider_cfg,
+    http_session,
     token_required,
+    get_user_pk,
     generate_user_id
 )
+import archive
+import bulk_import
+import catalog
+import consolidation
+import costing
+import export
+import jobs
+import ledger
+import metrics
+import report_service
+import search
+from jobs import JobLimitError, JobValidationError
+from report_service import ReportConflictError, ReportValidationError
+from serialization import FastJSONProvider, compress_response
+from password_hashing import hash_password, verify_password, needs_rehash, HashingBusyError
 
-app = Flask(__name__)
-
-# Configuración CORS
-CORS(app, resources={
-    r"/api/*": {
-        "origins": config.ALLOWED_ORIGINS,
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "supports_credentials": True
-    }
-})
-
-# Configuración de la app
-app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = config.SECRET_KEY
-
-db.init_app(app)
+# Todas las rutas viven en este blueprint; la app se arma en create_app()
+api = Blueprint('api', __name__)
 
 # Cliente OAuth
 oauth_client = WebApplicationClient(config.GOOGLE_CLIENT_ID)
 
-with app.app_context():
-    db.create_all()
-    
-    if CuentaContable.query.count() == 0:
-        cuentas_iniciales = [
-            {'cuenta': 'Caja', 'clasificacion': 'Activo', 'descripcion': 'Efectivo disponible'},
-            {'cuenta': 'Bancos', 'clasificacion': 'Activo', 'descripcion': 'Depósitos bancarios'},
-            {'cuenta': 'Clientes', 'clasificacion': 'Activo', 'descripcion': 'Cuentas por cobrar'},
-            {'cuenta': 'Inventarios', 'clasificacion': 'Activo', 'descripcion': 'Mercancías en almacén'},
-            {'cuenta': 'Equipo de Transporte', 'clasificacion': 'Activo', 'descripcion': 'Vehículos'},
-            {'cuenta': 'Mobiliario y Equipo', 'clasificacion': 'Activo', 'descripcion': 'Muebles y equipos'},
-            {'cuenta': 'Edificio', 'clasificacion': 'Activo', 'descripcion': 'Inmuebles'},
-            {'cuenta': 'Terrenos', 'clasificacion': 'Activo', 'descripcion': 'Propiedades'},
-            {'cuenta': 'Proveedores', 'clasificacion': 'Pasivo', 'descripcion': 'Cuentas por pagar'},
-            {'cuenta': 'Documentos por Pagar', 'clasificacion': 'Pasivo', 'descripcion': 'Obligaciones'},
-            {'cuenta': 'Acreedores Diversos', 'clasificacion': 'Pasivo', 'descripcion': 'Otras cuentas'},
-            {'cuenta': 'Hipotecas por Pagar', 'clasificacion': 'Pasivo', 'descripcion': 'Préstamos'},
-            {'cuenta': 'Capital Social', 'clasificacion': 'Capital', 'descripcion': 'Aportaciones'},
-            {'cuenta': 'Utilidad del Ejercicio', 'clasificacion': 'Capital', 'descripcion': 'Ganancias'},
-            {'cuenta': 'Reserva Legal', 'clasificacion': 'Capital', 'descripcion': 'Reservas'}
-        ]
-        
-        for cuenta_data in cuentas_iniciales:
-            cuenta = CuentaContable(**cuenta_data)
-            db.session.add(cuenta)
-        
-        db.session.commit()
-        print("✓ Cuentas contables inicializadas")
-
 # ==================== RUTAS DE AUTENTICACIÓN OAUTH ====================
 
-@app.route('/api/auth/google/login', methods=['GET'])
+@api.route('/api/auth/google/login', methods=['GET'])
 def google_login():
     """
     Iniciar el flujo de autenticación con Google
@@ -96,10 +71,61 @@ def google_login():
         print(f"❌ Error en google_login: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/auth/google/callback', methods=['GET'])
+def upsert_google_user(info):
+    """
+    Crear o actualizar el usuario de una cuenta de Google ya verificada
+    """
+    email = info['email']
+    name = info.get('name') or email.split('@')[0]
+    picture = info.get('picture') or ''
+    google_id = info['sub']
+    
+    user = User.query.filter_by(email=email).first()
+    
+    if not user:
+        user_id = generate_user_id(email)
+        user = User(
+            user_id=user_id,
+            name=name,
+            email=email,
+            password_hash="",  # No se usa contraseña con OAuth
+            google_id=google_id,
+            picture=picture,
+            auth_provider='google'
+        )
+        db.session.add(user)
+        db.session.commit()
+    else:
+        if not user.google_id:
+            user.google_id = google_id
+            user.auth_provider = 'google'
+        if not user.picture:
+            user.picture = picture
+        db.session.commit()
+    
+    return user
+
+def complete_google_login(userinfo):
+    """
+    URL del frontend a la que se redirige al terminar el login con Google
+    
+    La usan el callback síncrono y el asíncrono (asgi.py).
+    """
+    if not userinfo.get("email_verified"):
+        return f"{config.FRONTEND_URL}?error=email_not_verified"
+    
+    user = upsert_google_user(userinfo)
+    jwt_token = create_jwt_token(user.to_dict())
+    
+    return f"{config.FRONTEND_URL}?token={jwt_token}&user={user.user_id}"
+
+@api.route('/api/auth/google/callback', methods=['GET'])
 def google_callback():
     """
     Callback de Google OAuth
+    
+    Bloquea el worker durante las llamadas a Google; con uvicorn (asgi.py)
+    esta ruta la atiende una versión asíncrona.
     """
     try:
         code = request.args.get("code")
@@ -110,69 +136,38 @@ def google_callback():
         google_provider_cfg = get_google_provider_cfg()
         token_endpoint = google_provider_cfg["token_endpoint"]
         
-        token_url, headers, body = oauth_client.prepare_token_request(
+        # El cliente guarda el token recibido: uno por petición, no el global
+        client = WebApplicationClient(config.GOOGLE_CLIENT_ID)
+        token_url, headers, body = client.prepare_token_request(
             token_endpoint,
             authorization_response=request.url,
             redirect_url=config.GOOGLE_REDIRECT_URI,
             code=code
         )
         
-        token_response = requests.post(
+        token_response = http_session.post(
             token_url,
             headers=headers,
             data=body,
             auth=(config.GOOGLE_CLIENT_ID, config.GOOGLE_CLIENT_SECRET),
+            timeout=config.HTTP_TIMEOUT_SECONDS
         )
         
-        oauth_client.parse_request_body_response(json.dumps(token_response.json()))
+        client.parse_request_body_response(json.dumps(token_response.json()))
         
         userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
-        uri, headers, body = oauth_client.add_token(userinfo_endpoint)
-        userinfo_response = requests.get(uri, headers=headers, data=body)
-        
-        userinfo = userinfo_response.json()
-        
-        if not userinfo.get("email_verified"):
-            return redirect(f"{config.FRONTEND_URL}?error=email_not_verified")
-        
-        email = userinfo["email"]
-        name = userinfo.get("name", email.split('@')[0])
-        picture = userinfo.get("picture", "")
-        google_id = userinfo["sub"]
-        
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            user_id = generate_user_id(email)
-            user = User(
-                user_id=user_id,
-                name=name,
-                email=email,
-                password_hash="",  # No se usa contraseña con OAuth
-                google_id=google_id,
-                picture=picture,
-                auth_provider='google'
-            )
-            db.session.add(user)
-            db.session.commit()
-        else:
-            if not user.google_id:
-                user.google_id = google_id
-                user.auth_provider = 'google'
-            if not user.picture:
-                user.picture = picture
-            db.session.commit()
-        
-        jwt_token = create_jwt_token(user.to_dict())
+        uri, headers, body = client.add_token(userinfo_endpoint)
+        userinfo_response = http_session.get(
+            uri, headers=headers, data=body, timeout=config.HTTP_TIMEOUT_SECONDS
+        )
         
-        redirect_url = f"{config.FRONTEND_URL}?token={jwt_token}&user={user.user_id}"
-        return redirect(redirect_url)
+        return redirect(complete_google_login(userinfo_response.json()))
         
     except Exception as e:
         print(f"❌ Error en google_callback: {str(e)}")
         return redirect(f"{config.FRONTEND_URL}?error={str(e)}")
 
-@app.route('/api/auth/google/verify', methods=['POST'])
+@api.route('/api/auth/google/verify', methods=['POST'])
 def verify_google_token_route():
     """
     Verificar un token de Google y crear sesión
@@ -192,33 +187,7 @@ def verify_google_token_route():
         if not google_info['email_verified']:
             return jsonify({'error': 'Email no verificado'}), 401
         
-        email = google_info['email']
-        name = google_info['name'] or email.split('@')[0]
-        picture = google_info.get('picture', '')
-        google_id = google_info['sub']
-        
-        user = User.query.filter_by(email=email).first()
-        
-        if not user:
-            user_id = generate_user_id(email)
-            user = User(
-                user_id=user_id,
-                name=name,
-                email=email,
-                password_hash="",
-                google_id=google_id,
-                picture=picture,
-                auth_provider='google'
-            )
-            db.session.add(user)
-            db.session.commit()
-        else:
-            if not user.google_id:
-                user.google_id = google_id
-                user.auth_provider = 'google'
-            if not user.picture:
-                user.picture = picture
-            db.session.commit()
+        user = upsert_google_user(google_info)
         
         jwt_token = create_jwt_token(user.to_dict())
         
@@ -234,7 +203,7 @@ def verify_google_token_route():
 
 # ==================== RUTAS DE AUTENTICACIÓN TRADICIONAL ====================
 
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     try:
         data = request.get_json()
@@ -252,7 +221,7 @@ def register():
             user_id=data['userId'],
             name=data['name'],
             email=data['email'],
-            password_hash=generate_password_hash(data['password']),
+            password_hash=hash_password(data['password']),
             auth_provider='local'
         )
         
@@ -268,11 +237,14 @@ def register():
             'user': new_user.to_dict()
         }), 201
         
+    except HashingBusyError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
@@ -282,9 +254,14 @@ def login():
         
         user = User.query.filter_by(user_id=data['userId']).first()
         
-        if not user or not check_password_hash(user.password_hash, data['password']):
+        if not user or not verify_password(user.password_hash, data['password']):
             return jsonify({'error': 'Credenciales inválidas'}), 401
         
+        # Actualizar hashes generados con parámetros anteriores
+        if needs_rehash(user.password_hash):
+            user.password_hash = hash_password(data['password'])
+            db.session.commit()
+        
         jwt_token = create_jwt_token(user.to_dict())
         
         return jsonify({
@@ -294,10 +271,13 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except HashingBusyError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 429, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/auth/verify', methods=['GET'])
+@api.route('/api/auth/verify', methods=['GET'])
 @token_required
 def verify_token(current_user):
     """
@@ -310,18 +290,48 @@ def verify_token(current_user):
 
 # ==================== RUTAS DE CUENTAS ====================
 
-@app.route('/api/cuentas', methods=['GET'])
+@api.route('/api/cuentas', methods=['GET'])
 def get_cuentas():
+    """
+    Catálogo de cuentas, desde caché y con ETag
+    
+    Parámetros opcionales: prefix (inicio del nombre), q (texto contenido),
+    clasificacion y limit. Sin filtros se envía el catálogo completo.
+    """
     try:
-        cuentas = CuentaContable.query.all()
-        return jsonify({
-            'success': True,
-            'cuentas': [cuenta.to_dict() for cuenta in cuentas]
-        }), 200
+        snapshot = catalog.get_snapshot()
+        
+        filters = {
+            'prefix': request.args.get('prefix'),
+            'text': request.args.get('q'),
+            'clasificacion': request.args.get('clasificacion'),
+            'limit': request.args.get('limit', type=int)
+        }
+        filtered = any(filters.values())
+        
+        # El ETag depende de la versión del catálogo y de los filtros
+        etag = snapshot.etag
+        if filtered:
+            etag = hashlib.sha256(f"{snapshot.etag}{request.query_string!r}".encode()).hexdigest()[:32]
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        elif filtered:
+            response = jsonify({
+                'success': True,
+                'cuentas': snapshot.search(**filters)
+            })
+        else:
+            response = Response(snapshot.body, mimetype='application/json')
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={config.CATALOG_MAX_AGE}, must-revalidate'
+        return response
+        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/cuentas', methods=['POST'])
+@api.route('/api/cuentas', methods=['POST'])
 def create_cuenta():
     try:
         data = request.get_json()
@@ -337,6 +347,7 @@ def create_cuenta():
         
         db.session.add(nueva_cuenta)
         db.session.commit()
+        catalog.invalidate()
         
         return jsonify({
             'success': True,
@@ -347,33 +358,282 @@ def create_cuenta():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def get_bulk_options():
+    """
+    Formato (csv o ndjson) y tamaño de lote de una importación masiva
+    """
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'csv' if request.mimetype == 'text/csv' else 'ndjson'
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f'Formato no soportado: {fmt}')
+    
+    batch_size = request.args.get('batchSize', config.BULK_IMPORT_BATCH_SIZE, type=int)
+    if not 1 <= batch_size <= config.BULK_IMPORT_BATCH_SIZE_MAX:
+        raise ValueError(f'batchSize debe estar entre 1 y {config.BULK_IMPORT_BATCH_SIZE_MAX}')
+    
+    return fmt, batch_size
+
+@api.route('/api/cuentas/bulk', methods=['POST'])
+@token_required
+def bulk_create_cuentas(current_user):
+    """
+    Importar cuentas al catálogo desde CSV (cuenta, clasificacion,
+    descripcion) o NDJSON
+    """
+    try:
+        try:
+            fmt, batch_size = get_bulk_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        result = bulk_import.import_cuentas(request.stream, fmt, batch_size)
+        catalog.invalidate()
+        return jsonify(result.to_dict()), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 # ==================== RUTAS DE REPORTES ====================
 
-@app.route('/api/reports', methods=['GET'])
+def encode_cursor(report):
+    """
+    Codificar la posición (created_at, id) de un reporte como cursor opaco
+    """
+    raw = json.dumps([report.created_at.isoformat(), report.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Decodificar un cursor generado por encode_cursor
+    """
+    created_at, report_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), int(report_id)
+
+@api.route('/api/reports', methods=['GET'])
 @token_required
 def get_reports(current_user):
+    """
+    Listar reportes del usuario (sin el contenido `data`)
+    
+    Parámetros opcionales: limit, cursor, reportType, programId.
+    El orden es (created_at, id) descendente; si se envía `limit` la
+    respuesta incluye `nextCursor` para pedir la siguiente página.
+    """
     try:
-        user_id = current_user['user_id']
-        
-        user = User.query.filter_by(user_id=user_id).first()
-        if not user:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
-        reports = Report.query.filter_by(user_id=user.id).order_by(Report.created_at.desc()).all()
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        
+        if limit is not None and not 1 <= limit <= config.REPORTS_PAGE_SIZE_MAX:
+            return jsonify({
+                'error': f'limit debe estar entre 1 y {config.REPORTS_PAGE_SIZE_MAX}'
+            }), 400
+        
+        after = None
+        if cursor:
+            try:
+                after = decode_cursor(cursor)
+            except (ValueError, TypeError):
+                return jsonify({'error': 'Cursor inválido'}), 400
+        
+        query = Report.list_query(
+            user_pk,
+            report_type=request.args.get('reportType') or None,
+            program_id=request.args.get('programId', type=int),
+            after=after
+        )
+        
+        if limit is None:
+            reports = query.all()
+            next_cursor = None
+        else:
+            reports = query.limit(limit + 1).all()
+            next_cursor = encode_cursor(reports[limit - 1]) if len(reports) > limit else None
+            reports = reports[:limit]
         
         return jsonify({
             'success': True,
-            'reports': [report.to_dict() for report in reports]
+            'reports': [report.to_summary_dict() for report in reports],
+            'nextCursor': next_cursor
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/reports/<int:report_id>', methods=['GET'])
+@api.route('/api/reports/export', methods=['GET'])
+@token_required
+def export_reports(current_user):
+    """
+    Exportar en streaming las líneas de los reportes del usuario
+    
+    Parámetros: format (csv, ndjson, xlsx), reportType, programId,
+    from y to (fechas ISO del reporte).
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        export_format = request.args.get('format', 'csv')
+        if export_format not in export.FORMATS:
+            return jsonify({'error': f'Formato no soportado: {export_format}'}), 400
+        if export_format == 'xlsx' and not export.xlsx_available():
+            return jsonify({'error': 'Exportación a XLSX no disponible (falta openpyxl)'}), 501
+        
+        try:
+            date_from = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+            date_to = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, usa el formato YYYY-MM-DD'}), 400
+        
+        lines = export.iter_lines(
+            user_pk,
+            report_type=request.args.get('reportType') or None,
+            program_id=request.args.get('programId', type=int),
+            date_from=date_from,
+            date_to=date_to
+        )
+        
+        return Response(
+            stream_with_context(export.GENERATORS[export_format](lines)),
+            mimetype=export.FORMATS[export_format],
+            headers={'Content-Disposition': f'attachment; filename=reportes.{export_format}'}
+        )
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/reports/search', methods=['GET'])
+@token_required
+def search_reports(current_user):
+    """
+    Buscar en nombres de reportes y en cuentas, conceptos, asientos,
+    productos y detalles de sus líneas
+    
+    Parámetros: q (obligatorio; `palabra*` busca por prefijo), reportType,
+    programId, from y to (fechas ISO del reporte), limit, offset y facets
+    (false para omitirlas). Los resultados van ordenados por relevancia
+    (ver search.search).
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        if not search.available():
+            return jsonify({'error': 'Búsqueda no disponible (falta el índice de texto completo)'}), 501
+        
+        limit = request.args.get('limit', config.SEARCH_PAGE_SIZE, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        if not 1 <= limit <= config.SEARCH_PAGE_SIZE_MAX or offset < 0:
+            return jsonify({
+                'error': f'limit debe estar entre 1 y {config.SEARCH_PAGE_SIZE_MAX} y offset no puede ser negativo'
+            }), 400
+        
+        try:
+            date_from = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+            date_to = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, usa el formato YYYY-MM-DD'}), 400
+        
+        try:
+            found = search.search(
+                user_pk,
+                request.args.get('q', ''),
+                report_type=request.args.get('reportType') or None,
+                program_id=request.args.get('programId', type=int),
+                date_from=date_from,
+                date_to=date_to,
+                limit=limit,
+                offset=offset,
+                with_facets=request.args.get('facets', 'true').lower() != 'false'
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({'success': True, **found}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/reports/batch', methods=['GET'])
+@token_required
+def get_reports_batch(current_user):
+    """
+    Varios reportes completos del usuario en una sola petición
+    
+    Parámetros: ids (lista separada por comas) o programId (con
+    reportType opcional). Los reportes se leen con una sola consulta y los
+    documentos salen de caché (ver report_service.get_documents_json).
+    Los ids que no existen o son de otro usuario van en `missing`.
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        raw_ids = ','.join(request.args.getlist('ids'))
+        program_id = request.args.get('programId', type=int)
+        
+        if raw_ids:
+            try:
+                ids = list(dict.fromkeys(int(value) for value in raw_ids.split(',') if value.strip()))
+            except ValueError:
+                return jsonify({'error': 'ids debe ser una lista de números separados por comas'}), 400
+            if not 1 <= len(ids) <= config.REPORTS_BATCH_MAX:
+                return jsonify({'error': f'Se pueden pedir entre 1 y {config.REPORTS_BATCH_MAX} reportes'}), 400
+            
+            found = {report.id: report for report in Report.list_query(user_pk).filter(Report.id.in_(ids))}
+            reports = [found[report_id] for report_id in ids if report_id in found]
+            missing = [report_id for report_id in ids if report_id not in found]
+            truncated = False
+        elif program_id is not None:
+            query = Report.list_query(
+                user_pk,
+                report_type=request.args.get('reportType') or None,
+                program_id=program_id
+            )
+            reports = query.limit(config.REPORTS_BATCH_MAX + 1).all()
+            truncated = len(reports) > config.REPORTS_BATCH_MAX
+            reports = reports[:config.REPORTS_BATCH_MAX]
+            missing = []
+        else:
+            return jsonify({'error': 'Indica ids o programId'}), 400
+        
+        # Los resúmenes van antes: generar documentos puede hacer commit
+        summaries = [(report.id, current_app.json.dumps_bytes(report.to_summary_dict())) for report in reports]
+        documents = report_service.get_documents_json(reports)
+        
+        items = b','.join(
+            b''.join((summary[:-1], b',"data":', documents[report_id], b'}'))
+            for report_id, summary in summaries
+        )
+        tail = current_app.json.dumps_bytes({'missing': missing, 'truncated': truncated})
+        
+        body = b''.join((b'{"success":true,"reports":[', items, b'],', tail[1:]))
+        return Response(body, status=200, mimetype='application/json')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/reports/<int:report_id>', methods=['GET'])
 @token_required
 def get_report_by_id(current_user, report_id):
+    """
+    Reporte completo; el documento se envía desde su copia ya codificada
+    (ver report_service.get_document_json)
+    """
     try:
-        report = Report.query.get(report_id)
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        report = Report.query.filter_by(id=report_id, user_id=user_pk).first()
         
         if not report:
             return jsonify({
@@ -381,10 +641,11 @@ def get_report_by_id(current_user, report_id):
                 'error': 'Reporte no encontrado'
             }), 404
         
-        return jsonify({
-            'success': True,
-            'report': report.to_dict()
-        }), 200
+        data = report_service.get_document_json(report)
+        summary = current_app.json.dumps_bytes(report.to_summary_dict())
+        
+        body = b''.join((b'{"success":true,"report":', summary[:-1], b',"data":', data, b'}}'))
+        return Response(body, status=200, mimetype='application/json')
         
     except Exception as e:
         return jsonify({
@@ -392,32 +653,133 @@ def get_report_by_id(current_user, report_id):
             'error': str(e)
         }), 500
 
-@app.route('/api/reports', methods=['POST'])
+def get_expected_version(payload):
+    """
+    Versión del reporte que tiene el cliente: campo `version` del cuerpo o
+    encabezado If-Match; None si no se envió
+    """
+    version = payload.get('version') if isinstance(payload, dict) else None
+    
+    if version is None:
+        tags = request.if_match.as_set()
+        if len(tags) == 1:
+            version = next(iter(tags))
+    
+    try:
+        return int(version)
+    except (TypeError, ValueError):
+        return None
+
+@api.route('/api/reports/<int:report_id>', methods=['PATCH'])
 @token_required
-def create_report(current_user):
+def patch_report(current_user, report_id):
+    """
+    Editar filas de un reporte sin reenviar el documento completo
+    
+    Ver report_service.validate_patch_payload para el formato. Responde
+    409 si el reporte cambió desde la versión enviada.
+    """
     try:
-        data = request.get_json()
+        payload = request.get_json(silent=True)
         
-        if not all(k in data for k in ['name', 'reportType', 'date', 'data']):
-            return jsonify({'error': 'Faltan campos requeridos'}), 400
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
         
-        user_id = current_user['user_id']
-        user = User.query.filter_by(user_id=user_id).first()
+        expected_version = get_expected_version(payload)
+        if expected_version is None:
+            return jsonify({'error': 'Falta la versión del reporte (campo version o encabezado If-Match)'}), 428
         
-        if not user:
+        report = Report.query.filter_by(id=report_id, user_id=user_pk).first()
+        if not report:
+            return jsonify({'error': 'Reporte no encontrado'}), 404
+        
+        report_service.patch_report(report, expected_version, payload)
+        db.session.commit()
+        
+        response = jsonify({
+            'success': True,
+            'report': report.to_summary_dict()
+        })
+        response.set_etag(str(report.version))
+        return response, 200
+        
+    except ReportValidationError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except ReportConflictError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'version': e.current_version}), 409
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error al editar reporte: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/reports/<int:report_id>/restore', methods=['POST'])
+@token_required
+def restore_report(current_user, report_id):
+    """
+    Devolver un reporte archivado a las tablas calientes (ver archive.py)
+    
+    Leerlo no hace falta restaurarlo; sirve antes de trabajar mucho con
+    sus líneas. Si el reporte no está archivado no hace nada.
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
             return jsonify({'error': 'Usuario no encontrado'}), 404
         
-        new_report = Report(
-            user_id=user.id,
-            name=data['name'],
-            report_type=data['reportType'],
-            program_id=data.get('programId'),
-            date=datetime.fromisoformat(data['date']),
-            data=json.dumps(data['data']),
-            totals=json.dumps(data.get('totals', {}))
-        )
+        report = Report.query.filter_by(id=report_id, user_id=user_pk).first()
+        if not report:
+            return jsonify({'error': 'Reporte no encontrado'}), 404
         
-        db.session.add(new_report)
+        if report.archived_at is not None:
+            archive.restore(report)
+            db.session.commit()
+        
+        return jsonify({'success': True, 'report': report.to_summary_dict()}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error al restaurar reporte: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def wants_async():
+    """
+    El cliente pidió procesar la petición en segundo plano (Prefer: respond-async)
+    """
+    return 'respond-async' in request.headers.get('Prefer', '').lower()
+
+def job_accepted(job):
+    """
+    Confirmar un trabajo encolado: 202 con su estado y la URL para consultarlo
+    """
+    db.session.commit()
+    jobs.wake()
+    
+    response = jsonify({'success': True, 'job': job.to_dict()})
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.get_job', job_id=job.id)
+    response.headers['Preference-Applied'] = 'respond-async'
+    return response
+
+@api.route('/api/reports', methods=['POST'])
+@token_required
+def create_report(current_user):
+    try:
+        data = request.get_json()
+        
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        if wants_async():
+            # Se guarda el cuerpo tal como llegó; el worker lo procesa
+            report_service.validate_report_payload(data)
+            job = jobs.enqueue(user_pk, 'report.create', payload=request.get_data())
+            return job_accepted(job)
+        
+        new_report = report_service.create_report(user_pk, data)
         db.session.commit()
         
         return jsonify({
@@ -426,18 +788,468 @@ def create_report(current_user):
             'report': new_report.to_dict()
         }), 201
         
+    except ReportValidationError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except JobLimitError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 429
     except Exception as e:
         db.session.rollback()
         print(f"❌ Error al guardar reporte: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/reports/bulk', methods=['POST'])
+@token_required
+def bulk_create_reports(current_user):
+    """
+    Importar reportes desde NDJSON (un reporte por línea) o CSV (líneas de
+    registros agrupadas por name y date)
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        try:
+            fmt, batch_size = get_bulk_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if wants_async():
+            job = jobs.enqueue(user_pk, 'reports.import',
+                               {'format': fmt, 'batchSize': batch_size}, request.get_data())
+            return job_accepted(job)
+        
+        result = bulk_import.import_reports(user_pk, request.stream, fmt, batch_size)
+        return jsonify(result.to_dict()), 200
+        
+    except JobLimitError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error en importación de reportes: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# ==================== RUTAS DE MAYORES ====================
+
+@api.route('/api/ledger', methods=['GET'])
+@token_required
+def get_ledger(current_user):
+    """
+    Esquemas de T de un reporte de Registros Contables
+    
+    Parámetros: registrosId (requerido), balanceId y cuenta (opcionales).
+    """
+    try:
+        registros_id = request.args.get('registrosId', type=int)
+        balance_id = request.args.get('balanceId', type=int)
+        
+        if not registros_id:
+            return jsonify({'error': 'registrosId es requerido'}), 400
+        
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        requested_ids = {registros_id} | ({balance_id} if balance_id else set())
+        owned = Report.query.filter(
+            Report.id.in_(requested_ids), Report.user_id == user_pk
+        ).all()
+        if len(owned) != len(requested_ids):
+            return jsonify({'error': 'Reporte no encontrado'}), 404
+        
+        # Los mayores se calculan sobre las líneas: un reporte archivado
+        # vuelve a las tablas calientes
+        archived = [report for report in owned if report.archived_at is not None]
+        for report in archived:
+            archive.restore(report)
+        if archived:
+            db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'cuentas': ledger.build_ledger(
+                registros_id,
+                balance_report_id=balance_id,
+                cuenta=request.args.get('cuenta')
+            )
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/ledger/saldos', methods=['GET'])
+@token_required
+def get_ledger_saldos(current_user):
+    """
+    Acumulados por cuenta de todos los registros del usuario (caché)
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        saldos = LedgerBalance.query.filter_by(user_id=user_pk).order_by(LedgerBalance.cuenta_key).all()
+        
+        return jsonify({
+            'success': True,
+            'saldos': [saldo.to_dict() for saldo in saldos]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/inventory/valuation', methods=['GET', 'POST'])
+@token_required
+def inventory_valuation(current_user):
+    """
+    Valuación de inventario por PEPS, UEPS o costo promedio
+    
+    GET toma los movimientos de las filas de inventario de los reportes del
+    usuario; POST los recibe en {"movements": [...]}. Parámetros: method,
+    at (fecha de corte), snapshots (fechas separadas por comas), producto
+    y capas=1 para incluir las capas de costo.
+    """
+    try:
+        method = request.args.get('method', 'promedio').lower()
+        producto = request.args.get('producto') or None
+        capas = request.args.get('capas') in ('1', 'true')
+        
+        raw_dates = [d for d in request.args.get('snapshots', '').split(',') if d.strip()]
+        if request.args.get('at'):
+            raw_dates.append(request.args['at'])
+        try:
+            snapshot_dates = sorted({date.fromisoformat(d.strip()) for d in raw_dates})
+        except ValueError:
+            return jsonify({'error': 'Fecha inválida, usa el formato YYYY-MM-DD'}), 400
+        
+        if request.method == 'POST':
+            payload = request.get_json(silent=True)
+            if not isinstance(payload, dict) or not isinstance(payload.get('movements'), list):
+                return jsonify({'error': 'Envía los movimientos en `movements`'}), 400
+            movements = costing.Movements.from_records(payload['movements'])
+        else:
+            user_pk = get_user_pk(current_user)
+            if not user_pk:
+                return jsonify({'error': 'Usuario no encontrado'}), 404
+            movements = costing.movements_from_reports(user_pk, producto)
+        
+        return jsonify({
+            'success': True,
+            'method': method,
+            'movimientos': len(movements),
+            'snapshots': costing.valuate(movements, method, snapshot_dates, producto, capas)
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== RUTAS DE ESTADOS FINANCIEROS ====================
+
+def get_statement_range():
+    """
+    Leer `from`, `to` (fechas ISO; por defecto el año de `to`) y programId
+    """
+    try:
+        hasta = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        desde = date.fromisoformat(request.args['from']) if request.args.get('from') else date(hasta.year, 1, 1)
+    except ValueError:
+        raise ValueError('Fecha inválida, usa el formato YYYY-MM-DD')
+    
+    if desde > hasta:
+        raise ValueError('`from` debe ser anterior a `to`')
+    return desde, hasta, request.args.get('programId', type=int)
+
+@api.route('/api/statements/balance-general', methods=['GET'])
+@token_required
+def get_balance_general(current_user):
+    """
+    Balance general consolidado al cierre del mes de `to` (por defecto hoy)
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        try:
+            _, hasta, program_id = get_statement_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'balance': consolidation.balance_general(user_pk, hasta, program_id)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/statements/estado-resultados', methods=['GET'])
+@token_required
+def get_estado_resultados(current_user):
+    """
+    Estado de resultados consolidado de los meses entre `from` y `to`
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        try:
+            desde, hasta, program_id = get_statement_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'estado': consolidation.estado_resultados(user_pk, desde, hasta, program_id)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/statements/periods', methods=['GET'])
+@token_required
+def get_statement_periods(current_user):
+    """
+    Totales por mes y origen (registros, saldos, inventario, proceso)
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        try:
+            desde, hasta, program_id = get_statement_range()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            'periodos': consolidation.monthly_totals(user_pk, desde, hasta, program_id)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ==================== RUTAS DE TRABAJOS ====================
+
+@api.route('/api/jobs', methods=['POST'])
+@token_required
+def create_job(current_user):
+    """
+    Encolar un trabajo: {"kind": ..., "params": {...}}
+    
+    Tipos: ledger.rebuild, consolidation.rebuild, inventory.valuation,
+    reports.archive.
+    
+    La creación e importación de reportes se encolan desde sus propias
+    rutas con el encabezado Prefer: respond-async.
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('params', {}), dict):
+            return jsonify({'error': 'Envía {"kind": ..., "params": {...}}'}), 400
+        
+        job = jobs.enqueue(user_pk, data.get('kind'), data.get('params'))
+        return job_accepted(job)
+        
+    except JobValidationError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except JobLimitError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 429
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error al encolar trabajo: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/jobs', methods=['GET'])
+@token_required
+def get_jobs(current_user):
+    """
+    Trabajos recientes del usuario (sin resultado); filtros: status, limit
+    """
+    try:
+        user_pk = get_user_pk(current_user)
+        if not user_pk:
+            return jsonify({'error': 'Usuario no encontrado'}), 404
+        
+        limit = request.args.get('limit', 50, type=int)
+        if not 1 <= limit <= config.REPORTS_PAGE_SIZE_MAX:
+            return jsonify({
+                'error': f'limit debe estar entre 1 y {config.REPORTS_PAGE_SIZE_MAX}'
+            }), 400
+        
+        query = Job.query.options(db.defer(Job.result)).filter_by(user_id=user_pk)
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args['status'])
+        
+        return jsonify({
+            'success': True,
+            'jobs': [job.to_dict(include_result=False)
+                     for job in query.order_by(Job.id.desc()).limit(limit)]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/jobs/<int:job_id>', methods=['GET'])
+@token_required
+def get_job(current_user, job_id):
+    """
+    Estado, avance y (al terminar) resultado o error de un trabajo
+    """
+    try:
+        job = Job.query.filter_by(id=job_id, user_id=get_user_pk(current_user)).first()
+        if not job:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        
+        response = jsonify({'success': True, 'job': job.to_dict()})
+        if job.status in jobs.PENDING_STATUSES:
+            response.headers['Retry-After'] = str(max(int(config.JOBS_POLL_SECONDS), 1))
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/jobs/<int:job_id>', methods=['DELETE'])
+@token_required
+def cancel_job(current_user, job_id):
+    """
+    Cancelar un trabajo que todavía está en cola
+    """
+    try:
+        job = Job.query.filter_by(id=job_id, user_id=get_user_pk(current_user)).first()
+        if not job:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        
+        if not jobs.cancel(job_id):
+            db.session.rollback()
+            return jsonify({'error': 'El trabajo ya empezó o terminó', 'status': job.status}), 409
+        
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'Trabajo cancelado'}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error al cancelar trabajo: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Métricas en formato Prometheus (protegidas con METRICS_TOKEN si se define)
+    """
+    if config.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {config.METRICS_TOKEN}':
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/metrics/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Perfil de una petición hecha con el encabezado X-Profile (se pide con
+    el mismo encabezado)
+    """
+    if not metrics.profiling_enabled():
+        return jsonify({'error': 'El perfilado no está habilitado'}), 404
+    if not metrics.profiling_authorized():
+        return jsonify({'error': 'No autorizado'}), 401
+    
+    profile = metrics.get_profile(profile_id)
+    if profile is None:
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    
+    if request.args.get('format') == 'json':
+        return jsonify(profile), 200
+    return Response(profile['stacks'], mimetype='text/plain')
+
+@api.route('/api/health', methods=['GET'])
 def health_check():
+    """
+    Estado del servicio, con una consulta real a la base de datos
+    """
+    started = time.perf_counter()
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        database = 'connected'
+        status = 200
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Health check: la base de datos no responde: {str(e)}")
+        database = 'unavailable'
+        status = 503
+    
     return jsonify({
-        'status': 'healthy',
-        'database': 'connected',
+        'status': 'healthy' if status == 200 else 'unhealthy',
+        'database': database,
+        'databaseLatencyMs': round((time.perf_counter() - started) * 1000, 2),
         'timestamp': datetime.utcnow().isoformat()
-    }), 200
+    }), status
+
+def create_app():
+    """
+    Crear la aplicación Flask
+    
+    No toca la base de datos: el esquema y el catálogo inicial se crean con
+    `flask --app app init-db` (o al correr `python app.py` en desarrollo).
+    """
+    app = Flask(__name__)
+    
+    # Configuración CORS
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": config.ALLOWED_ORIGINS,
+            "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "If-Match", "Prefer"],
+            "supports_credentials": True
+        }
+    })
+    
+    # Configuración de la app
+    app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = config.SECRET_KEY
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = config.SQLALCHEMY_ENGINE_OPTIONS
+    
+    db.init_app(app)
+    
+    with app.app_context():
+        # Crear el engine no abre conexiones; los PRAGMAs se aplican al conectar
+        if config.IS_SQLITE:
+            event.listen(db.engine, 'connect', apply_sqlite_pragmas)
+        
+        # Se registra primero para que la latencia incluya la compresión
+        metrics.init_app(app, db.engine, http_session)
+    
+    # JSON compacto (orjson si está instalado) y compresión de respuestas grandes
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)
+    
+    app.register_blueprint(api)
+    register_commands(app)
+    jobs.init_app(app)
+    
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
+    
+    # En desarrollo los trabajos corren en el proceso hijo del reloader
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' and not config.JOBS_IN_PROCESS_WORKERS:
+        jobs.Worker(app, config.JOBS_WORKERS).start()
+    
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+Archivo de reportes antiguos en segmentos empaquetados
+
+Los reportes con fecha anterior a ARCHIVE_AFTER_DAYS salen de las tablas
+calientes: su documento completo se agrega, comprimido, al final de un
+segmento (ARCHIVE_DIR/segment-000001.pack, ...) y se borran sus líneas y
+su copia en payload_store. En `reports` queda el registro con nombre,
+tipo, fecha y totales, así que los listados no cambian; archived_reports
+es el índice de dónde quedó cada documento (segmento, offset, largo).
+
+Cada registro de un segmento es un encabezado RECORD (firma, id del
+reporte, versión, códec, largo) seguido del documento comprimido. Los
+segmentos solo crecen: un registro escrito justo antes de que falle el
+commit queda sin índice y no estorba.
+
+Las lecturas usan mmap, así que el sistema operativo carga solo las
+páginas del registro pedido y las comparte entre procesos.
+
+- run(): archivar (trabajo `reports.archive` o `flask archive-reports`)
+- load_document_json() / load_documents_json(): documento codificado
+- restore(): devolver un reporte a las tablas calientes
+- iter_documents(): documentos archivados para reconstrucciones,
+  exportación y costeo
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+
+import payload_store
+import search
+from config import config
+from models import db, ArchivedReport, Report, ReportLine
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: solo el candado entre hilos
+    fcntl = None
+
+MAGIC = b'RPTA'
+# Firma, id del reporte, versión, códec, largo del documento comprimido
+RECORD = struct.Struct('>4sQIBI')
+CODEC_IDS = {'identity': 0, 'zlib': 1, 'zstd': 2}
+
+# Segmento -> mmap de solo lectura, compartido por los hilos del proceso
+_maps = {}
+_maps_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+
+class ArchiveError(Exception):
+    """
+    El documento archivado no se puede leer (segmento ausente o dañado)
+    """
+
+
+def _segment_path(number):
+    return os.path.join(config.ARCHIVE_DIR, f'segment-{number:06d}.pack')
+
+
+def _last_segment():
+    numbers = [
+        int(name[8:14]) for name in os.listdir(config.ARCHIVE_DIR)
+        if name.startswith('segment-') and name.endswith('.pack')
+    ]
+    return max(numbers, default=1)
+
+
+# ==================== ESCRITURA ====================
+
+class _Appender:
+    """
+    Agrega registros al último segmento y abre uno nuevo cuando se
+    llenaría más allá de ARCHIVE_SEGMENT_MAX_BYTES
+    """
+    
+    def __init__(self):
+        self.number = _last_segment()
+        self.file = open(_segment_path(self.number), 'ab')
+    
+    def append(self, report_id, version, codec, data):
+        record_size = RECORD.size + len(data)
+        offset = self.file.seek(0, os.SEEK_END)
+        
+        if offset and offset + record_size > config.ARCHIVE_SEGMENT_MAX_BYTES:
+            self.sync()
+            self.file.close()
+            self.number += 1
+            self.file = open(_segment_path(self.number), 'ab')
+            offset = 0
+        
+        self.file.write(RECORD.pack(MAGIC, report_id, version, CODEC_IDS[codec], len(data)))
+        self.file.write(data)
+        return self.number, offset
+    
+    def sync(self):
+        # Los registros deben estar en disco antes de que el índice apunte a ellos
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def close(self):
+        self.file.close()
+
+
+@contextmanager
+def _appender():
+    """
+    Abrir el último segmento para agregar, con candado entre hilos y entre
+    procesos (archive.lock)
+    """
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    
+    with _write_lock, open(os.path.join(config.ARCHIVE_DIR, 'archive.lock'), 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        appender = _Appender()
+        try:
+            yield appender
+            appender.sync()
+        finally:
+            appender.close()
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def archive_reports(reports):
+    """
+    Mover unos reportes a los segmentos (no hace commit)
+    
+    El documento se toma de payload_store si hay copia de la versión
+    actual; si no, se arma desde sus líneas.
+    """
+    if not reports:
+        return
+    
+    stored = payload_store.load_reports(reports)
+    documents = []
+    for report in reports:
+        body = stored.get(report.id)
+        if body is None:
+            body = current_app.json.dumps_bytes(report.get_document())
+        documents.append((report.id, report.version, body, *payload_store.compress(body)))
+    
+    with _appender() as appender:
+        positions = [appender.append(report_id, version, codec, data)
+                     for report_id, version, _, codec, data in documents]
+    
+    now = datetime.utcnow()
+    for (report_id, version, body, codec, data), (segment, offset) in zip(documents, positions):
+        db.session.add(ArchivedReport(
+            report_id=report_id, version=version, segment=segment, offset=offset,
+            length=len(data), codec=codec, digest=payload_store.digest_of(body), archived_at=now
+        ))
+    
+    report_ids = [report_id for report_id, *_ in documents]
+    db.session.execute(
+        db.delete(ReportLine).where(ReportLine.report_id.in_(report_ids))
+        .execution_options(synchronize_session=False)
+    )
+    payload_store.forget_reports(report_ids)
+    
+    # Archivar no es una edición: updated_at y version no cambian
+    db.session.execute(
+        db.update(Report).where(Report.id.in_(report_ids))
+        .values(data='', archived_at=now, updated_at=Report.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    for report in reports:
+        db.session.expire(report)
+
+
+def run(user_pk=None, older_than_days=None, batch_size=None, on_batch=None):
+    """
+    Archivar los reportes con fecha anterior al corte, por lotes con un
+    commit cada uno; regresa cuántos se archivaron
+    
+    `on_batch(archivados, total)` se llama después de cada commit; total
+    es el número de candidatos al empezar.
+    """
+    days = config.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = date.today() - timedelta(days=days)
+    
+    candidates = db.select(Report).where(Report.archived_at.is_(None), Report.date < cutoff)
+    if user_pk is not None:
+        candidates = candidates.where(Report.user_id == user_pk)
+    
+    query = candidates.order_by(Report.id).limit(batch_size or config.ARCHIVE_BATCH_SIZE)
+    total = db.session.scalar(db.select(db.func.count()).select_from(candidates.subquery())) if on_batch else 0
+    
+    archived = 0
+    while True:
+        reports = db.session.scalars(query).all()
+        if not reports:
+            break
+        
+        archive_reports(reports)
+        db.session.commit()
+        archived += len(reports)
+        
+        if on_batch:
+            on_batch(archived, max(total, archived))
+    
+    return archived
+
+
+# ==================== LECTURA ====================
+
+def _mapped(segment, end):
+    """
+    mmap del segmento que cubre hasta `end`; si el segmento creció desde
+    que se mapeó, se vuelve a mapear
+    """
+    with _maps_lock:
+        mapped = _maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            with open(_segment_path(segment), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # El mapa anterior se libera cuando nadie lo usa
+            _maps[segment] = mapped
+        return mapped
+
+
+def read_entry(entry):
+    """
+    Documento codificado (bytes) de un registro de archived_reports
+    """
+    start = entry.offset + RECORD.size
+    
+    try:
+        mapped = _mapped(entry.segment, start + entry.length)
+        magic, report_id, _, _, length = RECORD.unpack_from(mapped, entry.offset)
+        data = mapped[start:start + length]
+    except (OSError, ValueError, struct.error) as e:
+        raise ArchiveError(f'No se pudo leer el reporte archivado {entry.report_id}: {str(e)}')
+    
+    if magic != MAGIC or report_id != entry.report_id or length != entry.length:
+        raise ArchiveError(f'Registro dañado para el reporte archivado {entry.report_id}')
+    
+    body = payload_store.decompress(entry.codec, data)
+    if payload_store.digest_of(body) != entry.digest:
+        raise ArchiveError(f'El contenido del reporte archivado {entry.report_id} no coincide')
+    
+    return body
+
+
+def load_document_json(report):
+    """
+    Documento codificado de un reporte archivado
+    """
+    entry = db.session.get(ArchivedReport, report.id)
+    if entry is None:
+        raise ArchiveError(f'El reporte {report.id} no está en el archivo')
+    return read_entry(entry)
+
+
+def load_documents_json(reports):
+    """
+    Como load_document_json para varios reportes, con una sola consulta
+    al índice; regresa {id: bytes}
+    """
+    report_ids = [report.id for report in reports]
+    if not report_ids:
+        return {}
+    
+    entries = db.session.scalars(
+        db.select(ArchivedReport).where(ArchivedReport.report_id.in_(report_ids))
+    )
+    return {entry.report_id: read_entry(entry) for entry in entries}
+
+
+def iter_documents(user_pk=None, report_type=None, program_id=None, date_from=None, date_to=None):
+    """
+    Recorrer (reporte, documento) de los reportes archivados en orden de
+    (fecha, id)
+    """
+    query = (
+        db.select(Report, ArchivedReport)
+        .join(ArchivedReport, ArchivedReport.report_id == Report.id)
+        .order_by(Report.date, Report.id)
+    )
+    if user_pk is not None:
+        query = query.where(Report.user_id == user_pk)
+    if report_type:
+        query = query.where(Report.report_type == report_type)
+    if program_id is not None:
+        query = query.where(Report.program_id == program_id)
+    if date_from:
+        query = query.where(Report.date >= date_from)
+    if date_to:
+        query = query.where(Report.date <= date_to)
+    
+    for report, entry in db.session.execute(query).all():
+        yield report, json.loads(read_entry(entry))
+
+
+# ==================== RESTAURACIÓN ====================
+
+def restore(report):
+    """
+    Devolver un reporte archivado a las tablas calientes (no hace commit)
+    
+    Sus líneas vuelven a report_lines y al índice de búsqueda; la versión
+    no cambia, así que los saldos acumulados siguen siendo válidos. El
+    registro queda en su segmento, ya sin índice.
+    """
+    entry = db.session.get(ArchivedReport, report.id)
+    if entry is None:
+        raise ArchiveError(f'El reporte {report.id} no está en el archivo')
+    
+    report.save_document(json.loads(read_entry(entry)))
+    search.index_lines(report.id)
+    report.archived_at = None
+    db.session.delete(entry)
@@ -0,0 +1,217 @@
+"""
+Punto de entrada ASGI con el callback de Google OAuth asíncrono
+
+En WSGI, google_callback ocupa un worker mientras espera a Google
+(discovery, intercambio del código y userinfo), así que un proveedor lento
+deja sin workers al resto de la API. Aquí esa ruta corre en el event loop
+con un cliente httpx compartido (pool de conexiones y timeouts) y solo el
+alta del usuario pasa a un hilo. Las demás rutas se delegan a la app Flask
+en un pool de ASGI_WSGI_WORKERS hilos.
+
+    uvicorn asgi:application --port 5000
+"""
+import asyncio
+import time
+from urllib.parse import parse_qs
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from oauthlib.oauth2 import WebApplicationClient
+from werkzeug.urls import iri_to_uri
+
+import metrics
+from app import app as flask_app, complete_google_login
+from auth_utils import _discovery_document, _google_certs, verify_google_token
+from config import config
+
+CALLBACK_PATH = '/api/auth/google/callback'
+
+
+def _request_url(scope):
+    """
+    URL completa de la petición, como la espera oauthlib
+    """
+    host = dict(scope['headers']).get(b'host', b'').decode('latin-1')
+    if not host:
+        host = '%s:%s' % scope['server']
+    
+    query = scope['query_string'].decode('latin-1')
+    url = f"{scope['scheme']}://{host}{scope['path']}"
+    return f'{url}?{query}' if query else url
+
+
+class GoogleCallbackApp:
+    """
+    App ASGI que atiende el callback de Google y delega lo demás a Flask
+    """
+    
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.fallback = WSGIMiddleware(wsgi_app, workers=config.ASGI_WSGI_WORKERS)
+        self.client = None
+        self._refreshing = {}
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['path'] == CALLBACK_PATH and scope['method'] == 'GET':
+            await self._callback(scope, send)
+        else:
+            await self.fallback(scope, receive, send)
+    
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            
+            if message['type'] == 'lifespan.startup':
+                self._http()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.client is not None:
+                    await self.client.aclose()
+                    self.client = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    # ==================== HTTP SALIENTE ====================
+    
+    def _http(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                timeout=config.HTTP_TIMEOUT_SECONDS,
+                limits=httpx.Limits(
+                    max_connections=config.ASYNC_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.HTTP_POOL_SIZE
+                )
+            )
+        return self.client
+    
+    async def _request(self, method, url, **kwargs):
+        started = time.perf_counter()
+        response = await self._http().request(method, url, **kwargs)
+        metrics.OUTBOUND_LATENCY.observe(
+            (method, response.url.host, str(response.status_code)),
+            time.perf_counter() - started
+        )
+        return response
+    
+    async def _document(self, cached):
+        """
+        Documento de la caché de auth_utils (discovery o certificados)
+        
+        Se descarga sin bloquear el loop; las peticiones concurrentes
+        comparten una sola descarga y, vencido pero dentro de la ventana
+        de stale, se sirve la copia mientras se refresca.
+        """
+        if cached.is_fresh():
+            return cached.document
+        
+        task = self._refreshing.get(cached.url)
+        if task is None:
+            task = self._refreshing[cached.url] = asyncio.ensure_future(self._refresh(cached))
+        
+        if cached.is_usable():
+            return cached.document
+        
+        await asyncio.shield(task)
+        return cached.document
+    
+    async def _refresh(self, cached):
+        try:
+            response = await self._request('GET', cached.url)
+            response.raise_for_status()
+            cached.store(response.headers.get('Cache-Control', ''), response.content)
+        except (httpx.HTTPError, ValueError):
+            if cached.document is None:
+                raise
+            print(f"⚠️ No se pudo refrescar {cached.url}, usando copia en caché")
+        finally:
+            self._refreshing.pop(cached.url, None)
+    
+    # ==================== CALLBACK ====================
+    
+    async def _callback(self, scope, send):
+        started = time.perf_counter()
+        
+        try:
+            location = await self._google_login(scope)
+        except Exception as e:
+            print(f"❌ Error en google_callback: {str(e)}")
+            location = f"{config.FRONTEND_URL}?error={str(e)}"
+        
+        await send({
+            'type': 'http.response.start',
+            'status': 302,
+            'headers': [
+                (b'location', iri_to_uri(location).encode('latin-1')),
+                (b'content-length', b'0')
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+        
+        metrics.REQUEST_LATENCY.observe(('GET', CALLBACK_PATH, '302'), time.perf_counter() - started)
+    
+    async def _google_login(self, scope):
+        code = parse_qs(scope['query_string'].decode('latin-1')).get('code', [None])[0]
+        
+        if not code:
+            return f"{config.FRONTEND_URL}?error=no_code"
+        
+        # Los certificados solo hacen falta si Google manda id_token; se
+        # piden en paralelo con el discovery y el intercambio del código
+        certs = asyncio.ensure_future(self._document(_google_certs))
+        certs.add_done_callback(lambda task: task.cancelled() or task.exception())
+        
+        try:
+            provider_cfg = await self._document(_discovery_document)
+            
+            # El cliente guarda el token recibido: uno por petición
+            client = WebApplicationClient(config.GOOGLE_CLIENT_ID)
+            token_url, headers, body = client.prepare_token_request(
+                provider_cfg["token_endpoint"],
+                authorization_response=_request_url(scope),
+                redirect_url=config.GOOGLE_REDIRECT_URI,
+                code=code
+            )
+            
+            token_response = await self._request(
+                'POST', token_url, headers=headers, content=body,
+                auth=(config.GOOGLE_CLIENT_ID, config.GOOGLE_CLIENT_SECRET)
+            )
+            client.parse_request_body_response(token_response.text)
+            
+            userinfo = await self._userinfo(client, provider_cfg, certs)
+        finally:
+            certs.cancel()
+        
+        # La base de datos es síncrona: el alta del usuario corre en un hilo
+        return await asyncio.to_thread(self._complete_login, userinfo)
+    
+    async def _userinfo(self, client, provider_cfg, certs):
+        """
+        Datos del usuario: del id_token verificado localmente (sin otra
+        llamada a Google) o, si no viene o no se puede verificar, del
+        endpoint userinfo
+        """
+        token = (client.token or {}).get('id_token')
+        
+        if token:
+            try:
+                await certs
+            except (httpx.HTTPError, ValueError):
+                pass
+            else:
+                claims = verify_google_token(token)
+                if claims:
+                    return claims
+        
+        uri, headers, body = client.add_token(provider_cfg["userinfo_endpoint"])
+        response = await self._request('GET', uri, headers=headers, content=body)
+        return response.json()
+    
+    def _complete_login(self, userinfo):
+        with self.wsgi_app.app_context():
+            return complete_google_login(userinfo)
+
+
+application = GoogleCallbackApp(flask_app)
@@ -1,11 +1,148 @@
+import hashlib
+import json
 import jwt
+import re
 import requests
+import threading
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
+from cache import LRUCache
 from config import config
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
+from requests.adapters import HTTPAdapter
+
+# Sesión HTTP compartida: reutiliza conexiones keep-alive hacia Google
+http_session = requests.Session()
+http_session.mount('https://', HTTPAdapter(
+    pool_connections=config.HTTP_POOL_SIZE,
+    pool_maxsize=config.HTTP_POOL_SIZE
+))
+http_session.mount('http://', HTTPAdapter(
+    pool_connections=config.HTTP_POOL_SIZE,
+    pool_maxsize=config.HTTP_POOL_SIZE
+))
+
+class CachedDocument:
+    """
+    Documento JSON remoto en caché a nivel de proceso
+    
+    - Respeta el max-age de Cache-Control (o el valor por defecto).
+    - Vencido, se sigue sirviendo hasta `stale_seconds` mientras un hilo
+      en segundo plano lo refresca (stale-while-revalidate).
+    - Si la descarga falla se usa la última copia disponible.
+    """
+    
+    _MAX_AGE = re.compile(r'max-age=(\d+)')
+    
+    def __init__(self, url, default_max_age=None, stale_seconds=None):
+        self.url = url
+        self.default_max_age = default_max_age or config.OIDC_CACHE_DEFAULT_MAX_AGE
+        self.stale_seconds = config.OIDC_CACHE_STALE_SECONDS if stale_seconds is None else stale_seconds
+        self.document = None
+        self.raw = None
+        self.expires_at = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+    
+    def is_fresh(self, now=None):
+        return self.document is not None and (now or time.time()) < self.expires_at
+    
+    def is_usable(self, now=None):
+        """
+        Vigente o vencido pero todavía dentro de la ventana de `stale_seconds`
+        """
+        return self.document is not None and (now or time.time()) < self.expires_at + self.stale_seconds
+    
+    def get(self):
+        now = time.time()
+        
+        if self.is_fresh(now):
+            return self.document
+        
+        if self.is_usable(now):
+            self._refresh_in_background()
+            return self.document
+        
+        with self._lock:
+            # Otro hilo pudo haberlo descargado mientras esperábamos
+            if self.is_fresh():
+                return self.document
+            try:
+                self.refresh()
+            except (requests.RequestException, ValueError):
+                if self.document is None:
+                    raise
+                print(f"⚠️ No se pudo refrescar {self.url}, usando copia en caché")
+        
+        return self.document
+    
+    def refresh(self):
+        response = http_session.get(self.url, timeout=config.HTTP_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        self.store(response.headers.get('Cache-Control', ''), response.content)
+    
+    def store(self, cache_control, content):
+        """
+        Guardar una copia recién descargada (la usa también el cliente
+        asíncrono de asgi.py)
+        """
+        match = self._MAX_AGE.search(cache_control)
+        max_age = int(match.group(1)) if match else self.default_max_age
+        
+        self.document = json.loads(content)
+        self.raw = content
+        self.expires_at = time.time() + max_age
+    
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        
+        def run():
+            try:
+                self.refresh()
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠️ Error refrescando {self.url}: {e}")
+            finally:
+                self._refreshing = False
+        
+        threading.Thread(target=run, daemon=True).start()
+
+_discovery_document = CachedDocument(config.GOOGLE_DISCOVERY_URL)
+_google_certs = CachedDocument(config.GOOGLE_CERTS_URL)
+
+class _CachedResponse:
+    """
+    Respuesta compatible con google.auth.transport.Response
+    """
+    status = 200
+    headers = {}
+    
+    def __init__(self, data):
+        self.data = data
+
+class CachingGoogleRequest(google_requests.Request):
+    """
+    Transporte de google-auth que usa la sesión compartida y sirve los
+    certificados de Google desde la caché
+    """
+    
+    def __init__(self):
+        super().__init__(session=http_session)
+    
+    def __call__(self, url, method='GET', body=None, headers=None, timeout=None, **kwargs):
+        if method == 'GET' and url == _google_certs.url:
+            _google_certs.get()
+            return _CachedResponse(_google_certs.raw)
+        
+        return super().__call__(url, method=method, body=body, headers=headers,
+                                timeout=timeout or config.HTTP_TIMEOUT_SECONDS, **kwargs)
+
+_google_request = CachingGoogleRequest()
 
 def create_jwt_token(user_data):
     """
@@ -13,6 +150,7 @@ def create_jwt_token(user_data):
     """
     payload = {
         'user_id': user_data['userId'],
+        'uid': user_data['id'],  # PK interna, evita buscar al usuario en cada petición
         'email': user_data['email'],
         'name': user_data['name'],
         'exp': datetime.utcnow() + timedelta(hours=config.JWT_EXPIRATION_HOURS),
@@ -27,31 +165,77 @@ def create_jwt_token(user_data):
     
     return token
 
+# Payloads ya verificados, por huella del token; expiran con su `exp`
+_verified_tokens = LRUCache(maxsize=config.JWT_CACHE_SIZE)
+
+# user_id externo -> PK interna, para tokens emitidos sin el claim `uid`
+_user_pks = LRUCache(maxsize=config.JWT_CACHE_SIZE)
+
 def verify_jwt_token(token):
     """
     Verificar y decodificar un JWT token
+    
+    La firma solo se verifica la primera vez; después el payload sale de
+    caché hasta que el token expira.
     """
+    key = hashlib.sha256(token.encode()).digest()
+    
+    payload = _verified_tokens.get(key)
+    if payload is not None:
+        return payload
+    
     try:
         payload = jwt.decode(
             token,
             config.JWT_SECRET_KEY,
             algorithms=[config.JWT_ALGORITHM]
         )
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    
+    # `exp` es obligatorio en nuestros tokens; sin él no se guarda en caché
+    if 'exp' in payload:
+        _verified_tokens.set(key, payload, expires_at=payload['exp'])
+    
+    return payload
+
+def get_user_pk(current_user):
+    """
+    Obtener la PK interna del usuario autenticado sin consultar la BD
+    
+    Usa el claim `uid`; los tokens anteriores a ese claim se resuelven una
+    sola vez y se recuerdan en caché. Regresa None si el usuario no existe.
+    """
+    if current_user.get('uid') is not None:
+        return current_user['uid']
+    
+    user_id = current_user['user_id']
+    user_pk = _user_pks.get(user_id)
+    
+    if user_pk is None:
+        from models import User
+        
+        user = User.query.filter_by(user_id=user_id).first()
+        if not user:
+            return None
+        
+        user_pk = user.id
+        _user_pks.set(user_id, user_pk)
+    
+    return user_pk
 
 def verify_google_token(token):
     """
     Verificar un token de Google OAuth
     """
     try:
-        idinfo = id_token.verify_oauth2_token(
+        idinfo = id_token.verify_token(
             token,
-            google_requests.Request(),
-            config.GOOGLE_CLIENT_ID
+            _google_request,
+            audience=config.GOOGLE_CLIENT_ID,
+            certs_url=config.GOOGLE_CERTS_URL
         )
         
         if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
@@ -70,9 +254,9 @@ def verify_google_token(token):
 
 def get_google_provider_cfg():
     """
-    Obtener la configuración de Google OAuth
+    Obtener la configuración de Google OAuth (desde caché)
     """
-    return requests.get(config.GOOGLE_DISCOVERY_URL).json()
+    return _discovery_document.get()
 
 def token_required(f):
     """
@@ -0,0 +1,152 @@
+"""
+Benchmark del archivo de reportes antiguos (archive.py)
+
+Genera --reports reportes de registros de --lines filas con fechas
+repartidas en los últimos --years años, mide la base caliente y las
+lecturas, archiva lo anterior a ARCHIVE_AFTER_DAYS y vuelve a medir:
+
+- filas en report_lines y tamaño de la base tras VACUUM
+- listado (GET /api/reports?limit=50) y GET /api/reports/<id> de un
+  reporte reciente
+- GET /api/reports/<id> de un reporte archivado (mmap, sin caché)
+- tiempo de archivar y de restaurar un reporte
+
+Uso (desde backend/):
+    python benchmarks/bench_archive.py [--reports 600] [--lines 1000] [--years 6]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=600)
+    parser.add_argument('--lines', type=int, default=1000, help='filas por reporte')
+    parser.add_argument('--years', type=int, default=6, help='antigüedad de las fechas')
+    parser.add_argument('--repeat', type=int, default=30, help='lecturas por medición')
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+
+
+def db_size(db, path):
+    db.session.commit()
+    db.session.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(db.text('VACUUM'))
+    return os.path.getsize(path)
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(3)
+    
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, 'archive.db')
+    os.environ['DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ['ARCHIVE_DIR'] = os.path.join(tmp.name, 'archive')
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from config import config
+    from migrations import init_db
+    from models import db, Report, ReportLine
+    import archive
+    import report_service
+    import search
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'userId': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    today = date.today()
+    with app.app_context():
+        for i in range(args.reports):
+            rows = [
+                {'id': n + 1, 'fecha': '2025-01-01', 'noAsiento': n // 2 + 1, 'cuenta': f'Cuenta {n % 60}',
+                 'clasificacion': 'Activo', 'debe': 10.0 if n % 2 == 0 else 0,
+                 'haber': 0 if n % 2 == 0 else 10.0, 'concepto': f'Movimiento {rng.randrange(10 ** 6)}'}
+                for n in range(args.lines)
+            ]
+            report = Report(
+                user_id=1, name=f'Reporte {i}', report_type='Registros Contables', program_id=i % 4,
+                date=today - timedelta(days=rng.randrange(args.years * 365)), data='[]'
+            )
+            db.session.add(report)
+            db.session.flush()
+            ReportLine.bulk_insert(report.id, [('', rows)])
+            search.index_lines(report.id)
+            db.session.commit()
+        
+        cutoff = today - timedelta(days=config.ARCHIVE_AFTER_DAYS)
+        recent = db.session.scalar(db.select(Report.id).where(Report.date >= cutoff).limit(1))
+        old_ids = db.session.scalars(db.select(Report.id).where(Report.date < cutoff)).all()
+    
+    def measure(label):
+        with app.app_context():
+            lines = db.session.scalar(db.select(db.func.count(ReportLine.id)))
+            size = db_size(db, path)
+        
+        timings = {}
+        for name, url in [('listado', '/api/reports?limit=50'), ('reciente', f'/api/reports/{recent}'),
+                          ('antiguo', f'/api/reports/{old_ids[0]}')]:
+            samples = []
+            for _ in range(args.repeat):
+                report_service._documents.clear()
+                started = time.perf_counter()
+                client.get(url, headers=headers)
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = percentiles(samples)
+        
+        print(f"{label:<10}{lines:>12,}{size / 2 ** 20:>10.1f} MB" + ''.join(
+            f"{p50:>11.2f}/{p95:<5.2f}" for p50, p95 in timings.values()))
+    
+    print(f"{args.reports} reportes de {args.lines:,} filas en {args.years} años; "
+          f"se archivan {len(old_ids)} (más de {config.ARCHIVE_AFTER_DAYS} días)\n")
+    print(f"{'':<10}{'líneas':>12}{'base':>13}{'listado':>14}{'reciente':>17}{'antiguo':>17}")
+    print(f"{'':<35}" + f"{'p50/p95 ms':>17}" * 3)
+    
+    # Las lecturas dejan copia en payload_store; que esté para todos
+    for report_id in old_ids:
+        client.get(f'/api/reports/{report_id}', headers=headers)
+    measure('antes')
+    
+    with app.app_context():
+        started = time.perf_counter()
+        archived = archive.run()
+        elapsed = time.perf_counter() - started
+    measure('después')
+    
+    segments = sum(os.path.getsize(os.path.join(config.ARCHIVE_DIR, name))
+                   for name in os.listdir(config.ARCHIVE_DIR) if name.endswith('.pack'))
+    print(f"\nArchivar {archived} reportes: {elapsed:.2f} s; segmentos: {segments / 2 ** 20:.1f} MB")
+    
+    with app.app_context():
+        started = time.perf_counter()
+        archive.restore(db.session.get(Report, old_ids[0]))
+        db.session.commit()
+        print(f"Restaurar un reporte: {(time.perf_counter() - started) * 1000:.1f} ms")
+    
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
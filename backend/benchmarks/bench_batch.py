@@ -0,0 +1,115 @@
+"""
+Benchmark de GET /api/reports/batch contra varias lecturas de un reporte
+
+Crea --programs programas con tres reportes cada uno (lo que pide el
+constructor de mayores) de --lines filas y compara, por programa:
+
+- secuencial: tres GET /api/reports/<id>
+- batch ids:  un GET /api/reports/batch?ids=...
+- batch programa: un GET /api/reports/batch?programId=...
+
+Cada variante se mide en frío (caché de documentos vacía, se leen de
+payload_store) y en caliente. Al final muestra los contadores de la caché.
+
+Uso (desde backend/):
+    python benchmarks/bench_batch.py [--programs 20] [--lines 2000] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--programs', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=2000, help='filas por reporte')
+    parser.add_argument('--repeat', type=int, default=5, help='lecturas de cada programa')
+    return parser.parse_args()
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+
+
+def main():
+    args = parse_args()
+    
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tmp.name, 'batch.db')}"
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    import report_service
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'userId': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    programs = {}
+    for program in range(1, args.programs + 1):
+        programs[program] = []
+        for kind in range(3):
+            rows = [
+                {'id': i + 1, 'fecha': '2025-01-01', 'noAsiento': i // 2 + 1, 'cuenta': f'Cuenta {i % 40}',
+                 'clasificacion': 'Activo', 'debe': 10.0 if i % 2 == 0 else 0,
+                 'haber': 0 if i % 2 == 0 else 10.0, 'concepto': f'Movimiento {program}-{kind}-{i}'}
+                for i in range(args.lines)
+            ]
+            response = client.post('/api/reports', headers=headers, json={
+                'name': f'Programa {program} #{kind}', 'reportType': 'Registros Contables',
+                'programId': program, 'date': '2025-01-31', 'data': rows
+            })
+            programs[program].append(response.get_json()['report']['id'])
+    
+    variants = {
+        'secuencial': lambda program, ids: [client.get(f'/api/reports/{report_id}', headers=headers)
+                                            for report_id in ids],
+        'batch ids': lambda program, ids: client.get(
+            '/api/reports/batch?ids=' + ','.join(map(str, ids)), headers=headers),
+        'batch programa': lambda program, ids: client.get(
+            f'/api/reports/batch?programId={program}', headers=headers),
+    }
+    
+    # Deja una copia en payload_store para que "frío" solo mida la caché
+    for program, ids in programs.items():
+        variants['batch ids'](program, ids)
+    
+    print(f"{args.programs} programas x 3 reportes de {args.lines:,} filas\n")
+    print(f"{'variante':<16} {'frío p50':>9} {'frío p95':>9} {'caliente p50':>13} {'caliente p95':>13}")
+    
+    for label, read in variants.items():
+        cold, warm = [], []
+        for _ in range(args.repeat):
+            report_service._documents.clear()
+            for program, ids in programs.items():
+                started = time.perf_counter()
+                read(program, ids)
+                cold.append(time.perf_counter() - started)
+            for program, ids in programs.items():
+                started = time.perf_counter()
+                read(program, ids)
+                warm.append(time.perf_counter() - started)
+        
+        cold_p50, cold_p95 = percentiles(cold)
+        warm_p50, warm_p95 = percentiles(warm)
+        print(f"{label:<16} {cold_p50 * 1000:>7.1f}ms {cold_p95 * 1000:>7.1f}ms "
+              f"{warm_p50 * 1000:>11.1f}ms {warm_p95 * 1000:>11.1f}ms")
+    
+    print(f"\nCaché de documentos: {report_service._documents.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark de importación masiva: /api/cuentas/bulk y /api/reports/bulk
+contra la inserción de una cuenta / un reporte por petición
+
+Uso (desde backend/):
+    python benchmarks/bench_bulk_import.py [--cuentas 5000] [--lines 200000] [--batch-size 1000]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cuentas', type=int, default=5000)
+    parser.add_argument('--lines', type=int, default=200000, help='líneas de registros a importar')
+    parser.add_argument('--lines-per-report', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--single', type=int, default=500, help='muestra para el modo una-por-petición')
+    args = parser.parse_args()
+    
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(tmp.name, 'bulk.db')}")
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'userId': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    def report(name, seconds, rows):
+        print(f"{name:<38}{rows:>10} filas {seconds:>8.2f}s {rows / seconds:>12.0f} filas/s")
+    
+    # Cuentas: una por petición
+    started = time.perf_counter()
+    for i in range(args.single):
+        client.post('/api/cuentas', json={'cuenta': f'Single {i}', 'clasificacion': 'Activo'})
+    report('POST /api/cuentas (una por petición)', time.perf_counter() - started, args.single)
+    
+    # Cuentas: CSV en bloque
+    body = 'cuenta,clasificacion,descripcion\n' + ''.join(
+        f'Cuenta {i},Activo,Importada\n' for i in range(args.cuentas)
+    )
+    started = time.perf_counter()
+    result = client.post(f'/api/cuentas/bulk?batchSize={args.batch_size}', data=body,
+                         content_type='text/csv', headers=headers).get_json()
+    report('POST /api/cuentas/bulk (CSV)', time.perf_counter() - started, result['inserted'])
+    
+    def registros(report_number, size):
+        return [
+            {'id': i, 'fecha': '2025-01-01', 'noAsiento': i // 2, 'cuenta': f'Cuenta {i % 50}',
+             'clasificacion': 'Activo', 'debe': 10.25 if i % 2 == 0 else 0,
+             'haber': 0 if i % 2 == 0 else 10.25, 'concepto': f'Asiento {report_number}'}
+            for i in range(size)
+        ]
+    
+    # Reportes: uno por petición (muestra)
+    sample_reports = max(1, args.single // 100)
+    started = time.perf_counter()
+    for n in range(sample_reports):
+        client.post('/api/reports', json={
+            'name': f'Single {n}', 'reportType': 'Registros Contables', 'programId': 3,
+            'date': '2025-01-01', 'data': registros(n, 100)
+        }, headers=headers)
+    report('POST /api/reports (uno por petición)', time.perf_counter() - started, sample_reports * 100)
+    
+    # Reportes: NDJSON en bloque
+    reports = args.lines // args.lines_per_report
+    body = ''.join(
+        json.dumps({'name': f'Bulk {n}', 'reportType': 'Registros Contables', 'programId': 3,
+                    'date': '2025-01-01', 'data': registros(n, args.lines_per_report)}) + '\n'
+        for n in range(reports)
+    )
+    started = time.perf_counter()
+    result = client.post(f'/api/reports/bulk?batchSize={args.batch_size}', data=body,
+                         content_type='application/x-ndjson', headers=headers).get_json()
+    report('POST /api/reports/bulk (NDJSON)', time.perf_counter() - started,
+           result['inserted'] * args.lines_per_report)
+    
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
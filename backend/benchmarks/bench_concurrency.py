@@ -0,0 +1,113 @@
+"""
+Benchmark de concurrencia: escritores de create_report contra lectores de
+get_reports sobre SQLite, con y sin el perfil de PRAGMAs (WAL, etc.)
+
+Uso (desde backend/):
+    python benchmarks/bench_concurrency.py [--writers 4] [--readers 8] [--seconds 10] [--rows 200]
+
+Cada perfil corre en un subproceso con su propia base de datos temporal.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILES = {
+    # Lo que SQLite hace sin configurar nada
+    'default': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_MMAP_SIZE': '0',
+    },
+    # Valores de config.Config
+    'tuned': {},
+}
+
+
+def run_profile(args):
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    response = client.post('/api/register', json={
+        'userId': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'
+    })
+    headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+    
+    rows = [
+        {'id': i, 'fecha': '2025-01-01', 'noAsiento': i // 2, 'cuenta': 'Caja',
+         'clasificacion': 'Activo', 'debe': 10.5, 'haber': 10.5, 'concepto': 'bench'}
+        for i in range(args.rows)
+    ]
+    payload = {'name': 'bench', 'reportType': 'Registros Contables', 'programId': 3,
+               'date': '2025-01-01', 'data': rows}
+    
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.seconds
+    
+    def worker(kind):
+        local_client = app.test_client()
+        while time.perf_counter() < deadline:
+            if kind == 'writes':
+                result = local_client.post('/api/reports', json=payload, headers=headers)
+            else:
+                result = local_client.get('/api/reports?limit=50', headers=headers)
+            with lock:
+                counts[kind if result.status_code < 400 else 'errors'] += 1
+    
+    threads = [threading.Thread(target=worker, args=('writes',)) for _ in range(args.writers)]
+    threads += [threading.Thread(target=worker, args=('reads',)) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    print(json.dumps({
+        'writes_per_s': counts['writes'] / args.seconds,
+        'reads_per_s': counts['reads'] / args.seconds,
+        'errors': counts['errors']
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=200, help='filas por reporte creado')
+    parser.add_argument('--profile', choices=PROFILES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.profile:
+        run_profile(args)
+        return
+    
+    print(f"{'perfil':<10}{'escrituras/s':>14}{'lecturas/s':>12}{'errores':>9}")
+    for name, overrides in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, **overrides,
+                   'DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}"}
+            output = subprocess.run(
+                [sys.executable, __file__, '--profile', name,
+                 '--writers', str(args.writers), '--readers', str(args.readers),
+                 '--seconds', str(args.seconds), '--rows', str(args.rows)],
+                env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+        
+        result = json.loads(output)
+        print(f"{name:<10}{result['writes_per_s']:>14.1f}{result['reads_per_s']:>12.1f}{result['errors']:>9}")
+
+
+if __name__ == '__main__':
+    main()
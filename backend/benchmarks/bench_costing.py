@@ -0,0 +1,82 @@
+"""
+Benchmark del motor de costeo (costing.py) con PEPS, UEPS y promedio
+
+Genera un flujo sintético de movimientos ordenado por fecha (60 % entradas,
+40 % salidas) y mide el tiempo de valuación con fotos mensuales.
+
+Uso (desde backend/):
+    python benchmarks/bench_costing.py [--movements 1000000] [--products 1000]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate(count, products, days, seed):
+    """
+    Movimientos aleatorios reproducibles, ya en columnas
+    """
+    from costing import Movements
+    
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1).toordinal()
+    
+    fechas = np.sort(rng.integers(start, start + days, size=count))
+    codes = rng.integers(0, products, size=count)
+    cantidades = rng.integers(1, 50, size=count).astype(np.float64)
+    entradas = rng.random(count) < 0.6
+    unidades = np.where(entradas, cantidades, -cantidades * 0.9)
+    costos = np.where(entradas, np.round(rng.uniform(5, 500, size=count), 2), 0.0)
+    
+    return Movements([f'Producto {i}' for i in range(products)], codes, fechas, unidades, costos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--movements', type=int, default=1000000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    
+    sys.path.insert(0, BACKEND_DIR)
+    import costing
+    
+    started = time.perf_counter()
+    movements = generate(args.movements, args.products, args.days, args.seed)
+    print(f"Generación: {len(movements)} movimientos en {time.perf_counter() - started:.2f}s")
+    
+    first = date.fromordinal(int(movements.fechas[0]))
+    cortes = [date(first.year + (first.month + i) // 12, (first.month + i) % 12 + 1, 1)
+              for i in range(args.days // 30)]
+    
+    for method in costing.METHODS:
+        started = time.perf_counter()
+        snapshots = costing.valuate(movements, method, cortes)
+        seconds = time.perf_counter() - started
+        final = snapshots[-1]['totals']
+        print(f"{method:<10}{seconds:>8.2f}s {len(movements) / seconds:>12.0f} mov/s "
+              f"{len(snapshots):>4} fotos  valor final {final['valor']:>16,.2f}  "
+              f"costo de ventas {final['costoVentas']:>18,.2f}")
+    
+    # Valuación incremental: un mes más de movimientos sobre el estado ya calculado
+    engine = costing.CostingEngine('peps')
+    corte = np.searchsorted(movements.fechas, movements.fechas[-1] - 30)
+    head = costing.Movements(movements.productos, movements.codes[:corte], movements.fechas[:corte],
+                             movements.unidades[:corte], movements.costos[:corte])
+    tail = costing.Movements(movements.productos, movements.codes[corte:], movements.fechas[corte:],
+                             movements.unidades[corte:], movements.costos[corte:])
+    engine.apply(head)
+    started = time.perf_counter()
+    engine.apply(tail)
+    print(f"{'peps +30d':<10}{time.perf_counter() - started:>8.2f}s para {len(tail)} movimientos nuevos")
+
+
+if __name__ == '__main__':
+    main()
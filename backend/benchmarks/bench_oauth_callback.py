@@ -0,0 +1,265 @@
+"""
+Benchmark del callback de Google OAuth: WSGI síncrono contra ASGI (asgi.py)
+
+Levanta un proveedor OAuth falso en local (discovery, token y userinfo con
+una latencia configurable) y lanza una ráfaga de logins concurrentes
+contra cada servidor mientras otro cliente pide /api/health sin parar.
+Con workers síncronos, cada login ocupa un worker durante las llamadas al
+proveedor y el resto de la API espera; con asgi.py las esperas quedan en
+el event loop.
+
+- sync:  Flask en un servidor WSGI con un pool fijo de --workers hilos
+         (como gunicorn con workers síncronos).
+- async: uvicorn con asgi.application; las rutas de Flask usan un pool de
+         --workers hilos (ASGI_WSGI_WORKERS).
+
+Uso (desde backend/):
+    python benchmarks/bench_oauth_callback.py
+    python benchmarks/bench_oauth_callback.py --delay-ms 500 --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay-ms', type=float, default=200, help='latencia de cada llamada al proveedor')
+    parser.add_argument('--workers', type=int, default=4, help='hilos de Flask en ambos servidores')
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=25, help='logins en vuelo a la vez')
+    parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='both')
+    return parser.parse_args()
+
+
+# ==================== PROVEEDOR FALSO ====================
+
+def start_fake_provider(delay):
+    """
+    Proveedor OAuth mínimo: el access token es el código recibido y el
+    usuario se deriva de él, así cada login crea su propio usuario
+    """
+    
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        
+        def _json(self, payload, cache_control=None):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if cache_control:
+                self.send_header('Cache-Control', cache_control)
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def do_GET(self):
+            time.sleep(delay)
+            base = f'http://127.0.0.1:{self.server.server_port}'
+            
+            if self.path == '/.well-known/openid-configuration':
+                self._json({
+                    'authorization_endpoint': f'{base}/authorize',
+                    'token_endpoint': f'{base}/token',
+                    'userinfo_endpoint': f'{base}/userinfo'
+                }, 'public, max-age=3600')
+            elif self.path == '/certs':
+                self._json({}, 'public, max-age=3600')
+            elif self.path == '/userinfo':
+                code = self.headers.get('Authorization', '').split()[-1]
+                self._json({
+                    'sub': f'sub-{code}', 'email': f'{code}@bench.local',
+                    'email_verified': True, 'name': f'Usuario {code}'
+                })
+            else:
+                self.send_error(404)
+        
+        def do_POST(self):
+            time.sleep(delay)
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            code = dict(pair.split('=', 1) for pair in body.split('&'))['code']
+            self._json({'access_token': code, 'token_type': 'Bearer', 'expires_in': 3600})
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ==================== SERVIDORES ====================
+
+def start_sync_server(app, workers):
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+    
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    class PooledWSGIServer(BaseWSGIServer):
+        """
+        Cada conexión se atiende en un pool fijo de hilos
+        """
+        pool = ThreadPoolExecutor(max_workers=workers)
+        
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+        
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+    
+    server = PooledWSGIServer('127.0.0.1', 0, app, handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port, server.shutdown
+
+
+def start_async_server():
+    import uvicorn
+    from asgi import application
+    
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(application, lifespan='on', log_level='warning'))
+    thread = threading.Thread(target=lambda: asyncio.run(server.serve(sockets=[sock])), daemon=True)
+    thread.start()
+    
+    while not server.started:
+        time.sleep(0.01)
+    
+    def stop():
+        server.should_exit = True
+        thread.join()
+    
+    return sock.getsockname()[1], stop
+
+
+# ==================== CARGA ====================
+
+def get(port, path):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        return response.status, response.getheader('Location', '')
+    finally:
+        connection.close()
+
+
+def percentiles(latencies):
+    ordered = sorted(latency * 1000 for latency in latencies)
+    if not ordered:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    pick = lambda fraction: ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+    return {'p50_ms': round(pick(0.5), 1), 'p95_ms': round(pick(0.95), 1), 'max_ms': round(ordered[-1], 1)}
+
+
+def run(port, mode, args):
+    """
+    Ráfaga de logins con --concurrency hilos y, en paralelo, peticiones
+    secuenciales a /api/health hasta que termina la ráfaga
+    """
+    login_latencies, health_latencies = [], []
+    errors = [0]
+    lock = threading.Lock()
+    done = threading.Event()
+    
+    def login(i):
+        started = time.perf_counter()
+        status, location = get(port, f'/api/auth/google/callback?code={mode}{i}')
+        elapsed = time.perf_counter() - started
+        with lock:
+            login_latencies.append(elapsed)
+            errors[0] += status != 302 or 'token=' not in location
+    
+    def health():
+        while not done.is_set():
+            started = time.perf_counter()
+            status, _ = get(port, '/api/health')
+            health_latencies.append(time.perf_counter() - started)
+            errors[0] += status != 200
+    
+    # Calentar: discovery en caché y conexiones abiertas
+    login('warmup')
+    login_latencies.clear()
+    
+    monitor = threading.Thread(target=health)
+    started = time.perf_counter()
+    monitor.start()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(login, range(args.logins)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    monitor.join()
+    
+    return {
+        'logins_per_s': round(len(login_latencies) / elapsed, 1),
+        'login': percentiles(login_latencies),
+        'health': percentiles(health_latencies),
+        'health_requests': len(health_latencies),
+        'errors': errors[0]
+    }
+
+
+def main():
+    args = parse_args()
+    provider = start_fake_provider(args.delay_ms / 1000)
+    base = f'http://127.0.0.1:{provider.server_port}'
+    
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        'DATABASE_URI': f"sqlite:///{os.path.join(tmp.name, 'oauth.db')}",
+        'GOOGLE_CLIENT_ID': 'bench-client',
+        'GOOGLE_CLIENT_SECRET': 'bench-secret',
+        'GOOGLE_DISCOVERY_URL': f'{base}/.well-known/openid-configuration',
+        'GOOGLE_CERTS_URL': f'{base}/certs',
+        'FRONTEND_URL': 'http://frontend.local',
+        'ASGI_WSGI_WORKERS': str(args.workers),
+        # El proveedor falso es HTTP; oauthlib exige HTTPS salvo con esto
+        'OAUTHLIB_INSECURE_TRANSPORT': '1'
+    })
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    
+    with app.app_context():
+        init_db()
+    
+    print(f"Proveedor con {args.delay_ms:.0f} ms por llamada, {args.workers} workers, "
+          f"{args.logins} logins con {args.concurrency} en vuelo\n")
+    print(f"{'modo':<7}{'logins/s':>10}{'login p50':>11}{'login p95':>11}"
+          f"{'health p50':>12}{'health p95':>12}{'health max':>12}{'err':>5}")
+    
+    modes = ('sync', 'async') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        port, stop = start_sync_server(app, args.workers) if mode == 'sync' else start_async_server()
+        result = run(port, mode, args)
+        stop()
+        
+        print(f"{mode:<7}{result['logins_per_s']:>10.1f}{result['login']['p50_ms']:>11.1f}"
+              f"{result['login']['p95_ms']:>11.1f}{result['health']['p50_ms']:>12.1f}"
+              f"{result['health']['p95_ms']:>12.1f}{result['health']['max_ms']:>12.1f}{result['errors']:>5}")
+    
+    provider.shutdown()
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark del almacén de documentos (payload_store): tamaño y lectura
+
+Crea --reports reportes de registros a partir de --distinct documentos
+base (el resto son copias, algunas con una fila cambiada, como cuando un
+usuario guarda el mismo reporte con otro nombre) y compara:
+
+- antes:    la tabla anterior report_payloads, un documento sin comprimir
+            por reporte
+- identity: payload_blobs sin comprimir (solo deduplicación)
+- zlib/zstd: payload_blobs comprimidos (zstd solo si está instalado)
+
+Para cada variante muestra los bytes guardados, el tamaño de la base tras
+VACUUM y la mediana/p95 de leer el documento de un reporte.
+
+Uso (desde backend/):
+    python benchmarks/bench_payload_store.py [--reports 60] [--distinct 6] [--lines 5000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=60)
+    parser.add_argument('--distinct', type=int, default=6, help='documentos base distintos')
+    parser.add_argument('--lines', type=int, default=5000, help='filas por documento')
+    parser.add_argument('--repeat', type=int, default=5, help='lecturas de cada reporte')
+    return parser.parse_args()
+
+
+def make_document(base, lines, variant):
+    rows = [
+        {'id': i + 1, 'fecha': '2025-01-01', 'noAsiento': i // 2 + 1, 'cuenta': f'Cuenta {(i + base) % 40}',
+         'clasificacion': 'Activo' if i % 3 else 'Pasivo', 'debe': 10.25 + base if i % 2 == 0 else 0,
+         'haber': 0 if i % 2 == 0 else 10.25 + base, 'concepto': f'Movimiento {base}-{i}'}
+        for i in range(lines)
+    ]
+    # Una de cada tres copias tiene una fila distinta
+    if variant % 3 == 2:
+        rows[variant % lines]['concepto'] = f'Corrección {variant}'
+    return rows
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+
+
+def db_size(db, path):
+    db.session.commit()
+    db.session.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.execute(db.text('VACUUM'))
+    return os.path.getsize(path)
+
+
+def main():
+    args = parse_args()
+    
+    tmp = tempfile.TemporaryDirectory()
+    path = os.path.join(tmp.name, 'payload_store.db')
+    os.environ['DATABASE_URI'] = f'sqlite:///{path}'
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from config import config
+    from migrations import init_db
+    from models import db, PayloadBlob, Report, ReportDocument
+    import payload_store
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'userId': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    report_ids = []
+    for i in range(args.reports):
+        report_ids.append(client.post('/api/reports', json={
+            'name': f'Reporte {i}', 'reportType': 'Registros Contables', 'programId': 3,
+            'date': '2025-01-01', 'data': make_document(i % args.distinct, args.lines, i // args.distinct)
+        }, headers=headers).get_json()['report']['id'])
+    
+    print(f"{args.reports} reportes de {args.lines} filas, {args.distinct} documentos base\n")
+    print(f"{'variante':<10}{'guardado':>14}{'base (VACUUM)':>16}{'lectura p50':>14}{'lectura p95':>14}")
+    
+    with app.app_context():
+        # Antes: un documento sin comprimir por reporte
+        db.session.execute(db.text(
+            'CREATE TABLE report_payloads (report_id INTEGER PRIMARY KEY, version INTEGER NOT NULL, body BLOB NOT NULL)'
+        ))
+        for report in Report.query.all():
+            db.session.execute(db.text('INSERT INTO report_payloads VALUES (:id, :version, :body)'), {
+                'id': report.id, 'version': report.version, 'body': app.json.dumps_bytes(report.get_document())
+            })
+        stored = db.session.scalar(db.text('SELECT SUM(LENGTH(body)) FROM report_payloads'))
+        size = db_size(db, path)
+        
+        samples = []
+        for _ in range(args.repeat):
+            for report_id in report_ids:
+                started = time.perf_counter()
+                db.session.scalar(db.text('SELECT body FROM report_payloads WHERE report_id = :id'), {'id': report_id})
+                samples.append((time.perf_counter() - started) * 1000)
+        p50, p95 = percentiles(samples)
+        print(f"{'antes':<10}{stored:>14,}{size:>16,}{p50:>11.2f} ms{p95:>11.2f} ms")
+        
+        db.session.execute(db.text('DROP TABLE report_payloads'))
+        db.session.commit()
+    
+    codecs = ['identity', 'zlib'] + (['zstd'] if payload_store.zstandard is not None else [])
+    for codec in codecs:
+        config.PAYLOAD_CODEC = codec
+        
+        with app.app_context():
+            db.session.execute(db.delete(ReportDocument))
+            db.session.execute(db.delete(PayloadBlob))
+            db.session.commit()
+        
+        # La primera lectura genera y guarda el documento
+        for report_id in report_ids:
+            client.get(f'/api/reports/{report_id}', headers=headers)
+        
+        with app.app_context():
+            stored = db.session.scalar(db.select(db.func.sum(db.func.length(PayloadBlob.body))))
+            size = db_size(db, path)
+            reports = Report.query.filter(Report.id.in_(report_ids)).all()
+            
+            samples = []
+            for _ in range(args.repeat):
+                for report in reports:
+                    started = time.perf_counter()
+                    payload_store.load_report(report)
+                    samples.append((time.perf_counter() - started) * 1000)
+        
+        p50, p95 = percentiles(samples)
+        print(f"{codec:<10}{stored:>14,}{size:>16,}{p50:>11.2f} ms{p95:>11.2f} ms")
+    
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
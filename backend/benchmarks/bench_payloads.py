@@ -0,0 +1,102 @@
+"""
+Benchmark de tamaño y latencia de GET /api/reports/<id>
+
+Compara el codificador JSON estándar contra orjson, la primera lectura
+(arma y guarda el documento codificado) contra las siguientes (lo envía
+tal cual) y el tamaño de la respuesta sin comprimir, con gzip y con brotli.
+
+Uso (desde backend/):
+    python benchmarks/bench_payloads.py [--lines 50000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.setdefault('DATABASE_URI', f"sqlite:///{os.path.join(tmp.name, 'payloads.db')}")
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    from models import db, PayloadBlob, ReportDocument
+    import serialization
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'userId': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'password': 'bench'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    document = [
+        {'id': i, 'fecha': '2025-01-01', 'noAsiento': i // 2, 'cuenta': f'Cuenta {i % 50}',
+         'clasificacion': 'Activo', 'debe': 10.25 if i % 2 == 0 else 0,
+         'haber': 0 if i % 2 == 0 else 10.25, 'concepto': f'Movimiento {i}'}
+        for i in range(args.lines)
+    ]
+    report_id = client.post('/api/reports', json={
+        'name': 'Bench', 'reportType': 'Registros Contables', 'programId': 3,
+        'date': '2025-01-01', 'data': document
+    }, headers=headers).get_json()['report']['id']
+    
+    print(f"Documento: {args.lines} líneas")
+    
+    # Codificadores
+    ms, encoded = timed(lambda: json.dumps(document, indent=2, sort_keys=True).encode(), args.repeat)
+    print(f"{'json.dumps (indent=2)':<32}{ms:>9.1f} ms {len(encoded):>12,} bytes")
+    ms, encoded = timed(lambda: json.dumps(document, separators=(',', ':')).encode(), args.repeat)
+    print(f"{'json.dumps (compacto)':<32}{ms:>9.1f} ms {len(encoded):>12,} bytes")
+    if serialization.orjson is not None:
+        ms, encoded = timed(lambda: app.json.dumps_bytes(document), args.repeat)
+        print(f"{'orjson':<32}{ms:>9.1f} ms {len(encoded):>12,} bytes")
+    
+    # Lectura en frío (sin documento codificado) y en caliente
+    def cold():
+        with app.app_context():
+            db.session.execute(db.delete(ReportDocument))
+            db.session.execute(db.delete(PayloadBlob))
+            db.session.commit()
+        return client.get(f'/api/reports/{report_id}', headers={**headers, 'Accept-Encoding': 'identity'})
+    
+    ms, response = timed(cold, max(3, args.repeat // 4))
+    print(f"{'GET en frío':<32}{ms:>9.1f} ms {len(response.data):>12,} bytes")
+    
+    encodings = ['identity', 'gzip'] + (['br'] if serialization.brotli is not None else [])
+    for encoding in encodings:
+        ms, response = timed(
+            lambda: client.get(f'/api/reports/{report_id}', headers={**headers, 'Accept-Encoding': encoding}),
+            args.repeat
+        )
+        print(f"{'GET ' + encoding:<32}{ms:>9.1f} ms {len(response.data):>12,} bytes")
+    
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark de GET /api/reports/search sobre muchas líneas
+
+Genera --reports reportes de registros repartidos entre --users usuarios
+(--lines líneas en total) con conceptos de un vocabulario donde unas
+palabras son raras y otras muy comunes. Mide el costo de mantener el
+índice al insertar (con y sin index_lines) y la latencia de búsqueda de un
+usuario para términos de distinta frecuencia, con y sin facetas.
+
+Uso (desde backend/):
+    python benchmarks/bench_search.py [--lines 1000000] [--reports 400] [--users 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Palabra -> probabilidad de aparecer en el concepto de una línea
+VOCABULARY = {
+    'pago': 0.30, 'venta': 0.30, 'proveedor': 0.10, 'nomina': 0.05,
+    'arrendamiento': 0.01, 'honorarios': 0.005, 'donativo': 0.0005,
+}
+FILLER = ['de', 'contado', 'credito', 'mercancia', 'servicio', 'mensual', 'factura']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--reports', type=int, default=400)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+def concepto(rng):
+    words = [word for word, p in VOCABULARY.items() if rng.random() < p]
+    words += rng.sample(FILLER, 2)
+    words.append(f'F{rng.randrange(100000)}')
+    rng.shuffle(words)
+    return ' '.join(words)
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return statistics.median(ordered), ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))]
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(7)
+    
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tmp.name, 'search.db')}"
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    from models import db, Report, ReportLine
+    import search
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    tokens = []
+    for u in range(args.users):
+        tokens.append(client.post('/api/register', json={
+            'userId': f'bench{u}', 'name': 'Bench', 'email': f'bench{u}@example.com', 'password': 'bench'
+        }).get_json()['token'])
+    
+    lines_per_report = max(1, args.lines // args.reports)
+    sample = [
+        [{'id': i + 1, 'fecha': '2025-01-01', 'noAsiento': i // 2 + 1, 'cuenta': f'Cuenta {i % 60}',
+          'clasificacion': 'Activo', 'debe': 10.0, 'haber': 0, 'concepto': concepto(rng)}
+         for i in range(lines_per_report)]
+        for _ in range(4)
+    ]
+    
+    def insert_reports(count, offset=0, indexed=True):
+        started = time.perf_counter()
+        with app.app_context():
+            for i in range(count):
+                report = Report(
+                    user_id=(offset + i) % args.users + 1, name=f'Reporte {offset + i} mensual',
+                    report_type=['Registros Contables', 'Balance de Saldos'][i % 2],
+                    program_id=i % 4, date=date(2025, i % 12 + 1, 1), data='[]'
+                )
+                db.session.add(report)
+                db.session.flush()
+                ReportLine.bulk_insert(report.id, [('', sample[i % len(sample)])])
+                if indexed:
+                    search.index_lines(report.id)
+                db.session.commit()
+        return time.perf_counter() - started
+    
+    # Costo del índice: misma carga con y sin indexar las líneas
+    probe = max(1, args.reports // 20)
+    without = insert_reports(probe, indexed=False)
+    with app.app_context():
+        db.session.execute(db.text("INSERT INTO report_lines_fts(report_lines_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    with_index = insert_reports(probe, offset=probe)
+    
+    print(f"Insertar {probe * lines_per_report:,} líneas: {without:.2f} s sin índice, "
+          f"{with_index:.2f} s con índice (+{(with_index / without - 1) * 100:.0f}%)")
+    
+    insert_reports(args.reports - 2 * probe, offset=2 * probe)
+    
+    with app.app_context():
+        total = db.session.scalar(db.select(db.func.count(ReportLine.id)))
+    print(f"{total:,} líneas en {args.reports} reportes de {args.users} usuarios\n")
+    
+    headers = {'Authorization': f'Bearer {tokens[0]}'}
+    queries = ['donativo', 'honorarios', 'arrendamiento', 'nomina', 'pago', 'pago venta', 'pag*', 'mensual']
+    
+    print(f"{'búsqueda':<16}{'reportes':>10}{'p50 ms':>9}{'p95 ms':>9}{'p50 sin facetas':>17}")
+    for query in queries:
+        results = {}
+        for facets in ('true', 'false'):
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.get(f'/api/reports/search?q={query}&facets={facets}', headers=headers)
+                samples.append((time.perf_counter() - started) * 1000)
+            results[facets] = (percentiles(samples), response.get_json())
+        
+        (p50, p95), body = results['true']
+        matched = sum(body['facets']['reportType'].values())
+        print(f"{query:<16}{matched:>10}{p50:>9.1f}{p95:>9.1f}{results['false'][0][0]:>17.1f}")
+    
+    tmp.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Verificación de POST /api/reports/bulk con registros inválidos
+
+Importa en NDJSON un reporte válido, uno con una fila que no es objeto
+(`"data": [7]`) y otro válido, con lotes de una fila para que cada uno
+vaya en su propio commit. Revisa que los dos válidos queden guardados y
+que el inválido aparezca en la lista de errores con su número de línea,
+sin cortar la importación.
+
+Importa también un CSV con programId 0 y otro sin programId, que deben
+quedar en los programas 0 y 3.
+
+Termina con código 1 si alguna revisión falla.
+
+Uso (desde backend/):
+    python benchmarks/check_bulk_import.py
+"""
+import json
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def report(name, data):
+    return json.dumps({'name': name, 'reportType': 'Balance de Saldos', 'programId': 1,
+                       'date': '2025-01-31', 'data': data})
+
+
+def main():
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tmp.name, 'bulk.db')}"
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from migrations import init_db
+    from models import Report
+    
+    with app.app_context():
+        init_db()
+    
+    client = app.test_client()
+    token = client.post('/api/register', json={
+        'userId': 'check', 'name': 'Check', 'email': 'check@example.com', 'password': 'check'
+    }).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    
+    row = {'cuenta': 'Caja', 'debe': 100.0, 'haber': 0}
+    body = '\n'.join([report('Antes', [row]), report('Inválido', [7]), report('Después', [row])])
+    response = client.post('/api/reports/bulk?format=ndjson&batchSize=1', data=body, headers=headers)
+    result = response.get_json()
+    
+    csv_body = ('name,date,programId,cuenta,debe,haber\n'
+                'Programa cero,2025-01-31,0,Caja,100,0\n'
+                'Sin programa,2025-01-31,,Caja,100,0\n')
+    csv_response = client.post('/api/reports/bulk?format=csv', data=csv_body,
+                               content_type='text/csv', headers=headers)
+    
+    with app.app_context():
+        names = sorted(name for (name,) in Report.query.with_entities(Report.name)
+                       .filter(Report.name.in_(['Antes', 'Inválido', 'Después'])))
+        programs = dict(Report.query.with_entities(Report.name, Report.program_id)
+                        .filter(Report.name.in_(['Programa cero', 'Sin programa'])))
+    
+    checks = [
+        ('responde 200', response.status_code == 200),
+        ('importa los dos reportes válidos', result.get('inserted') == 2 and names == ['Antes', 'Después']),
+        ('reporta el inválido en la línea 2',
+         result.get('failed') == 1 and [error['line'] for error in result.get('errors', [])] == [2]),
+        ('CSV: programId 0 se conserva y el vacío usa 3',
+         csv_response.status_code == 200 and programs == {'Programa cero': 0, 'Sin programa': 3}),
+    ]
+    
+    failures = 0
+    for name, ok in checks:
+        failures += not ok
+        print(f"[{'OK' if ok else 'FALLA'}] {name}")
+    if failures:
+        print(f"\nRespuesta: {response.status_code} {result}")
+    
+    tmp.cleanup()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Verificación del costo de importar app.py
+
+Importa `app` en un proceso nuevo (sin módulos ya cargados) y revisa que
+tarde menos de --budget segundos y que no abra conexiones a la base: la
+configuración del esquema y los datos iniciales son comandos de la CLI
+(flask init-db / migrate / seed), no efectos de importar el módulo.
+
+Termina con código 1 si alguna revisión falla.
+
+Uso (desde backend/):
+    python benchmarks/check_import_time.py [--budget 2.0] [--repeat 3]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Se ejecuta en el proceso nuevo: mide `import app` y cuenta las conexiones
+# que abra cualquier engine de SQLAlchemy
+PROBE = """
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+connections = []
+event.listen(Engine, 'connect', lambda *args: connections.append(1))
+
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started, len(connections))
+"""
+
+
+def probe():
+    """
+    (segundos, conexiones, se creó la base) de un `import app`; lanza
+    RuntimeError si la importación falla
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'import.db')
+        env = dict(os.environ, DATABASE_URI=f'sqlite:///{path}')
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=env,
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip())
+        
+        elapsed, connections = result.stdout.split()[-2:]
+        return float(elapsed), int(connections), os.path.exists(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=float, default=2.0, help='segundos máximos para importar app')
+    parser.add_argument('--repeat', type=int, default=3, help='importaciones; se toma la más rápida')
+    args = parser.parse_args()
+    
+    try:
+        samples = [probe() for _ in range(args.repeat)]
+    except RuntimeError as e:
+        print(f"[FALLA] import app\n    {e}")
+        sys.exit(1)
+    
+    # La más rápida: el presupuesto es del código, no del ruido de la máquina
+    elapsed = min(seconds for seconds, _, _ in samples)
+    connections = max(count for _, count, _ in samples)
+    created = any(created for _, _, created in samples)
+    
+    checks = [
+        (f'tiempo de importación {elapsed:.2f}s (máximo {args.budget:.2f}s)', elapsed < args.budget),
+        (f'conexiones a la base al importar: {connections}', connections == 0),
+        ('no crea el archivo de la base', not created),
+    ]
+    
+    failures = 0
+    for name, ok in checks:
+        failures += not ok
+        print(f"[{'OK' if ok else 'FALLA'}] {name}")
+    
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
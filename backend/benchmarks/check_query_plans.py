@@ -0,0 +1,129 @@
+"""
+Verificación de planes de consulta del listado y filtros de reportes
+
+Siembra una base de datos con muchos reportes y revisa con EXPLAIN que las
+consultas de GET /api/reports usen índices: ni recorrer toda la tabla (o
+todo un índice) ni ordenar en un árbol temporal.
+
+Termina con código 1 si algún plan falla, así que sirve como
+verificación en CI.
+
+Uso (desde backend/):
+    python benchmarks/check_query_plans.py [--rows 1000000] [--users 1000]
+
+Por defecto usa una base SQLite temporal; con DATABASE_URI apuntando a
+PostgreSQL revisa los planes de ese motor (la base debe estar vacía).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(db, Report, users, rows):
+    from models import User
+    
+    db.session.execute(db.insert(User), [
+        {'user_id': f'user{i}', 'name': f'User {i}', 'email': f'user{i}@example.com',
+         'password_hash': ''}
+        for i in range(users)
+    ])
+    
+    tipos = [(1, 'Balance de Saldos'), (2, 'Inventario y Productos en Proceso'), (3, 'Registros Contables')]
+    start = datetime(2020, 1, 1)
+    batch = []
+    
+    for i in range(rows):
+        program_id, report_type = random.choice(tipos)
+        created_at = start + timedelta(minutes=i)
+        batch.append({
+            'user_id': random.randint(1, users), 'name': f'Reporte {i}',
+            'report_type': report_type, 'program_id': program_id,
+            'date': created_at.date(), 'data': '[]', 'totals': '{}',
+            'created_at': created_at, 'updated_at': created_at
+        })
+        if len(batch) == 10000:
+            db.session.execute(db.insert(Report), batch)
+            batch = []
+    
+    if batch:
+        db.session.execute(db.insert(Report), batch)
+    db.session.commit()
+
+
+def explain(db, query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    
+    if db.engine.dialect.name == 'sqlite':
+        plan = [row[-1] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))]
+        # SCAN ... USING INDEX también recorre el índice completo
+        failed = any(line.startswith('SCAN') or 'USE TEMP B-TREE' in line for line in plan)
+    else:
+        plan = [row[0] for row in db.session.execute(db.text(f'EXPLAIN {sql}'))]
+        failed = any('Seq Scan' in line or line.lstrip().startswith(('Sort', '->  Sort')) for line in plan)
+    
+    return plan, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args()
+    
+    tmp = None
+    if 'DATABASE_URI' not in os.environ:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URI'] = f"sqlite:///{os.path.join(tmp.name, 'plans.db')}"
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    from models import db, Report
+    from migrations import run_migrations
+    
+    with app.app_context():
+        run_migrations()
+        
+        started = time.perf_counter()
+        seed(db, Report, args.users, args.rows)
+        db.session.execute(db.text('ANALYZE'))
+        print(f"Sembrados {args.rows} reportes en {time.perf_counter() - started:.1f}s\n")
+        
+        user_pk = args.users // 2
+        queries = {
+            'listado': Report.list_query(user_pk).limit(51),
+            'listado con cursor': Report.list_query(
+                user_pk, after=(datetime(2021, 1, 1), args.rows // 2)
+            ).limit(51),
+            'filtro por tipo': Report.list_query(user_pk, report_type='Registros Contables').limit(51),
+            'filtro por tipo y fecha': Report.query.filter(
+                Report.user_id == user_pk,
+                Report.report_type == 'Balance de Saldos',
+                Report.date.between(date(2020, 6, 1), date(2020, 12, 31))
+            ),
+            'filtro por programa': Report.query.filter(Report.program_id == 2).limit(51),
+        }
+        
+        failures = 0
+        for name, query in queries.items():
+            plan, failed = explain(db, query)
+            failures += failed
+            print(f"[{'FALLA' if failed else 'OK'}] {name}")
+            for line in plan:
+                print(f"    {line}")
+    
+    if tmp:
+        tmp.cleanup()
+    
+    if failures:
+        print(f"\n{failures} planes fallaron")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""
+Suite de benchmarks y pruebas de carga de la API
+
+Siembra usuarios, catálogo y reportes sintéticos y mide los endpoints reales
+(/api/login, /api/reports listado/detalle/creación, /api/cuentas) con el
+cliente de pruebas de Flask y con un generador de carga HTTP multihilo
+contra un servidor local. Reporta p50/p95/p99, throughput y RSS máximo, y
+compara contra una línea base guardada.
+
+Uso (desde backend/):
+    python benchmarks/load_test.py                          # SQLite temporal
+    python benchmarks/load_test.py --sizes 10,1000,100000 --threads 8
+    python benchmarks/load_test.py --database-uri postgresql://localhost/bench
+    python benchmarks/load_test.py --save-baseline          # guardar la línea base
+    python benchmarks/load_test.py --tolerance 0.25         # comparar contra ella
+
+Sale con código 1 si algún escenario empeora más que la tolerancia. Con
+--database-uri la base indicada debe ser desechable: se crean tablas y
+datos con un prefijo único por corrida y no se borran.
+"""
+import argparse
+import http.client
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmarks', 'baseline.json')
+
+PASSWORD = 'bench-password'
+CLASIFICACIONES = ('Activo', 'Pasivo', 'Capital')
+
+# Diferencias menores a esto (ms) se consideran ruido al comparar latencias
+NOISE_FLOOR_MS = 2.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-uri', help='por defecto, SQLite en un directorio temporal')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--reports-per-user', type=int, default=20, help='reportes pequeños de relleno')
+    parser.add_argument('--cuentas', type=int, default=500)
+    parser.add_argument('--sizes', default='10,1000,10000', help='líneas de los reportes a leer (10 a 100000)')
+    parser.add_argument('--create-lines', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=200, help='peticiones por escenario')
+    parser.add_argument('--login-requests', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=4, help='hilos del generador de carga HTTP')
+    parser.add_argument('--driver', choices=('client', 'http', 'both'), default='both')
+    parser.add_argument('--hash-method', help='PASSWORD_HASH_METHOD para la corrida (por defecto el de config)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='empeoramiento permitido (0.2 = 20 %%)')
+    parser.add_argument('--output', help='guardar los resultados en JSON')
+    return parser.parse_args()
+
+
+def registros(size, label):
+    return [
+        {'id': i, 'fecha': f'2025-01-{i % 28 + 1:02d}', 'noAsiento': i // 2,
+         'cuenta': f'Cuenta {i % 50}', 'clasificacion': CLASIFICACIONES[i % 3],
+         'debe': 125.5 if i % 2 == 0 else 0, 'haber': 0 if i % 2 == 0 else 125.5,
+         'concepto': f'{label} movimiento {i}'}
+        for i in range(size)
+    ]
+
+
+def report_payload(size, label):
+    return {'name': f'{label} ({size} líneas)', 'reportType': 'Registros Contables',
+            'programId': 3, 'date': '2025-01-31', 'data': registros(size, label)}
+
+
+def seed(app, args, prefix, sizes):
+    """
+    Crear usuarios, catálogo y reportes directamente en la base de datos
+    
+    Regresa los userId creados y los ids de los reportes grandes por tamaño.
+    """
+    from migrations import init_db
+    from models import db, User, CuentaContable
+    from password_hashing import hash_password
+    import report_service
+    
+    with app.app_context():
+        init_db()
+        
+        password_hash = hash_password(PASSWORD)
+        user_ids = [f'{prefix}-{i}' for i in range(args.users)]
+        db.session.execute(db.insert(User), [
+            {'user_id': user_id, 'name': f'Usuario {user_id}', 'email': f'{user_id}@bench.local',
+             'password_hash': password_hash, 'auth_provider': 'local'}
+            for user_id in user_ids
+        ])
+        db.session.execute(db.insert(CuentaContable), [
+            {'cuenta': f'{prefix} Cuenta {i}', 'clasificacion': CLASIFICACIONES[i % 3],
+             'descripcion': 'Cuenta sintética'}
+            for i in range(args.cuentas)
+        ])
+        db.session.commit()
+        
+        pks = dict(db.session.execute(
+            db.select(User.user_id, User.id).where(User.user_id.in_(user_ids))
+        ).all())
+        
+        for user_id in user_ids:
+            for n in range(args.reports_per_user):
+                report_service.create_report(pks[user_id], report_payload(10, f'Relleno {n}'))
+            db.session.commit()
+        
+        report_ids = {}
+        for size in sizes:
+            report = report_service.create_report(pks[user_ids[0]], report_payload(size, 'Lectura'))
+            db.session.commit()
+            report_ids[size] = report.id
+    
+    return user_ids, report_ids
+
+
+def build_scenarios(args, user_ids, token, report_ids):
+    """
+    Escenarios como (nombre, peticiones, generador de (método, ruta, cuerpo))
+    """
+    auth = {'Authorization': f'Bearer {token}'}
+    create_body = json.dumps(report_payload(args.create_lines, 'Creado'))
+    
+    def login(i):
+        return 'POST', '/api/login', json.dumps({'userId': user_ids[i % len(user_ids)], 'password': PASSWORD}), {}
+    
+    scenarios = [
+        ('login', args.login_requests, login),
+        ('cuentas', args.requests, lambda i: ('GET', '/api/cuentas', None, {})),
+        ('reports_list', args.requests, lambda i: ('GET', '/api/reports?limit=50', None, auth)),
+    ]
+    
+    for size, report_id in report_ids.items():
+        # Menos repeticiones para los reportes grandes
+        count = max(5, min(args.requests, args.requests * 1000 // max(size, 1)))
+        scenarios.append((f'report_get_{size}', count,
+                          lambda i, path=f'/api/reports/{report_id}': ('GET', path, None, auth)))
+    
+    scenarios.append((f'report_create_{args.create_lines}', max(5, args.requests // 10),
+                      lambda i: ('POST', '/api/reports', create_body, auth)))
+    return scenarios
+
+
+def peak_rss_mb():
+    # En Linux ru_maxrss viene en KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, errors):
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 0.50), 3),
+        'p95_ms': round(percentile(ordered, 0.95), 3),
+        'p99_ms': round(percentile(ordered, 0.99), 3),
+        'rps': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1)
+    }
+
+
+def run_client(app, scenario, warmup):
+    """
+    Peticiones secuenciales con el cliente de pruebas de Flask (sin red)
+    """
+    _, count, make_request = scenario
+    client = app.test_client()
+    
+    def call(i):
+        method, path, body, headers = make_request(i)
+        return client.open(path, method=method, data=body, headers=headers,
+                           content_type='application/json' if body else None).status_code
+    
+    for i in range(warmup):
+        call(i)
+    
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(count):
+        request_started = time.perf_counter()
+        status = call(i)
+        latencies.append(time.perf_counter() - request_started)
+        errors += status >= 400
+    
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def run_http(port, scenario, warmup, threads):
+    """
+    Generador de carga: `threads` hilos con conexiones keep-alive contra el
+    servidor local, repartiéndose las peticiones del escenario
+    """
+    _, count, make_request = scenario
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    next_index = iter(range(count))
+    
+    def call(connection, i):
+        method, path, body, headers = make_request(i)
+        headers = {**headers, 'Accept-Encoding': 'gzip'}
+        if body:
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, path, body=body, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    
+    warm = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    for i in range(warmup):
+        call(warm, i)
+    warm.close()
+    
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        local = []
+        local_errors = 0
+        while True:
+            with lock:
+                i = next(next_index, None)
+            if i is None:
+                break
+            request_started = time.perf_counter()
+            status = call(connection, i)
+            local.append(time.perf_counter() - request_started)
+            local_errors += status >= 400
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+    
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    
+    return summarize(latencies, time.perf_counter() - started, errors[0])
+
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    
+    class QuietHandler(WSGIRequestHandler):
+        # HTTP/1.1 para que las conexiones keep-alive se reutilicen
+        protocol_version = 'HTTP/1.1'
+        
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def compare(results, baseline, tolerance):
+    """
+    Escenarios que empeoraron respecto a la línea base
+    """
+    regressions = []
+    
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            limit = previous[metric] * (1 + tolerance)
+            if current[metric] > limit and current[metric] - previous[metric] > NOISE_FLOOR_MS:
+                regressions.append(f'{key}: {metric} {current[metric]:.1f} > {previous[metric]:.1f} (+{tolerance:.0%})')
+        
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{key}: rps {current['rps']:.1f} < {previous['rps']:.1f} (-{tolerance:.0%})")
+        if current['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{key}: RSS {current['peak_rss_mb']:.0f} MB > {previous['peak_rss_mb']:.0f} MB (+{tolerance:.0%})")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{key}: errores {current['errors']} > {previous['errors']}")
+    
+    return regressions
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    prefix = f'bench{int(time.time())}'
+    
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['DATABASE_URI'] = args.database_uri or f"sqlite:///{os.path.join(tmp.name, 'load.db')}"
+    if args.hash_method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.hash_method
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app import app
+    
+    started = time.perf_counter()
+    user_ids, report_ids = seed(app, args, prefix, sizes)
+    print(f"Datos sembrados en {time.perf_counter() - started:.1f}s: {args.users} usuarios, "
+          f"{args.cuentas} cuentas, reportes de {', '.join(map(str, sizes))} líneas")
+    
+    token = app.test_client().post('/api/login', json={
+        'userId': user_ids[0], 'password': PASSWORD
+    }).get_json()['token']
+    scenarios = build_scenarios(args, user_ids, token, report_ids)
+    
+    results = {}
+    drivers = ('client', 'http') if args.driver == 'both' else (args.driver,)
+    server = start_server(app) if 'http' in drivers else None
+    
+    print(f"\n{'escenario':<34}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'RSS MB':>9}")
+    for driver in drivers:
+        for scenario in scenarios:
+            if driver == 'client':
+                summary = run_client(app, scenario, args.warmup)
+            else:
+                summary = run_http(server.server_port, scenario, args.warmup, args.threads)
+            
+            key = f'{driver}:{scenario[0]}'
+            results[key] = summary
+            print(f"{key:<34}{summary['requests']:>6}{summary['errors']:>5}{summary['p50_ms']:>10.1f}"
+                  f"{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}{summary['rps']:>10.1f}"
+                  f"{summary['peak_rss_mb']:>9.1f}")
+    
+    if server is not None:
+        server.shutdown()
+    tmp.cleanup()
+    
+    # Solo se comparan corridas con los mismos parámetros
+    run = {
+        'database': 'sqlite' if not args.database_uri else args.database_uri.split(':', 1)[0],
+        'users': args.users, 'reports_per_user': args.reports_per_user, 'cuentas': args.cuentas,
+        'sizes': sizes, 'create_lines': args.create_lines, 'requests': args.requests,
+        'login_requests': args.login_requests, 'threads': args.threads,
+        'hash_method': os.environ.get('PASSWORD_HASH_METHOD', '')
+    }
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'run': run, 'results': results}, f, indent=2)
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'run': run, 'results': results}, f, indent=2, sort_keys=True)
+        print(f"\n✓ Línea base guardada en {args.baseline}")
+        return 0
+    
+    if not os.path.exists(args.baseline):
+        print(f"\nSin línea base en {args.baseline}; usa --save-baseline para crearla")
+        return 0
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    
+    if baseline.get('run') != run:
+        print(f"\n⚠️ La línea base se tomó con otros parámetros, no se compara: {baseline.get('run')}")
+        return 0
+    
+    regressions = compare(results, baseline['results'], args.tolerance)
+    
+    if regressions:
+        print("\n❌ Regresiones contra la línea base:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    
+    print("\n✓ Sin regresiones contra la línea base")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""
+Importación masiva de catálogo de cuentas y reportes (CSV o NDJSON)
+
+El cuerpo de la petición se lee como stream, registro por registro; cada
+registro se valida al llegar y las inserciones se agrupan en transacciones
+de `batch_size` filas. Los registros con error no detienen la importación:
+se devuelven en un reporte por línea.
+"""
+import csv
+import io
+import itertools
+import json
+
+from sqlalchemy.exc import IntegrityError
+
+import report_service
+from models import db, CuentaContable
+from report_service import ReportValidationError
+
+# Máximo de errores detallados en la respuesta (el conteo sí es completo)
+MAX_ERRORS = 1000
+
+# Columnas numéricas al leer líneas de registros desde CSV
+CSV_INT_FIELDS = ('id', 'noAsiento')
+CSV_NUMBER_FIELDS = ('monto', 'debe', 'haber', 'unidades', 'costoUnitario',
+                     'cantidad', 'materiales', 'manoObra', 'gastosF')
+
+# Columnas de CSV que describen al reporte y no a la línea
+CSV_REPORT_FIELDS = ('name', 'reportType', 'programId', 'date')
+
+
+class ImportResult:
+    """
+    Conteos y errores por línea de una importación
+    """
+    
+    def __init__(self):
+        self.records = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+    
+    @classmethod
+    def from_checkpoint(cls, state):
+        """
+        Retomar los conteos guardados por to_checkpoint()
+        """
+        result = cls()
+        result.records = state['records']
+        result.inserted = state['inserted']
+        result.failed = state['failed']
+        result.errors = state['errors']
+        return result
+    
+    def to_checkpoint(self):
+        return {
+            'records': self.records,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors
+        }
+    
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+    
+    def to_dict(self):
+        return {
+            'success': self.failed == 0,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errorsTruncated': self.failed > len(self.errors)
+        }
+
+
+def iter_records(stream, fmt):
+    """
+    Recorrer (número de línea, registro, error) de un stream CSV o NDJSON
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    
+    for number, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            yield number, json.loads(raw), None
+        except ValueError as e:
+            yield number, None, f'JSON inválido: {e}'
+
+
+# ==================== CUENTAS ====================
+
+def import_cuentas(stream, fmt, batch_size):
+    """
+    Importar cuentas al catálogo; las repetidas se reportan como error
+    """
+    result = ImportResult()
+    existing = {cuenta for (cuenta,) in db.session.query(CuentaContable.cuenta)}
+    batch = []
+    
+    for line, record, error in iter_records(stream, fmt):
+        if error:
+            result.error(line, error)
+            continue
+        
+        mapping, error = _validate_cuenta(record)
+        if error:
+            result.error(line, error)
+            continue
+        
+        if mapping['cuenta'] in existing:
+            result.error(line, f"La cuenta '{mapping['cuenta']}' ya existe")
+            continue
+        
+        existing.add(mapping['cuenta'])
+        batch.append((line, mapping))
+        
+        if len(batch) >= batch_size:
+            _insert_cuentas(batch, result)
+            batch = []
+    
+    if batch:
+        _insert_cuentas(batch, result)
+    
+    return result
+
+
+def _validate_cuenta(record):
+    if not isinstance(record, dict):
+        return None, 'Cada registro debe ser un objeto'
+    
+    cuenta = (record.get('cuenta') or '').strip()
+    clasificacion = (record.get('clasificacion') or '').strip()
+    
+    if not cuenta or not clasificacion:
+        return None, 'Faltan campos requeridos (cuenta, clasificacion)'
+    if len(cuenta) > 100:
+        return None, 'El nombre de la cuenta excede 100 caracteres'
+    
+    return {
+        'cuenta': cuenta,
+        'clasificacion': clasificacion,
+        'descripcion': record.get('descripcion') or ''
+    }, None
+
+
+def _insert_cuentas(batch, result):
+    """
+    Insertar un lote con executemany; si choca con datos concurrentes se
+    reintenta fila por fila para aislar los errores
+    """
+    try:
+        db.session.execute(db.insert(CuentaContable), [mapping for _, mapping in batch])
+        db.session.commit()
+        result.inserted += len(batch)
+        return
+    except IntegrityError:
+        db.session.rollback()
+    
+    for line, mapping in batch:
+        try:
+            db.session.execute(db.insert(CuentaContable), [mapping])
+            db.session.commit()
+            result.inserted += 1
+        except IntegrityError:
+            db.session.rollback()
+            result.error(line, f"La cuenta '{mapping['cuenta']}' ya existe")
+
+
+# ==================== REPORTES ====================
+
+def import_reports(user_pk, stream, fmt, batch_size, on_commit=None, checkpoint=None, resume=None):
+    """
+    Importar reportes: en NDJSON cada línea es un reporte completo; en CSV
+    cada fila es una línea de registro y las filas consecutivas con el mismo
+    (name, date) forman un reporte
+    
+    `on_commit(result)` se llama después de cada lote guardado.
+    `checkpoint(estado)` se llama justo antes de cada commit, para guardar
+    el avance en la misma transacción que el lote; con ese estado en
+    `resume` la importación salta lo que ya se guardó y sigue desde ahí.
+    """
+    result = ImportResult.from_checkpoint(resume) if resume else ImportResult()
+    records = iter_records(stream, fmt)
+    reports = _group_csv_rows(records) if fmt == 'csv' else records
+    
+    pending_lines = 0
+    
+    for line, payload, error in itertools.islice(reports, result.records, None):
+        result.records += 1
+        if error:
+            result.error(line, error)
+            continue
+        
+        try:
+            # Savepoint: un reporte inválido no descarta el resto del lote
+            _begin_sqlite_transaction()
+            with db.session.begin_nested():
+                report_service.create_report(user_pk, payload)
+        except (ReportValidationError, IntegrityError) as e:
+            result.error(line, str(e))
+            continue
+        
+        result.inserted += 1
+        pending_lines += len(payload['data']) if isinstance(payload['data'], list) else 1
+        
+        if pending_lines >= batch_size:
+            if checkpoint:
+                checkpoint(result.to_checkpoint())
+            db.session.commit()
+            pending_lines = 0
+            if on_commit:
+                on_commit(result)
+    
+    if checkpoint:
+        checkpoint(result.to_checkpoint())
+    db.session.commit()
+    return result
+
+
+def _begin_sqlite_transaction():
+    """
+    pysqlite solo abre la transacción antes de un INSERT/UPDATE/DELETE: si
+    el primer comando del lote es un SAVEPOINT, este hace de transacción
+    externa y su RELEASE ya es un commit. Abrirla antes mantiene el lote
+    (y su checkpoint) en un solo commit.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+
+
+def _group_csv_rows(records):
+    """
+    Agrupar filas CSV consecutivas del mismo reporte en un payload
+    """
+    current_key = None
+    current = None
+    
+    for line, record, error in records:
+        if error:
+            yield line, None, error
+            continue
+        
+        key = (record.get('name'), record.get('date'))
+        if key != current_key:
+            if current:
+                yield current
+            current_key = key
+            # Sin programId (o vacío) va al programa 3; el 0 es válido
+            program_id = _to_int(record.get('programId'))
+            current = (line, {
+                'name': record.get('name'),
+                'reportType': record.get('reportType') or 'Registros Contables',
+                'programId': 3 if program_id is None else program_id,
+                'date': record.get('date'),
+                'data': []
+            }, None)
+        
+        current[1]['data'].append(_csv_row(record))
+    
+    if current:
+        yield current
+
+
+def _csv_row(record):
+    row = {}
+    
+    for key, value in record.items():
+        if key in CSV_REPORT_FIELDS or key is None or value in (None, ''):
+            continue
+        if key in CSV_INT_FIELDS:
+            value = _to_int(value) if _to_int(value) is not None else value
+        elif key in CSV_NUMBER_FIELDS:
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        row[key] = value
+    
+    return row
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,118 @@
+"""
+Caché en proceso del catálogo de cuentas
+
+El catálogo cambia poco (solo por create_cuenta y la importación masiva),
+así que se serializa una vez por versión y se sirve con ETag. También se
+precalcula un índice con los nombres normalizados (sin acentos, en
+minúsculas y ordenados) para búsquedas por prefijo o texto sin tener que
+enviar el catálogo completo.
+"""
+import bisect
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+
+from config import config
+from models import db, CuentaContable
+
+_lock = threading.Lock()
+_snapshot = None
+
+
+def normalize(text):
+    """
+    Quitar acentos y pasar a minúsculas para comparar nombres
+    """
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower().strip()
+
+
+class CatalogSnapshot:
+    """
+    Una versión del catálogo ya serializada y con su índice de búsqueda
+    """
+    
+    def __init__(self, cuentas, fingerprint):
+        self.fingerprint = fingerprint
+        self.cuentas = [cuenta.to_dict() for cuenta in cuentas]
+        self.body = json.dumps({'success': True, 'cuentas': self.cuentas}).encode()
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.checked_at = time.monotonic()
+        
+        # (nombre normalizado, posición en self.cuentas), ordenado por nombre
+        self.index = sorted(
+            (normalize(cuenta['cuenta']), position)
+            for position, cuenta in enumerate(self.cuentas)
+        )
+        self.keys = [key for key, _ in self.index]
+    
+    def search(self, prefix=None, text=None, clasificacion=None, limit=None):
+        """
+        Filtrar por prefijo (búsqueda binaria), texto contenido y clasificación
+        """
+        if prefix:
+            prefix = normalize(prefix)
+            start = bisect.bisect_left(self.keys, prefix)
+            end = bisect.bisect_left(self.keys, prefix + '￿')
+            candidates = self.index[start:end]
+        else:
+            candidates = self.index
+        
+        text = normalize(text) if text else None
+        clasificacion = normalize(clasificacion) if clasificacion else None
+        
+        results = []
+        for key, position in candidates:
+            cuenta = self.cuentas[position]
+            if text and text not in key:
+                continue
+            if clasificacion and normalize(cuenta['clasificacion']) != clasificacion:
+                continue
+            results.append(cuenta)
+            if limit and len(results) >= limit:
+                break
+        
+        return results
+
+
+def _fingerprint():
+    # Las cuentas solo se insertan, así que (total, id máximo) identifica la versión
+    return tuple(db.session.query(db.func.count(CuentaContable.id), db.func.max(CuentaContable.id)).one())
+
+
+def get_snapshot():
+    """
+    Versión vigente del catálogo
+    
+    Dentro del mismo proceso las escrituras llaman a invalidate(); para ver
+    escrituras de otros procesos se revisa la huella de la tabla cada
+    CATALOG_REVALIDATE_SECONDS.
+    """
+    global _snapshot
+    
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.checked_at < config.CATALOG_REVALIDATE_SECONDS:
+        return snapshot
+    
+    with _lock:
+        fingerprint = _fingerprint()
+        
+        if _snapshot is not None and _snapshot.fingerprint == fingerprint:
+            _snapshot.checked_at = time.monotonic()
+            return _snapshot
+        
+        cuentas = CuentaContable.query.order_by(CuentaContable.id).all()
+        _snapshot = CatalogSnapshot(cuentas, fingerprint)
+        return _snapshot
+
+
+def invalidate():
+    """
+    Descartar la versión en caché (llamar después de escribir al catálogo)
+    """
+    global _snapshot
+    
+    with _lock:
+        _snapshot = None
@@ -8,11 +8,90 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URI', 'sqlite:///financial_reports.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Pool de conexiones (PostgreSQL / MySQL)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    
+    # PRAGMAs que se aplican a cada conexión SQLite
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    
     # Security
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'dev-jwt-secret-key')
     JWT_ALGORITHM = 'HS256'
     JWT_EXPIRATION_HOURS = 24
+    JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 10000))
+    
+    # Hash de contraseñas (formato de werkzeug: 'scrypt:n:r:p' o 'pbkdf2:sha256:iteraciones')
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    PASSWORD_HASH_QUEUE_MAX = int(os.getenv('PASSWORD_HASH_QUEUE_MAX', 4 * (os.cpu_count() or 1)))
+    PASSWORD_HASH_TIMEOUT_SECONDS = float(os.getenv('PASSWORD_HASH_TIMEOUT_SECONDS', 10))
+    
+    # Paginación del listado de reportes
+    REPORTS_PAGE_SIZE_MAX = int(os.getenv('REPORTS_PAGE_SIZE_MAX', 500))
+    
+    # Lectura de varios reportes (/api/reports/batch) y documentos ya
+    # codificados que cada proceso guarda en memoria
+    REPORTS_BATCH_MAX = int(os.getenv('REPORTS_BATCH_MAX', 50))
+    REPORT_CACHE_SIZE = int(os.getenv('REPORT_CACHE_SIZE', 128))
+    
+    # Búsqueda de texto completo: resultados por página, coincidencias que se
+    # califican por búsqueda y diccionario de PostgreSQL
+    SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+    SEARCH_PAGE_SIZE_MAX = int(os.getenv('SEARCH_PAGE_SIZE_MAX', 100))
+    SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 1000))
+    SEARCH_PG_CONFIG = os.getenv('SEARCH_PG_CONFIG', 'spanish')
+    
+    # Ediciones por fila (PATCH): operaciones máximas por petición
+    REPORT_PATCH_MAX_OPS = int(os.getenv('REPORT_PATCH_MAX_OPS', 5000))
+    
+    # Compresión de respuestas (bytes mínimos para comprimir)
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+    BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+    
+    # Documentos guardados por contenido: 'zstd' (si está instalado), 'zlib' o 'identity'
+    PAYLOAD_CODEC = os.getenv('PAYLOAD_CODEC', 'zstd')
+    PAYLOAD_ZSTD_LEVEL = int(os.getenv('PAYLOAD_ZSTD_LEVEL', 3))
+    PAYLOAD_ZLIB_LEVEL = int(os.getenv('PAYLOAD_ZLIB_LEVEL', 6))
+    
+    # Archivo de reportes antiguos: antigüedad (por fecha del reporte),
+    # carpeta y tamaño máximo de cada segmento, reportes por commit
+    ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 730))
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'archive'))
+    ARCHIVE_SEGMENT_MAX_BYTES = int(os.getenv('ARCHIVE_SEGMENT_MAX_BYTES', 256 * 1024 * 1024))
+    ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 50))
+    
+    # Métricas (/api/metrics) y perfilado por petición con el encabezado X-Profile
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    # Obligatorio para perfilar: sin token PROFILING_ENABLED no tiene efecto
+    PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', 5))
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 50))
+    
+    # Caché del catálogo de cuentas
+    CATALOG_REVALIDATE_SECONDS = float(os.getenv('CATALOG_REVALIDATE_SECONDS', 5))
+    CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', 60))
+    
+    # Importación masiva: filas por transacción
+    BULK_IMPORT_BATCH_SIZE = int(os.getenv('BULK_IMPORT_BATCH_SIZE', 1000))
+    BULK_IMPORT_BATCH_SIZE_MAX = int(os.getenv('BULK_IMPORT_BATCH_SIZE_MAX', 10000))
+    
+    # Trabajos en segundo plano (jobs.py)
+    JOBS_WORKERS = int(os.getenv('JOBS_WORKERS', 2))  # hilos de `flask jobs-worker`
+    JOBS_IN_PROCESS_WORKERS = int(os.getenv('JOBS_IN_PROCESS_WORKERS', 0))  # hilos dentro del servidor web
+    JOBS_POLL_SECONDS = float(os.getenv('JOBS_POLL_SECONDS', 1))
+    JOBS_MAX_RUNNING_PER_USER = int(os.getenv('JOBS_MAX_RUNNING_PER_USER', 2))
+    JOBS_MAX_PENDING_PER_USER = int(os.getenv('JOBS_MAX_PENDING_PER_USER', 20))
+    JOBS_STALE_SECONDS = int(os.getenv('JOBS_STALE_SECONDS', 300))
+    JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 3))
     
     # Google OAuth 2.0
     GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
@@ -21,11 +100,45 @@ class Config:
         'GOOGLE_DISCOVERY_URL',
         'https://accounts.google.com/.well-known/openid-configuration'
     )
+    GOOGLE_CERTS_URL = os.getenv(
+        'GOOGLE_CERTS_URL',
+        'https://www.googleapis.com/oauth2/v1/certs'
+    )
+    
+    # Caché de documentos de Google (discovery y certificados)
+    OIDC_CACHE_DEFAULT_MAX_AGE = int(os.getenv('OIDC_CACHE_DEFAULT_MAX_AGE', 3600))
+    OIDC_CACHE_STALE_SECONDS = int(os.getenv('OIDC_CACHE_STALE_SECONDS', 86400))
+    
+    # Pool de conexiones HTTP salientes
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+    HTTP_TIMEOUT_SECONDS = float(os.getenv('HTTP_TIMEOUT_SECONDS', 10))
+    
+    # Servidor ASGI (asgi.py): conexiones del cliente HTTP asíncrono e
+    # hilos que atienden las rutas de Flask
+    ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ASYNC_HTTP_MAX_CONNECTIONS', 100))
+    ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 10))
     
     # URLs
     FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
     BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:5000')
     
+    @property
+    def IS_SQLITE(self):
+        return self.SQLALCHEMY_DATABASE_URI.startswith('sqlite')
+    
+    @property
+    def SQLALCHEMY_ENGINE_OPTIONS(self):
+        if self.IS_SQLITE:
+            # El busy_timeout se aplica como PRAGMA (ver models.apply_sqlite_pragmas)
+            return {'connect_args': {'timeout': self.SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        
+        return {
+            'pool_size': self.DB_POOL_SIZE,
+            'max_overflow': self.DB_MAX_OVERFLOW,
+            'pool_recycle': self.DB_POOL_RECYCLE,
+            'pool_pre_ping': self.DB_POOL_PRE_PING
+        }
+    
     # OAuth redirect URIs
     @property
     def GOOGLE_REDIRECT_URI(self):
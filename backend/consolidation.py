@@ -0,0 +1,423 @@
+"""
+Consolidación de reportes: acumulados por mes y estados financieros
+
+Cada fila de cada reporte se suma en period_balances bajo (usuario,
+programa, mes, origen, cuenta). Al crear o editar un reporte solo se
+aplica la diferencia de las filas tocadas, igual que con ledger_balances,
+así un estado financiero de un año suma unas cuantas filas por cuenta y
+mes en lugar de releer todas las líneas de todos los reportes.
+
+- Registros contables: el mes de la `fecha` de cada fila (o el del
+  reporte si no trae); se acumulan debe y haber.
+- Balance de saldos: el mes del reporte; `monto` es el saldo inicial.
+- Inventario y proceso: el mes del reporte; valor (unidades × costo, o
+  materiales + mano de obra + gastos) y cantidad por producto.
+"""
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import groupby
+
+import archive
+from aggregation import CLASIFICACIONES_ACREEDORAS, CLASIFICACIONES_DEUDORAS, to_cents
+from ledger import cuenta_key
+from models import db, PeriodBalance, Report, ReportLine, split_document
+
+CLASIFICACIONES_BALANCE = CLASIFICACIONES_DEUDORAS + CLASIFICACIONES_ACREEDORAS
+COUNTERS = ('debe_cents', 'haber_cents', 'monto_cents', 'cantidad', 'lineas')
+PROCESS_COSTS = ('materiales', 'manoObra', 'gastosF')
+
+
+def period_of(value):
+    """
+    Mes (YYYYMM) de una fecha, datetime o texto ISO; None si no se puede leer
+    """
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    if isinstance(value, (date, datetime)):
+        return value.year * 100 + value.month
+    return None
+
+
+def period_label(period):
+    return f'{period // 100:04d}-{period % 100:02d}' if period else None
+
+
+def _quantity(value):
+    if isinstance(value, bool):
+        return 0.0
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return result if math.isfinite(result) else 0.0
+
+
+def _value_cents(unidades, costo):
+    try:
+        return to_cents(Decimal(str(unidades or 0)) * Decimal(str(costo or 0)))
+    except ArithmeticError:
+        return 0
+
+
+def _line(section, row, report_period):
+    """
+    (mes, origen, llave, importes) con lo que aporta una fila; None si no aporta
+    """
+    if not isinstance(row, dict):
+        return None
+    
+    if section == '':
+        nombre = row.get('cuenta')
+        key = cuenta_key(nombre)
+        if not key:
+            return None
+        
+        values = {'cuenta': nombre.strip(), 'clasificacion': row.get('clasificacion') or None}
+        if 'debe' in row or 'haber' in row:
+            values.update(debe_cents=to_cents(row.get('debe')), haber_cents=to_cents(row.get('haber')))
+            return period_of(row.get('fecha')) or report_period, 'registros', key, values
+        if 'monto' in row:
+            values['monto_cents'] = to_cents(row.get('monto'))
+            return report_period, 'saldos', key, values
+        return None
+    
+    if section not in ('inventory', 'process'):
+        return None
+    
+    nombre = row.get('producto') or row.get('detalle')
+    key = cuenta_key(nombre)
+    if not key:
+        return None
+    
+    values = {'cuenta': nombre.strip(), 'clasificacion': None}
+    if section == 'inventory':
+        values.update(monto_cents=_value_cents(row.get('unidades'), row.get('costoUnitario')),
+                      cantidad=_quantity(row.get('unidades')))
+    else:
+        values.update(monto_cents=sum(to_cents(row.get(field)) for field in PROCESS_COSTS),
+                      cantidad=_quantity(row.get('cantidad')))
+    return report_period, section, key, values
+
+
+def aggregate_lines(lines, report_date, sign=1, into=None):
+    """
+    Sumar filas [(sección, fila)] en {(mes, origen, llave): acumulados}
+    
+    Con sign=-1 se restan; `into` permite juntar varias sumas con signo.
+    """
+    totals = {} if into is None else into
+    report_period = period_of(report_date)
+    
+    for section, row in lines:
+        line = _line(section, row, report_period)
+        if line is None:
+            continue
+        
+        period, source, key, values = line
+        entry = totals.get((period, source, key))
+        if entry is None:
+            entry = totals[(period, source, key)] = {
+                'cuenta': values['cuenta'],
+                'clasificacion': values['clasificacion'],
+                **dict.fromkeys(COUNTERS, 0)
+            }
+        elif not entry['clasificacion']:
+            entry['clasificacion'] = values['clasificacion']
+        
+        for counter in ('debe_cents', 'haber_cents', 'monto_cents', 'cantidad'):
+            entry[counter] += sign * values.get(counter, 0)
+        entry['lineas'] += sign
+    
+    return totals
+
+
+def aggregate(sections, report_date, sign=1, into=None):
+    """
+    Igual que aggregate_lines, con filas agrupadas [(sección, filas)]
+    """
+    lines = ((section, row) for section, rows in sections for row in rows)
+    return aggregate_lines(lines, report_date, sign, into)
+
+
+# ==================== ACTUALIZACIÓN ====================
+
+def apply_deltas(user_pk, program_id, deltas):
+    """
+    Sumar diferencias (con signo) a period_balances
+    
+    Las filas existentes se incrementan en SQL (sin perder escrituras
+    concurrentes), las nuevas se insertan en bloque y las que se quedan
+    sin líneas se borran.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta[c] for c in COUNTERS)}
+    if not deltas:
+        return
+    
+    program_id = program_id or 0
+    scope = (
+        PeriodBalance.user_id == user_pk,
+        PeriodBalance.program_id == program_id,
+        PeriodBalance.period.in_({period for period, _, _ in deltas}),
+        PeriodBalance.cuenta_key.in_({key for _, _, key in deltas}),
+    )
+    existing = set(db.session.execute(
+        db.select(PeriodBalance.period, PeriodBalance.source, PeriodBalance.cuenta_key).where(*scope)
+    ).tuples())
+    
+    new_rows = []
+    for (period, source, key), delta in deltas.items():
+        if (period, source, key) in existing:
+            db.session.execute(
+                db.update(PeriodBalance)
+                .where(PeriodBalance.user_id == user_pk,
+                       PeriodBalance.program_id == program_id,
+                       PeriodBalance.period == period,
+                       PeriodBalance.source == source,
+                       PeriodBalance.cuenta_key == key)
+                .values({getattr(PeriodBalance, c): getattr(PeriodBalance, c) + delta[c] for c in COUNTERS})
+            )
+        elif delta['lineas'] > 0:
+            new_rows.append({
+                'user_id': user_pk, 'program_id': program_id, 'period': period, 'source': source,
+                'cuenta_key': key, 'cuenta': delta['cuenta'], 'clasificacion': delta['clasificacion'],
+                **{c: delta[c] for c in COUNTERS}
+            })
+    
+    if new_rows:
+        db.session.execute(db.insert(PeriodBalance), new_rows)
+    
+    # Cuentas que se quedaron sin líneas en ese mes, igual que en una reconstrucción
+    db.session.execute(db.delete(PeriodBalance).where(*scope, PeriodBalance.lineas <= 0))
+
+
+def update_for_document(user_pk, program_id, report_date, document):
+    """
+    Sumar un reporte recién guardado a los acumulados por mes
+    """
+    apply_deltas(user_pk, program_id, aggregate(split_document(document)[1], report_date))
+
+
+def update_for_patch(report, old_date, old_rows, new_rows):
+    """
+    Aplicar una edición por filas: se resta la versión anterior de las
+    filas que cambiaron y se suma la nueva
+    
+    Si el reporte cambió de mes, las filas sin fecha propia cambian de
+    mes con él y se recalcula el aporte completo del reporte.
+    """
+    deltas = aggregate(old_rows.items(), old_date, sign=-1)
+    aggregate(new_rows.items(), old_date, into=deltas)
+    
+    if period_of(old_date) != period_of(report.date):
+        lines = list(ReportLine.iter_rows(report.id))
+        aggregate_lines(lines, old_date, sign=-1, into=deltas)
+        aggregate_lines(lines, report.date, into=deltas)
+    
+    apply_deltas(report.user_id, report.program_id, deltas)
+
+
+def rebuild_period_balances(user_pk=None):
+    """
+    Reconstruir period_balances desde report_lines en una sola pasada
+    
+    Los reportes archivados se suman desde su documento en el archivo.
+    """
+    program = db.func.coalesce(Report.program_id, 0)
+    delete = db.delete(PeriodBalance)
+    query = (
+        db.select(Report.user_id.label('owner'), program.label('program'),
+                  Report.date.label('report_date'), ReportLine.__table__)
+        .join(Report, Report.id == ReportLine.report_id)
+        .order_by(Report.user_id, program)
+        .execution_options(yield_per=ReportLine.BATCH_SIZE)
+    )
+    if user_pk is not None:
+        delete = delete.where(PeriodBalance.user_id == user_pk)
+        query = query.where(Report.user_id == user_pk)
+    
+    db.session.execute(delete)
+    
+    records = db.session.execute(query).mappings()
+    for (owner, program_id), group in groupby(records, key=lambda r: (r['owner'], r['program'])):
+        totals = {}
+        for report_date, lines in groupby(group, key=lambda r: r['report_date']):
+            aggregate_lines(((r['section'], ReportLine.row_from_record(r)) for r in lines),
+                            report_date, into=totals)
+        apply_deltas(owner, program_id, totals)
+    
+    for report, document in archive.iter_documents(user_pk):
+        update_for_document(report.user_id, report.program_id, report.date, document)
+
+
+# ==================== ESTADOS FINANCIEROS ====================
+
+def _pesos(cents):
+    return round(cents / 100, 2)
+
+
+def _sums(user_pk, program_id, *conditions):
+    """
+    Acumulados por (origen, cuenta) que cumplen las condiciones
+    """
+    query = (
+        db.select(PeriodBalance.source, PeriodBalance.cuenta_key,
+                  db.func.min(PeriodBalance.cuenta), db.func.max(PeriodBalance.clasificacion),
+                  *[db.func.sum(getattr(PeriodBalance, c)) for c in COUNTERS])
+        .where(PeriodBalance.user_id == user_pk, *conditions)
+        .group_by(PeriodBalance.source, PeriodBalance.cuenta_key)
+        .order_by(PeriodBalance.cuenta_key)
+    )
+    if program_id is not None:
+        query = query.where(PeriodBalance.program_id == program_id)
+    
+    return db.session.execute(query).all()
+
+
+def balance_general(user_pk, hasta, program_id=None):
+    """
+    Saldos por cuenta al cierre del mes de `hasta`
+    
+    Se parte del balance de saldos más reciente hasta esa fecha (si hay) y
+    se le suman los registros desde su mes. Las cuentas que no son de
+    activo, pasivo o capital se reportan como resultado del periodo.
+    """
+    until = period_of(hasta)
+    
+    opening_query = db.select(db.func.max(PeriodBalance.period)).where(
+        PeriodBalance.user_id == user_pk,
+        PeriodBalance.source == 'saldos',
+        PeriodBalance.period <= until
+    )
+    if program_id is not None:
+        opening_query = opening_query.where(PeriodBalance.program_id == program_id)
+    opening = db.session.scalar(opening_query)
+    
+    conditions = [PeriodBalance.source.in_(('saldos', 'registros')), PeriodBalance.period <= until]
+    if opening:
+        conditions.append(PeriodBalance.period >= opening)
+    
+    cuentas = {}
+    for source, key, cuenta, clasificacion, debe, haber, monto, _, _ in _sums(user_pk, program_id, *conditions):
+        entry = cuentas.setdefault(key, {'cuenta': cuenta, 'clasificacion': clasificacion,
+                                         'inicial': 0, 'debe': 0, 'haber': 0})
+        entry['clasificacion'] = entry['clasificacion'] or clasificacion
+        if source == 'saldos':
+            entry['inicial'] += monto
+        else:
+            entry['debe'] += debe
+            entry['haber'] += haber
+    
+    grupos = {clasificacion: [] for clasificacion in CLASIFICACIONES_BALANCE}
+    totales = dict.fromkeys(CLASIFICACIONES_BALANCE, 0)
+    resultado = 0
+    
+    for entry in cuentas.values():
+        if entry['clasificacion'] in CLASIFICACIONES_DEUDORAS:
+            saldo = entry['inicial'] + entry['debe'] - entry['haber']
+        else:
+            saldo = entry['inicial'] + entry['haber'] - entry['debe']
+        
+        if entry['clasificacion'] in grupos:
+            grupos[entry['clasificacion']].append({
+                'cuenta': entry['cuenta'],
+                'saldoInicial': _pesos(entry['inicial']),
+                'debe': _pesos(entry['debe']),
+                'haber': _pesos(entry['haber']),
+                'saldo': _pesos(saldo)
+            })
+            totales[entry['clasificacion']] += saldo
+        else:
+            resultado += saldo
+    
+    pasivo_capital = sum(totales[c] for c in CLASIFICACIONES_ACREEDORAS) + resultado
+    deudor = sum(totales[c] for c in CLASIFICACIONES_DEUDORAS)
+    
+    return {
+        'hasta': period_label(until),
+        'saldosDesde': period_label(opening),
+        'cuentas': grupos,
+        'totales': {clasificacion: _pesos(total) for clasificacion, total in totales.items()},
+        'resultadoDelPeriodo': _pesos(resultado),
+        'diferencia': _pesos(deudor - pasivo_capital),
+        'cuadra': deudor == pasivo_capital
+    }
+
+
+def estado_resultados(user_pk, desde, hasta, program_id=None):
+    """
+    Movimientos de los meses entre `desde` y `hasta`
+    
+    Las cuentas de resultados son las de registros cuya clasificación no es
+    de balance; su saldo (haber - debe) suma a la utilidad. Se incluyen los
+    movimientos por clasificación de balance y el valor de inventario y de
+    producción del periodo.
+    """
+    since, until = period_of(desde), period_of(hasta)
+    rows = _sums(user_pk, program_id, PeriodBalance.period >= since, PeriodBalance.period <= until)
+    
+    resultados = []
+    movimientos = {clasificacion: {'debe': 0, 'haber': 0} for clasificacion in CLASIFICACIONES_BALANCE}
+    productos = {'inventory': {'valor': 0, 'cantidad': 0.0, 'productos': 0},
+                 'process': {'valor': 0, 'cantidad': 0.0, 'productos': 0}}
+    utilidad = 0
+    
+    for source, key, cuenta, clasificacion, debe, haber, monto, cantidad, _ in rows:
+        if source in productos:
+            productos[source]['valor'] += monto
+            productos[source]['cantidad'] += cantidad
+            productos[source]['productos'] += 1
+        elif source == 'registros' and clasificacion in movimientos:
+            movimientos[clasificacion]['debe'] += debe
+            movimientos[clasificacion]['haber'] += haber
+        elif source == 'registros':
+            resultados.append({
+                'cuenta': cuenta,
+                'clasificacion': clasificacion,
+                'debe': _pesos(debe),
+                'haber': _pesos(haber),
+                'saldo': _pesos(haber - debe)
+            })
+            utilidad += haber - debe
+    
+    return {
+        'desde': period_label(since),
+        'hasta': period_label(until),
+        'cuentasDeResultados': resultados,
+        'utilidad': _pesos(utilidad),
+        'movimientos': {
+            clasificacion: {'debe': _pesos(m['debe']), 'haber': _pesos(m['haber'])}
+            for clasificacion, m in movimientos.items()
+        },
+        'inventario': {**productos['inventory'], 'valor': _pesos(productos['inventory']['valor']),
+                       'cantidad': round(productos['inventory']['cantidad'], 4)},
+        'produccion': {**productos['process'], 'valor': _pesos(productos['process']['valor']),
+                       'cantidad': round(productos['process']['cantidad'], 4)}
+    }
+
+
+def monthly_totals(user_pk, desde, hasta, program_id=None):
+    """
+    Totales por mes y origen (para gráficas y comparativos)
+    """
+    query = (
+        db.select(PeriodBalance.period, PeriodBalance.source,
+                  *[db.func.sum(getattr(PeriodBalance, c)) for c in COUNTERS])
+        .where(PeriodBalance.user_id == user_pk,
+               PeriodBalance.period >= period_of(desde),
+               PeriodBalance.period <= period_of(hasta))
+        .group_by(PeriodBalance.period, PeriodBalance.source)
+        .order_by(PeriodBalance.period, PeriodBalance.source)
+    )
+    if program_id is not None:
+        query = query.where(PeriodBalance.program_id == program_id)
+    
+    return [
+        {'periodo': period_label(period), 'origen': source,
+         'debe': _pesos(debe), 'haber': _pesos(haber), 'monto': _pesos(monto),
+         'cantidad': round(cantidad, 4), 'lineas': lineas}
+        for period, source, debe, haber, monto, cantidad, lineas in db.session.execute(query)
+    ]
@@ -0,0 +1,369 @@
+"""
+Costeo de inventarios: PEPS, UEPS y costo promedio
+
+Los movimientos se guardan en arreglos columnares (NumPy) y se procesan en
+orden de fecha con un solo recorrido. Cada producto guarda sus capas de
+costo en dos array('d') (unidades y costo unitario) con un índice de
+inicio, así PEPS consume por el frente y UEPS por el final sin mover
+memoria; el costo promedio solo necesita unidades y valor acumulados.
+"""
+import heapq
+import json
+from array import array
+from datetime import date
+
+import numpy as np
+
+import archive
+from models import db, Report, ReportLine
+
+METHODS = ('peps', 'ueps', 'promedio')
+INVENTORY_REPORT_TYPE = 'Inventario y Productos en Proceso'
+
+# Cantidades menores se consideran cero
+EPSILON = 1e-9
+
+# Compactar las capas de PEPS cuando el frente consumido pasa de este tamaño
+COMPACT_AFTER = 64
+
+
+def _number(value, field, index):
+    if isinstance(value, bool):
+        raise ValueError(f'Movimiento {index}: `{field}` debe ser numérico')
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Movimiento {index}: `{field}` debe ser numérico')
+    if not np.isfinite(result):
+        raise ValueError(f'Movimiento {index}: `{field}` debe ser numérico')
+    return result
+
+
+class Movements:
+    """
+    Movimientos de inventario en columnas
+    
+    `unidades` es positivo en las entradas y negativo en las salidas; el
+    costo unitario solo se usa en las entradas.
+    """
+    
+    def __init__(self, productos, codes, fechas, unidades, costos):
+        self.productos = productos
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.fechas = np.asarray(fechas, dtype=np.int64)  # date.toordinal()
+        self.unidades = np.asarray(unidades, dtype=np.float64)
+        self.costos = np.asarray(costos, dtype=np.float64)
+    
+    def __len__(self):
+        return len(self.codes)
+    
+    @classmethod
+    def from_records(cls, records):
+        """
+        Construir desde filas {producto, fecha, unidades, costoUnitario, tipo}
+        
+        `tipo` es opcional: 'entrada' o 'salida'. Sin él, las unidades
+        negativas son salidas.
+        """
+        labels = {}
+        codes, fechas, unidades, costos = [], [], [], []
+        
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise ValueError(f'Movimiento {index}: debe ser un objeto')
+            
+            producto = record.get('producto')
+            if not isinstance(producto, str) or not producto.strip():
+                raise ValueError(f'Movimiento {index}: falta `producto`')
+            
+            try:
+                fecha = date.fromisoformat(record.get('fecha'))
+            except (TypeError, ValueError):
+                raise ValueError(f'Movimiento {index}: fecha inválida, usa el formato YYYY-MM-DD')
+            
+            cantidad = _number(record.get('unidades', 0), 'unidades', index)
+            tipo = record.get('tipo')
+            if tipo == 'entrada':
+                cantidad = abs(cantidad)
+            elif tipo == 'salida':
+                cantidad = -abs(cantidad)
+            elif tipo is not None:
+                raise ValueError(f"Movimiento {index}: `tipo` debe ser 'entrada' o 'salida'")
+            
+            costo = _number(record.get('costoUnitario') or 0, 'costoUnitario', index)
+            
+            codes.append(labels.setdefault(producto.strip(), len(labels)))
+            fechas.append(fecha.toordinal())
+            unidades.append(cantidad)
+            costos.append(costo)
+        
+        return cls(list(labels), codes, fechas, unidades, costos)
+    
+    def order(self):
+        """
+        Índices en orden de fecha; los movimientos del mismo día conservan
+        su orden original (ordenamiento estable, O(n log n))
+        """
+        if len(self.fechas) < 2 or bool(np.all(self.fechas[1:] >= self.fechas[:-1])):
+            return np.arange(len(self.fechas))
+        return np.argsort(self.fechas, kind='stable')
+
+
+class ProductState:
+    """
+    Existencias de un producto: capas de costo y acumulados
+    """
+    __slots__ = ('units', 'costs', 'head', 'on_hand', 'value', 'cost_of_sales', 'shortfall')
+    
+    def __init__(self):
+        self.units = array('d')
+        self.costs = array('d')
+        self.head = 0
+        self.on_hand = 0.0
+        self.value = 0.0
+        self.cost_of_sales = 0.0
+        self.shortfall = 0.0
+    
+    def layers(self):
+        return [
+            {'unidades': round(units, 4), 'costoUnitario': round(cost, 4)}
+            for units, cost in zip(self.units[self.head:], self.costs[self.head:])
+        ]
+
+
+class CostingEngine:
+    """
+    Valuación incremental de inventario con un método de costeo
+    
+    apply() se puede llamar varias veces con movimientos posteriores a los
+    ya procesados; el estado se conserva entre llamadas.
+    """
+    
+    def __init__(self, method):
+        if method not in METHODS:
+            raise ValueError(f"Método de costeo inválido, usa {', '.join(METHODS)}")
+        
+        self.method = method
+        self.products = {}
+        self.last_fecha = None
+        
+        if method == 'promedio':
+            self._receive, self._issue = self._receive_average, self._issue_average
+        elif method == 'peps':
+            self._receive, self._issue = self._receive_layer, self._issue_fifo
+        else:
+            self._receive, self._issue = self._receive_layer, self._issue_lifo
+    
+    def apply(self, movements, snapshot_dates=(), producto=None, capas=False):
+        """
+        Procesar movimientos y tomar una foto del inventario al cierre de
+        cada fecha de `snapshot_dates`
+        """
+        order = movements.order()
+        fechas = movements.fechas[order]
+        
+        if self.last_fecha is not None and len(fechas) and int(fechas[0]) < self.last_fecha:
+            raise ValueError('Los movimientos nuevos deben ser posteriores a los ya procesados')
+        
+        states = [self.products.setdefault(name, ProductState()) for name in movements.productos]
+        pending = sorted(fecha.toordinal() for fecha in snapshot_dates)
+        snapshots = []
+        receive, issue = self._receive, self._issue
+        
+        for code, fecha, cantidad, costo in zip(movements.codes[order].tolist(), fechas.tolist(),
+                                                movements.unidades[order].tolist(),
+                                                movements.costos[order].tolist()):
+            while pending and fecha > pending[0]:
+                snapshots.append(self.snapshot(pending.pop(0), producto, capas))
+            
+            if cantidad > 0:
+                receive(states[code], cantidad, costo)
+            elif cantidad < 0:
+                issue(states[code], -cantidad)
+        
+        if len(fechas):
+            self.last_fecha = max(self.last_fecha or 0, int(fechas[-1]))
+        
+        snapshots.extend(self.snapshot(fecha, producto, capas) for fecha in pending)
+        return snapshots
+    
+    def _receive_average(self, state, cantidad, costo):
+        state.on_hand += cantidad
+        state.value += cantidad * costo
+    
+    def _issue_average(self, state, cantidad):
+        taken = min(cantidad, state.on_hand)
+        cost = state.value * taken / state.on_hand if state.on_hand > EPSILON else 0.0
+        
+        state.on_hand -= taken
+        state.value = state.value - cost if state.on_hand > EPSILON else 0.0
+        state.cost_of_sales += cost
+        state.shortfall += cantidad - taken
+    
+    def _receive_layer(self, state, cantidad, costo):
+        state.units.append(cantidad)
+        state.costs.append(costo)
+        state.on_hand += cantidad
+        state.value += cantidad * costo
+    
+    def _issue_fifo(self, state, cantidad):
+        units, costs = state.units, state.costs
+        head = state.head
+        remaining = cantidad
+        cost = 0.0
+        
+        while remaining > EPSILON and head < len(units):
+            taken = min(units[head], remaining)
+            cost += taken * costs[head]
+            remaining -= taken
+            units[head] -= taken
+            if units[head] <= EPSILON:
+                head += 1
+        
+        # Descartar el frente consumido cuando ocupa más de la mitad
+        if head > COMPACT_AFTER and head * 2 > len(units):
+            del units[:head]
+            del costs[:head]
+            head = 0
+        
+        state.head = head
+        self._settle(state, cantidad, remaining, cost)
+    
+    def _issue_lifo(self, state, cantidad):
+        units, costs = state.units, state.costs
+        remaining = cantidad
+        cost = 0.0
+        
+        while remaining > EPSILON and len(units) > state.head:
+            taken = min(units[-1], remaining)
+            cost += taken * costs[-1]
+            remaining -= taken
+            units[-1] -= taken
+            if units[-1] <= EPSILON:
+                units.pop()
+                costs.pop()
+        
+        self._settle(state, cantidad, remaining, cost)
+    
+    @staticmethod
+    def _settle(state, cantidad, remaining, cost):
+        remaining = max(remaining, 0.0)
+        state.on_hand -= cantidad - remaining
+        state.value = state.value - cost if state.on_hand > EPSILON else 0.0
+        state.cost_of_sales += cost
+        state.shortfall += remaining
+    
+    def snapshot(self, fecha=None, producto=None, capas=False):
+        """
+        Existencias y valor por producto con lo procesado hasta ahora
+        """
+        productos = []
+        totals = {'unidades': 0.0, 'valor': 0.0, 'costoVentas': 0.0}
+        
+        for name in sorted(self.products):
+            if producto and name != producto:
+                continue
+            
+            state = self.products[name]
+            on_hand = state.on_hand if state.on_hand > EPSILON else 0.0
+            entry = {
+                'producto': name,
+                'unidades': round(on_hand, 4),
+                'valor': round(state.value, 2),
+                'costoUnitario': round(state.value / on_hand, 4) if on_hand else 0,
+                'costoVentas': round(state.cost_of_sales, 2),
+                'unidadesFaltantes': round(state.shortfall, 4)
+            }
+            if capas and self.method != 'promedio':
+                entry['capas'] = state.layers()
+            
+            productos.append(entry)
+            totals['unidades'] += on_hand
+            totals['valor'] += state.value
+            totals['costoVentas'] += state.cost_of_sales
+        
+        if fecha is None and self.last_fecha is not None:
+            fecha = self.last_fecha
+        
+        return {
+            'fecha': date.fromordinal(fecha).isoformat() if fecha else None,
+            'productos': productos,
+            'totals': {
+                'unidades': round(totals['unidades'], 4),
+                'valor': round(totals['valor'], 2),
+                'costoVentas': round(totals['costoVentas'], 2)
+            }
+        }
+
+
+def valuate(movements, method, snapshot_dates=(), producto=None, capas=False):
+    """
+    Valuar un flujo de movimientos; sin fechas de corte regresa una sola
+    foto con todos los movimientos
+    """
+    engine = CostingEngine(method)
+    snapshots = engine.apply(movements, snapshot_dates, producto, capas)
+    return snapshots or [engine.snapshot(producto=producto, capas=capas)]
+
+
+def movements_from_reports(user_pk, producto=None):
+    """
+    Movimientos a partir de las filas de inventario de los reportes del
+    usuario: cada fila es una entrada en la fecha del reporte, salvo que
+    sus unidades sean negativas o traiga tipo='salida'
+    
+    Las filas de los reportes archivados se leen de su documento y se
+    intercalan en el mismo orden (fecha, reporte).
+    """
+    query = (
+        db.select(Report.date, Report.id, ReportLine.producto, ReportLine.unidades,
+                  ReportLine.costo_unitario, ReportLine.extra)
+        .join(Report, Report.id == ReportLine.report_id)
+        .where(Report.user_id == user_pk,
+               Report.report_type == INVENTORY_REPORT_TYPE,
+               ReportLine.section == 'inventory',
+               ReportLine.producto.isnot(None))
+        .order_by(Report.date, Report.id, ReportLine.position)
+        .execution_options(yield_per=ReportLine.BATCH_SIZE)
+    )
+    if producto:
+        query = query.where(ReportLine.producto == producto)
+    
+    labels = {}
+    codes, fechas, unidades, costos = [], [], [], []
+    
+    records = heapq.merge(db.session.execute(query), _archived_records(user_pk, producto),
+                          key=lambda record: record[:2])
+    
+    for fecha, _, nombre, cantidad, costo, extra in records:
+        nombre = nombre.strip()
+        if not nombre:
+            continue
+        
+        cantidad = cantidad or 0.0
+        if extra:
+            tipo = json.loads(extra).get('tipo')
+            if tipo == 'salida':
+                cantidad = -abs(cantidad)
+            elif tipo == 'entrada':
+                cantidad = abs(cantidad)
+        
+        codes.append(labels.setdefault(nombre, len(labels)))
+        fechas.append(fecha.toordinal())
+        unidades.append(cantidad)
+        costos.append(costo or 0.0)
+    
+    return Movements(list(labels), codes, fechas, unidades, costos)
+
+
+def _archived_records(user_pk, producto=None):
+    # Mismas columnas que la consulta de movements_from_reports
+    for report, document in archive.iter_documents(user_pk, report_type=INVENTORY_REPORT_TYPE):
+        rows = document.get('inventory', {}).get('rows', []) if isinstance(document, dict) else []
+        for row in rows:
+            mapping = ReportLine.mapping_from_row(row)
+            nombre = mapping.get('producto')
+            if nombre is None or (producto and nombre != producto):
+                continue
+            yield (report.date, report.id, nombre, mapping.get('unidades'),
+                   mapping.get('costo_unitario'), mapping['extra'])
@@ -0,0 +1,169 @@
+"""
+Exportación en streaming de las líneas de reportes (CSV, NDJSON, XLSX)
+
+Las líneas se leen de report_lines en lotes (yield_per) y se escriben al
+vuelo, así que la memoria no crece con el tamaño de la exportación. Las de
+reportes archivados se leen de su documento, uno a la vez, y se intercalan
+en el mismo orden.
+"""
+import csv
+import heapq
+import io
+import json
+import os
+import tempfile
+
+import archive
+from models import db, Report, ReportLine, split_document
+
+REPORT_COLUMNS = ['reportId', 'reportName', 'reportType', 'reportDate', 'section']
+LINE_COLUMNS = list(ReportLine.FIELDS)
+COLUMNS = REPORT_COLUMNS + LINE_COLUMNS
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Filas acumuladas antes de enviar un bloque al cliente
+FLUSH_EVERY = 500
+
+
+def iter_lines(user_pk, report_type=None, program_id=None, date_from=None, date_to=None):
+    """
+    Recorrer las líneas de los reportes de un usuario como diccionarios
+    planos (datos del reporte + campos de la fila), en orden de (fecha,
+    reporte)
+    """
+    filters = dict(report_type=report_type, program_id=program_id, date_from=date_from, date_to=date_to)
+    yield from heapq.merge(_iter_report_lines(user_pk, **filters), _iter_archived_lines(user_pk, **filters),
+                           key=lambda line: (line['reportDate'], line['reportId']))
+
+
+def _iter_report_lines(user_pk, report_type, program_id, date_from, date_to):
+    query = (
+        db.select(Report.id.label('report_id'), Report.name.label('report_name'),
+                  Report.report_type, Report.date.label('report_date'),
+                  *[c for c in ReportLine.__table__.c if c.name not in ('id', 'report_id')])
+        .join(ReportLine, ReportLine.report_id == Report.id)
+        .where(Report.user_id == user_pk)
+        .order_by(Report.date, Report.id, ReportLine.section, ReportLine.position)
+        .execution_options(yield_per=ReportLine.BATCH_SIZE)
+    )
+    
+    if report_type:
+        query = query.where(Report.report_type == report_type)
+    if program_id is not None:
+        query = query.where(Report.program_id == program_id)
+    if date_from:
+        query = query.where(Report.date >= date_from)
+    if date_to:
+        query = query.where(Report.date <= date_to)
+    
+    for record in db.session.execute(query).mappings():
+        yield {
+            'reportId': record['report_id'],
+            'reportName': record['report_name'],
+            'reportType': record['report_type'],
+            'reportDate': record['report_date'].isoformat(),
+            'section': record['section'],
+            **ReportLine.row_from_record(record)
+        }
+
+
+def _iter_archived_lines(user_pk, **filters):
+    for report, document in archive.iter_documents(user_pk, **filters):
+        _, sections = split_document(document)
+        for section, rows in sorted(sections, key=lambda item: item[0]):
+            for row in rows:
+                yield {
+                    'reportId': report.id,
+                    'reportName': report.name,
+                    'reportType': report.report_type,
+                    'reportDate': report.date.isoformat(),
+                    'section': section,
+                    # Mismo orden de campos que row_from_record
+                    **{key: row[key] for key in LINE_COLUMNS if key in row},
+                    **row
+                }
+
+
+def generate_csv(lines):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    
+    for count, line in enumerate(lines, 1):
+        writer.writerow(line)
+        if count % FLUSH_EVERY == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    yield buffer.getvalue()
+
+
+def generate_ndjson(lines):
+    chunk = []
+    
+    for line in lines:
+        chunk.append(json.dumps(line, ensure_ascii=False))
+        if len(chunk) == FLUSH_EVERY:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def generate_xlsx(lines, chunk_size=64 * 1024):
+    """
+    XLSX en modo write-only: las filas van a un archivo temporal (el
+    formato no permite escribirlo de forma incremental al socket) y luego
+    se envía en bloques
+    """
+    from openpyxl import Workbook
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Lineas')
+    sheet.append(COLUMNS)
+    
+    for line in lines:
+        sheet.append([_cell(line.get(column)) for column in COLUMNS])
+    
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+def _cell(value):
+    # Celdas de XLSX: solo tipos simples
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def xlsx_available():
+    try:
+        import openpyxl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+GENERATORS = {
+    'csv': generate_csv,
+    'ndjson': generate_ndjson,
+    'xlsx': generate_xlsx,
+}
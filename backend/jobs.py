@@ -0,0 +1,549 @@
+"""
+Cola de trabajos en segundo plano respaldada por la base de datos
+
+Las rutas encolan el trabajo (tabla `jobs`) y responden 202 de inmediato;
+workers en hilos lo toman, lo ejecutan y guardan el resultado, el avance o
+el error. Los workers pueden correr dentro del servidor web
+(JOBS_IN_PROCESS_WORKERS) o en un proceso aparte:
+
+    flask --app app jobs-worker --threads 4
+
+- Toma: en PostgreSQL con SELECT ... FOR UPDATE SKIP LOCKED; en SQLite,
+  que no bloquea filas, con un UPDATE condicional sobre `status`.
+- Límites por usuario: trabajos en ejecución a la vez
+  (JOBS_MAX_RUNNING_PER_USER) y pendientes en total
+  (JOBS_MAX_PENDING_PER_USER).
+- Un trabajo cuyo worker deja de renovar su heartbeat por
+  JOBS_STALE_SECONDS vuelve a la cola (hasta JOBS_MAX_ATTEMPTS intentos).
+- Los trabajos que hacen commit por lotes deben poder retomarse:
+  `reports.import` guarda su avance (`checkpoint`) en la misma
+  transacción que cada lote y `reports.archive` solo toma reportes aún
+  sin archivar.
+"""
+import io
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import click
+
+import archive
+import bulk_import
+import consolidation
+import costing
+import ledger
+import report_service
+from config import config
+from models import db, Job, LedgerBalance, User
+
+STATUSES = ('queued', 'running', 'succeeded', 'failed', 'canceled')
+PENDING_STATUSES = ('queued', 'running')
+
+# Intentos de toma por vuelta cuando otro worker gana la carrera (SQLite)
+CLAIM_RETRIES = 3
+
+# kind -> (función, validador de params)
+HANDLERS = {}
+
+# Despierta a los workers del proceso cuando se encola algo
+_wakeup = threading.Condition()
+
+
+class JobValidationError(ValueError):
+    """
+    El trabajo pedido no es válido (se responde con 400)
+    """
+
+
+class JobLimitError(Exception):
+    """
+    El usuario ya tiene demasiados trabajos pendientes (se responde con 429)
+    """
+
+
+class JobLostError(Exception):
+    """
+    El trabajo volvió a la cola o lo tomó otro worker mientras corría
+    """
+
+
+def job_handler(kind, validate=None):
+    """
+    Registrar la función que ejecuta un tipo de trabajo
+    
+    `validate(params, payload)` se llama al encolar y lanza
+    JobValidationError si los datos no sirven.
+    """
+    def decorator(function):
+        HANDLERS[kind] = (function, validate)
+        return function
+    return decorator
+
+
+class JobContext:
+    """
+    Lo que recibe la función de un trabajo
+    """
+    
+    def __init__(self, job, worker_id):
+        self.job_id = job.id
+        self.user_pk = job.user_id
+        self.worker_id = worker_id
+        self.params = json.loads(job.params) if job.params else {}
+        self.payload = job.payload
+        self.checkpoint = json.loads(job.checkpoint) if job.checkpoint else None
+    
+    def progress(self, percent, message=None):
+        """
+        Guardar el avance (0 a 100) y renovar el heartbeat
+        
+        Hace commit de la transacción en curso: llamarlo solo entre pasos
+        ya completos del trabajo.
+        """
+        db.session.execute(
+            db.update(Job)
+            .where(Job.id == self.job_id, Job.locked_by == self.worker_id)
+            .values(progress=min(max(percent, 0), 100),
+                    message=message[:200] if message else None,
+                    heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    
+    def save_checkpoint(self, state):
+        """
+        Guardar hasta dónde llegó el trabajo, sin hacer commit
+        
+        Debe ir en la misma transacción que lo que registra, para que un
+        reintento retome exactamente desde ahí. Lanza JobLostError si el
+        trabajo ya no es de este worker, y así el lote se descarta.
+        """
+        saved = db.session.execute(
+            db.update(Job)
+            .where(Job.id == self.job_id, Job.locked_by == self.worker_id)
+            .values(checkpoint=json.dumps(state), heartbeat_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not saved:
+            raise JobLostError(f'El trabajo {self.job_id} ya no pertenece a {self.worker_id}')
+        self.checkpoint = state
+
+
+# ==================== COLA ====================
+
+def enqueue(user_pk, kind, params=None, payload=None):
+    """
+    Encolar un trabajo (no hace commit; después llamar a wake())
+    """
+    if kind not in HANDLERS:
+        raise JobValidationError(f'Tipo de trabajo desconocido: {kind}')
+    
+    params = params or {}
+    _, validate = HANDLERS[kind]
+    if validate:
+        validate(params, payload)
+    
+    pending = db.session.scalar(
+        db.select(db.func.count()).select_from(Job)
+        .where(Job.user_id == user_pk, Job.status.in_(PENDING_STATUSES))
+    )
+    if pending >= config.JOBS_MAX_PENDING_PER_USER:
+        raise JobLimitError(
+            f'Tienes {pending} trabajos pendientes; espera a que terminen (máximo '
+            f'{config.JOBS_MAX_PENDING_PER_USER})'
+        )
+    
+    job = Job(user_id=user_pk, kind=kind, params=json.dumps(params), payload=payload)
+    db.session.add(job)
+    db.session.flush()
+    
+    return job
+
+
+def wake():
+    """
+    Avisar a los workers de este proceso que hay trabajo nuevo; los de
+    otros procesos lo verán en su siguiente sondeo
+    """
+    with _wakeup:
+        _wakeup.notify_all()
+
+
+def cancel(job_id):
+    """
+    Cancelar un trabajo que todavía no empezó; False si ya está en curso
+    o terminado
+    """
+    canceled = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == 'queued')
+        .values(status='canceled', finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return canceled == 1
+
+
+def _running_count(user_pk):
+    return (
+        db.select(db.func.count()).select_from(Job)
+        .where(Job.user_id == user_pk, Job.status == 'running')
+        .scalar_subquery()
+    )
+
+
+def claim_next(worker_id):
+    """
+    Tomar el siguiente trabajo en cola, respetando el límite por usuario
+    
+    En PostgreSQL la fila candidata se bloquea con SKIP LOCKED (varios
+    workers toman trabajos distintos sin esperarse) y se bloquea también al
+    usuario para que dos workers no rebasen su límite a la vez. En SQLite
+    la escritura ya es exclusiva: el UPDATE condicional solo gana si el
+    trabajo sigue en cola y el usuario sigue bajo su límite.
+    """
+    limit = config.JOBS_MAX_RUNNING_PER_USER
+    busy_users = (
+        db.select(Job.user_id)
+        .where(Job.status == 'running')
+        .group_by(Job.user_id)
+        .having(db.func.count() >= limit)
+    )
+    query = (
+        db.select(Job.id, Job.user_id)
+        .where(Job.status == 'queued', Job.user_id.not_in(busy_users))
+        .order_by(Job.id)
+        .limit(1)
+    )
+    if not config.IS_SQLITE:
+        query = query.with_for_update(skip_locked=True)
+    
+    for _ in range(CLAIM_RETRIES):
+        candidate = db.session.execute(query).first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+        
+        if not config.IS_SQLITE:
+            db.session.execute(
+                db.select(User.id).where(User.id == candidate.user_id).with_for_update()
+            )
+        
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            db.update(Job)
+            .where(Job.id == candidate.id, Job.status == 'queued',
+                   _running_count(candidate.user_id) < limit)
+            .values(status='running', locked_by=worker_id, attempts=Job.attempts + 1,
+                    started_at=now, heartbeat_at=now, progress=0, message=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        
+        if claimed:
+            return db.session.get(Job, candidate.id)
+    
+    return None
+
+
+def _finish(job_id, worker_id, status, **values):
+    """
+    Cerrar un trabajo solo si sigue siendo de este worker
+    """
+    finished = db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == 'running', Job.locked_by == worker_id)
+        .values(status=status, locked_by=None, finished_at=datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return finished == 1
+
+
+def run(job, worker_id):
+    """
+    Ejecutar un trabajo ya tomado
+    
+    El resultado y el cambio de estado se guardan en la misma transacción
+    que el trabajo: si entretanto se dio por caído y volvió a la cola, lo
+    hecho se descarta. Los trabajos que hacen commit por lotes no pueden
+    descartar lo ya guardado; por eso un reintento retoma desde su
+    `checkpoint`, y si el trabajo falla, los lotes anteriores quedan
+    guardados y el checkpoint dice hasta dónde llegó.
+    """
+    job_id, kind = job.id, job.kind
+    
+    try:
+        function, _ = HANDLERS[kind]
+        result = function(JobContext(job, worker_id))
+        
+        if _finish(job_id, worker_id, 'succeeded', progress=100, message=None,
+                   result=json.dumps(result)):
+            db.session.commit()
+        else:
+            db.session.rollback()
+            print(f"⚠️ El trabajo {job_id} ya no pertenece a {worker_id}; se descarta su resultado")
+    except Exception as e:
+        db.session.rollback()
+        print(f"❌ Error en trabajo {job_id} ({kind}): {str(e)}")
+        _finish(job_id, worker_id, 'failed', error=str(e))
+        db.session.commit()
+
+
+def heartbeat(worker_ids):
+    """
+    Renovar el heartbeat de los trabajos en curso de estos workers
+    """
+    db.session.execute(
+        db.update(Job)
+        .where(Job.status == 'running', Job.locked_by.in_(worker_ids))
+        .values(heartbeat_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def requeue_stale():
+    """
+    Devolver a la cola los trabajos cuyo worker dejó de dar señales, o
+    marcarlos como fallidos si ya agotaron sus intentos
+    """
+    now = datetime.utcnow()
+    stale = (Job.status == 'running',
+             Job.heartbeat_at < now - timedelta(seconds=config.JOBS_STALE_SECONDS))
+    
+    requeued = db.session.execute(
+        db.update(Job)
+        .where(*stale, Job.attempts < config.JOBS_MAX_ATTEMPTS)
+        .values(status='queued', locked_by=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    failed = db.session.execute(
+        db.update(Job)
+        .where(*stale)
+        .values(status='failed', locked_by=None, finished_at=now,
+                error='El worker dejó de responder')
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    
+    return requeued, failed
+
+
+# ==================== WORKERS ====================
+
+class Worker:
+    """
+    Hilos que toman y ejecutan trabajos, más uno de mantenimiento que
+    renueva el heartbeat de los trabajos en curso y recupera los de
+    workers caídos
+    """
+    
+    def __init__(self, app, threads):
+        prefix = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.app = app
+        self.worker_ids = [f'{prefix}:{n}' for n in range(threads)]
+        self._stopped = threading.Event()
+        self._threads = []
+    
+    def start(self):
+        targets = [(self._work, (worker_id,)) for worker_id in self.worker_ids]
+        targets.append((self._maintain, ()))
+        
+        for target, args in targets:
+            thread = threading.Thread(target=target, args=args, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+        wake()
+        for thread in self._threads:
+            thread.join()
+    
+    def _work(self, worker_id):
+        while not self._stopped.is_set():
+            job = None
+            
+            with self.app.app_context():
+                try:
+                    job = claim_next(worker_id)
+                    if job is not None:
+                        run(job, worker_id)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"❌ Error en worker de trabajos {worker_id}: {str(e)}")
+            
+            if job is None:
+                with _wakeup:
+                    if not self._stopped.is_set():
+                        _wakeup.wait(config.JOBS_POLL_SECONDS)
+    
+    def _maintain(self):
+        interval = max(config.JOBS_STALE_SECONDS / 4, 1)
+        
+        while not self._stopped.wait(interval):
+            with self.app.app_context():
+                try:
+                    heartbeat(self.worker_ids)
+                    requeued, failed = requeue_stale()
+                    if requeued or failed:
+                        print(f"⚠️ Trabajos recuperados: {requeued} reencolados, {failed} fallidos")
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"⚠️ Error en mantenimiento de trabajos: {str(e)}")
+
+
+def init_app(app):
+    """
+    Registrar `flask jobs-worker` y arrancar los workers dentro del
+    proceso si JOBS_IN_PROCESS_WORKERS lo pide
+    """
+    
+    @app.cli.command('jobs-worker')
+    @click.option('--threads', default=config.JOBS_WORKERS, show_default=True,
+                  help='Trabajos en paralelo en este proceso')
+    def jobs_worker_command(threads):
+        """Ejecutar trabajos en segundo plano hasta Ctrl+C."""
+        worker = Worker(app, threads).start()
+        click.echo(f"✓ Worker de trabajos con {threads} hilos")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            worker.stop()
+    
+    if config.JOBS_IN_PROCESS_WORKERS:
+        app.extensions['jobs_worker'] = Worker(app, config.JOBS_IN_PROCESS_WORKERS).start()
+
+
+# ==================== TRABAJOS ====================
+
+def _require_payload(params, payload):
+    if not payload:
+        raise JobValidationError('Este trabajo se encola desde su ruta con el encabezado Prefer: respond-async')
+
+
+@job_handler('report.create', validate=_require_payload)
+def create_report(context):
+    """
+    Crear un reporte (POST /api/reports con Prefer: respond-async)
+    """
+    report = report_service.create_report(context.user_pk, json.loads(context.payload))
+    db.session.flush()
+    return {'report': report.to_summary_dict()}
+
+
+def _validate_import(params, payload):
+    _require_payload(params, payload)
+    if params.get('format') not in ('csv', 'ndjson'):
+        raise JobValidationError('`format` debe ser csv o ndjson')
+
+
+@job_handler('reports.import', validate=_validate_import)
+def import_reports(context):
+    """
+    Importación masiva de reportes (POST /api/reports/bulk con Prefer:
+    respond-async); el avance es la fracción del archivo ya leída
+    
+    Cada lote guarda su checkpoint en la misma transacción: si el worker
+    cae y el trabajo vuelve a la cola, el reintento salta los registros ya
+    procesados en lugar de duplicar sus reportes.
+    """
+    size = len(context.payload) or 1
+    stream = io.BytesIO(context.payload)
+    
+    def on_commit(result):
+        context.progress(100 * stream.tell() / size, f'{result.inserted} reportes importados')
+    
+    result = bulk_import.import_reports(
+        context.user_pk, stream, context.params['format'],
+        context.params.get('batchSize') or config.BULK_IMPORT_BATCH_SIZE, on_commit,
+        checkpoint=context.save_checkpoint, resume=context.checkpoint
+    )
+    return result.to_dict()
+
+
+@job_handler('ledger.rebuild')
+def rebuild_ledger(context):
+    """
+    Recalcular los saldos por cuenta del usuario desde sus registros
+    """
+    ledger.rebuild_account_balances(context.user_pk)
+    cuentas = db.session.scalar(
+        db.select(db.func.count()).select_from(LedgerBalance)
+        .where(LedgerBalance.user_id == context.user_pk)
+    )
+    return {'cuentas': cuentas}
+
+
+@job_handler('consolidation.rebuild')
+def rebuild_consolidation(context):
+    """
+    Recalcular los acumulados por mes del usuario desde sus reportes
+    """
+    consolidation.rebuild_period_balances(context.user_pk)
+    return {'success': True}
+
+
+def _validate_archive(params, payload):
+    days = params.get('olderThanDays', config.ARCHIVE_AFTER_DAYS)
+    if not isinstance(days, int) or isinstance(days, bool) or days < 0:
+        raise JobValidationError('`olderThanDays` debe ser un entero no negativo')
+
+
+@job_handler('reports.archive', validate=_validate_archive)
+def archive_reports(context):
+    """
+    Archivar los reportes del usuario con fecha anterior a olderThanDays
+    (ARCHIVE_AFTER_DAYS por defecto)
+    
+    No necesita checkpoint: cada lote marca sus reportes como archivados
+    en su commit y un reintento solo toma los que faltan.
+    """
+    archived = archive.run(
+        context.user_pk,
+        context.params.get('olderThanDays'),
+        on_batch=lambda count, total: context.progress(100 * count / total, f'{count} reportes archivados')
+    )
+    return {'archived': archived}
+
+
+def _validate_valuation(params, payload):
+    if params.get('method', 'promedio') not in costing.METHODS:
+        raise JobValidationError(f"Método de costeo inválido, usa {', '.join(costing.METHODS)}")
+    
+    snapshots = params.get('snapshots', [])
+    if not isinstance(snapshots, list):
+        raise JobValidationError('`snapshots` debe ser una lista de fechas')
+    try:
+        for value in snapshots:
+            date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise JobValidationError('Fecha inválida, usa el formato YYYY-MM-DD')
+
+
+@job_handler('inventory.valuation', validate=_validate_valuation)
+def inventory_valuation(context):
+    """
+    Valuación de inventario sobre los reportes guardados (los mismos
+    parámetros que GET /api/inventory/valuation)
+    """
+    params = context.params
+    method = params.get('method', 'promedio')
+    producto = params.get('producto') or None
+    
+    movements = costing.movements_from_reports(context.user_pk, producto)
+    context.progress(50, f'{len(movements)} movimientos leídos')
+    
+    snapshot_dates = sorted({date.fromisoformat(value) for value in params.get('snapshots', [])})
+    return {
+        'method': method,
+        'movimientos': len(movements),
+        'snapshots': costing.valuate(movements, method, snapshot_dates, producto,
+                                     bool(params.get('capas')))
+    }
@@ -0,0 +1,264 @@
+"""
+Mayores auxiliares (esquemas de T) calculados en el servidor
+
+Las cuentas se comparan sin distinguir mayúsculas, igual que en
+frontend/src/utils/mayoresUtils.js, pero agrupando en una sola pasada sobre
+las líneas del reporte en lugar de buscar cuenta por cuenta.
+"""
+from itertools import groupby
+
+import archive
+from aggregation import CLASIFICACIONES_ACREEDORAS, CLASIFICACIONES_DEUDORAS, to_cents
+from models import db, Report, ReportLine, LedgerBalance
+
+
+def cuenta_key(cuenta):
+    """
+    Llave normalizada para agrupar cuentas; '' si no es texto
+    """
+    if not isinstance(cuenta, str):
+        return ''
+    return cuenta.strip().lower()
+
+
+def _columna_inicial(clasificacion):
+    if clasificacion in CLASIFICACIONES_DEUDORAS:
+        return 'debe'
+    if clasificacion in CLASIFICACIONES_ACREEDORAS:
+        return 'haber'
+    return None
+
+
+def get_saldos_iniciales(balance_report_id):
+    """
+    Saldos iniciales por cuenta desde un Balance de Saldos
+    """
+    saldos = {}
+    
+    rows = db.session.execute(
+        db.select(ReportLine.cuenta, ReportLine.clasificacion, ReportLine.monto)
+        .where(ReportLine.report_id == balance_report_id, ReportLine.section == '')
+        .order_by(ReportLine.position)
+    )
+    
+    for cuenta, clasificacion, monto in rows:
+        # Como en el frontend, la primera fila de cada cuenta es la que cuenta
+        saldos.setdefault(cuenta_key(cuenta), {
+            'cuenta': cuenta,
+            'clasificacion': clasificacion,
+            'monto_cents': to_cents(monto)
+        })
+    
+    return saldos
+
+
+def build_ledger(registros_report_id, balance_report_id=None, cuenta=None):
+    """
+    Construir los esquemas de T de todas las cuentas de un reporte de
+    Registros Contables (o de una sola si se indica `cuenta`)
+    
+    Las líneas se leen una sola vez, ya ordenadas por fecha y número de
+    asiento, y se agrupan por cuenta acumulando el saldo corrido.
+    """
+    saldos = get_saldos_iniciales(balance_report_id) if balance_report_id else {}
+    only_key = cuenta_key(cuenta) if cuenta else None
+    
+    query = (
+        db.select(ReportLine.row_id, ReportLine.fecha, ReportLine.no_asiento,
+                  ReportLine.concepto, ReportLine.cuenta, ReportLine.clasificacion,
+                  ReportLine.debe, ReportLine.haber)
+        .where(ReportLine.report_id == registros_report_id, ReportLine.section == '')
+        .order_by(ReportLine.fecha, ReportLine.no_asiento, ReportLine.position)
+        .execution_options(yield_per=ReportLine.BATCH_SIZE)
+    )
+    
+    esquemas = {}
+    
+    for row_id, fecha, no_asiento, concepto, nombre, clasificacion, debe, haber in db.session.execute(query):
+        key = cuenta_key(nombre)
+        if not key or (only_key and key != only_key):
+            continue
+        
+        esquema = esquemas.get(key)
+        if esquema is None:
+            esquema = esquemas[key] = _nuevo_esquema(nombre, clasificacion, saldos.get(key))
+        
+        debe_cents = to_cents(debe)
+        haber_cents = to_cents(haber)
+        
+        if esquema['clasificacion'] in CLASIFICACIONES_ACREEDORAS:
+            esquema['saldo_cents'] += haber_cents - debe_cents
+        else:
+            esquema['saldo_cents'] += debe_cents - haber_cents
+        
+        esquema['debe_cents'] += debe_cents
+        esquema['haber_cents'] += haber_cents
+        esquema['movimientos'].append({
+            'id': row_id,
+            'fecha': fecha.isoformat() if fecha else None,
+            'noAsiento': no_asiento,
+            'concepto': concepto,
+            'debe': debe_cents / 100,
+            'haber': haber_cents / 100,
+            'saldo': esquema['saldo_cents'] / 100
+        })
+    
+    # Cuentas del balance sin movimientos
+    for key, saldo in saldos.items():
+        if key not in esquemas and (not only_key or key == only_key):
+            esquemas[key] = _nuevo_esquema(saldo['cuenta'], saldo['clasificacion'], saldo)
+    
+    return [_esquema_to_dict(esquemas[key]) for key in sorted(esquemas)]
+
+
+def _nuevo_esquema(nombre, clasificacion, saldo_inicial):
+    if saldo_inicial:
+        nombre = saldo_inicial['cuenta']
+        clasificacion = saldo_inicial['clasificacion']
+    
+    monto_cents = saldo_inicial['monto_cents'] if saldo_inicial else 0
+    columna = _columna_inicial(clasificacion) if saldo_inicial else None
+    
+    return {
+        'cuenta': nombre,
+        'clasificacion': clasificacion,
+        'saldo_inicial_cents': monto_cents,
+        'columna_inicial': columna,
+        'saldo_cents': monto_cents,
+        'debe_cents': monto_cents if columna == 'debe' else 0,
+        'haber_cents': monto_cents if columna == 'haber' else 0,
+        'movimientos': []
+    }
+
+
+def _esquema_to_dict(esquema):
+    return {
+        'cuenta': esquema['cuenta'],
+        'clasificacion': esquema['clasificacion'],
+        'saldoInicial': esquema['saldo_inicial_cents'] / 100,
+        'columnaInicial': esquema['columna_inicial'],
+        'movimientos': esquema['movimientos'],
+        'saldoFinal': esquema['saldo_cents'] / 100,
+        'totalDebe': esquema['debe_cents'] / 100,
+        'totalHaber': esquema['haber_cents'] / 100
+    }
+
+
+def aggregate_rows(rows):
+    """
+    Sumar debe/haber por cuenta de las filas de un reporte de registros
+    """
+    totals = {}
+    
+    for row in rows:
+        if not isinstance(row, dict) or ('debe' not in row and 'haber' not in row):
+            continue
+        
+        nombre = row.get('cuenta')
+        key = cuenta_key(nombre)
+        if not key:
+            continue
+        
+        entry = totals.setdefault(key, {
+            'cuenta': nombre.strip(),
+            'clasificacion': row.get('clasificacion') or None,
+            'debe_cents': 0,
+            'haber_cents': 0,
+            'movimientos': 0
+        })
+        entry['debe_cents'] += to_cents(row.get('debe'))
+        entry['haber_cents'] += to_cents(row.get('haber'))
+        entry['movimientos'] += 1
+    
+    return totals
+
+
+def apply_account_deltas(user_pk, deltas, sign=1):
+    """
+    Sumar (o restar con sign=-1) acumulados por cuenta al caché
+    ledger_balances, sin volver a leer los reportes del usuario
+    """
+    if not deltas:
+        return
+    
+    existing = {
+        key for (key,) in db.session.execute(
+            db.select(LedgerBalance.cuenta_key)
+            .where(LedgerBalance.user_id == user_pk,
+                   LedgerBalance.cuenta_key.in_(list(deltas)))
+        )
+    }
+    
+    for key, delta in deltas.items():
+        if key in existing:
+            # Incremento atómico en SQL para no perder escrituras concurrentes
+            db.session.execute(
+                db.update(LedgerBalance)
+                .where(LedgerBalance.user_id == user_pk, LedgerBalance.cuenta_key == key)
+                .values(
+                    debe_cents=LedgerBalance.debe_cents + sign * delta['debe_cents'],
+                    haber_cents=LedgerBalance.haber_cents + sign * delta['haber_cents'],
+                    movimientos=LedgerBalance.movimientos + sign * delta['movimientos']
+                )
+            )
+        elif sign > 0:
+            db.session.add(LedgerBalance(
+                user_id=user_pk,
+                cuenta_key=key,
+                cuenta=delta['cuenta'],
+                clasificacion=delta['clasificacion'],
+                debe_cents=delta['debe_cents'],
+                haber_cents=delta['haber_cents'],
+                movimientos=delta['movimientos']
+            ))
+    
+    if sign < 0:
+        # Cuentas que se quedaron sin movimientos, igual que en una reconstrucción
+        db.session.execute(
+            db.delete(LedgerBalance)
+            .where(LedgerBalance.user_id == user_pk,
+                   LedgerBalance.cuenta_key.in_(list(deltas)),
+                   LedgerBalance.movimientos <= 0)
+        )
+
+
+def update_account_balances(user_pk, document):
+    """
+    Actualizar el caché de saldos con las filas de un reporte recién guardado
+    """
+    if isinstance(document, list):
+        apply_account_deltas(user_pk, aggregate_rows(document))
+
+
+def rebuild_account_balances(user_pk=None):
+    """
+    Reconstruir ledger_balances desde report_lines en una sola pasada
+    
+    Los reportes archivados ya no tienen líneas; se suman desde su
+    documento en el archivo.
+    """
+    delete = db.delete(LedgerBalance)
+    query = (
+        db.select(Report.user_id, ReportLine.cuenta, ReportLine.clasificacion,
+                  ReportLine.debe, ReportLine.haber)
+        .join(Report, Report.id == ReportLine.report_id)
+        .where(ReportLine.section == '',
+               ReportLine.debe.isnot(None) | ReportLine.haber.isnot(None))
+        .execution_options(yield_per=ReportLine.BATCH_SIZE)
+    )
+    if user_pk is not None:
+        delete = delete.where(LedgerBalance.user_id == user_pk)
+        query = query.where(Report.user_id == user_pk)
+    
+    db.session.execute(delete)
+    
+    lines = db.session.execute(query.order_by(Report.user_id))
+    
+    for owner, group in groupby(lines, key=lambda line: line[0]):
+        apply_account_deltas(owner, aggregate_rows(
+            {'cuenta': cuenta, 'clasificacion': clasificacion, 'debe': debe, 'haber': haber}
+            for _, cuenta, clasificacion, debe, haber in group
+        ))
+    
+    for report, document in archive.iter_documents(user_pk):
+        update_account_balances(report.user_id, document)
@@ -0,0 +1,367 @@
+"""
+Métricas del backend en formato Prometheus y perfilado por petición
+
+Se registran:
+- Latencia por ruta (histograma), con método y código de respuesta.
+- Consultas SQL: número y duración por tipo de sentencia (eventos del
+  engine de SQLAlchemy) y, por petición, cuántas hizo y cuánto tardaron.
+- Llamadas HTTP salientes (sesión compartida de auth_utils) por host.
+- Tiempo de codificación JSON por petición.
+
+Cada respuesta lleva un encabezado Server-Timing con el desglose. Con
+PROFILING_ENABLED y un PROFILING_TOKEN, el encabezado X-Profile con ese
+token activa un perfilador por muestreo para esa petición; el resultado
+(pilas colapsadas, formato de flamegraph) se consulta en
+/api/metrics/profiles/<id> con el mismo encabezado.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter as StackCounter
+from urllib.parse import urlsplit
+
+from flask import g, has_request_context, request
+
+from cache import LRUCache
+from config import config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class Counter:
+    """
+    Contador con etiquetas
+    """
+    kind = 'counter'
+    
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    """
+    Histograma con cubetas acumulativas, como lo espera Prometheus
+    """
+    kind = 'histogram'
+    
+    def __init__(self, name, description, labels, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items()]
+        
+        for label_values, (counts, total, count) in items:
+            labels = dict(zip(self.labels, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', {**labels, 'le': repr(float(bound))}, bucket_count
+            yield f'{self.name}_bucket', {**labels, 'le': '+Inf'}, count
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, count
+
+
+class CacheStats:
+    """
+    Aciertos y fallos (counter) o tamaño (gauge) de las cachés LRU
+    registradas con watch_cache(); se leen de LRUCache.stats() al exportar
+    """
+    
+    def __init__(self, name, description, kind):
+        self.name = name
+        self.description = description
+        self.kind = kind
+        self._caches = {}
+    
+    def watch(self, cache_name, cache):
+        self._caches[cache_name] = cache
+    
+    def samples(self):
+        for cache_name, cache in list(self._caches.items()):
+            stats = cache.stats()
+            if self.kind == 'gauge':
+                yield self.name, {'cache': cache_name}, stats['size']
+            else:
+                yield self.name, {'cache': cache_name, 'result': 'hit'}, stats['hits']
+                yield self.name, {'cache': cache_name, 'result': 'miss'}, stats['misses']
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Latencia de las peticiones por ruta',
+    ('method', 'route', 'status'))
+REQUEST_PHASE = Histogram(
+    'http_request_phase_seconds', 'Tiempo por petición en SQL, JSON y HTTP saliente',
+    ('route', 'phase'))
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Consultas SQL por petición',
+    ('route',), COUNT_BUCKETS)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Duración de las consultas SQL por tipo de sentencia',
+    ('operation',), QUERY_BUCKETS)
+DB_QUERY_ERRORS = Counter(
+    'db_query_errors_total', 'Consultas SQL que terminaron en error',
+    ('operation',))
+OUTBOUND_LATENCY = Histogram(
+    'http_client_request_duration_seconds', 'Latencia de las llamadas HTTP salientes',
+    ('method', 'host', 'status'))
+CACHE_LOOKUPS = CacheStats(
+    'cache_lookups_total', 'Consultas a cachés en memoria por resultado', 'counter')
+CACHE_ENTRIES = CacheStats(
+    'cache_entries', 'Entradas guardadas en cada caché en memoria', 'gauge')
+
+REGISTRY = (REQUEST_LATENCY, REQUEST_PHASE, REQUEST_QUERIES,
+            DB_QUERY_LATENCY, DB_QUERY_ERRORS, OUTBOUND_LATENCY,
+            CACHE_LOOKUPS, CACHE_ENTRIES)
+
+PHASES = ('db', 'json', 'http')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render():
+    """
+    Todas las métricas en el formato de texto de Prometheus
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def watch_cache(cache_name, cache):
+    """
+    Exportar los aciertos, fallos y tamaño de una LRUCache en /api/metrics
+    """
+    CACHE_LOOKUPS.watch(cache_name, cache)
+    CACHE_ENTRIES.watch(cache_name, cache)
+
+
+def add_request_time(phase, seconds):
+    """
+    Sumar tiempo a una fase de la petición en curso (si la hay)
+    """
+    if has_request_context():
+        timings = g.setdefault('metrics_timings', dict.fromkeys(PHASES, 0.0))
+        timings[phase] += seconds
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else '<sin ruta>'
+
+
+# ==================== SQL ====================
+
+def _operation(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+    DB_QUERY_LATENCY.observe((_operation(statement),), elapsed)
+    
+    if has_request_context():
+        add_request_time('db', elapsed)
+        g.metrics_queries = g.get('metrics_queries', 0) + 1
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get('metrics_query_start') if exception_context.connection else None
+    if starts:
+        starts.pop()
+    DB_QUERY_ERRORS.inc((_operation(exception_context.statement or ''),))
+
+
+# ==================== HTTP SALIENTE ====================
+
+def _record_outbound(response, *args, **kwargs):
+    elapsed = response.elapsed.total_seconds()
+    OUTBOUND_LATENCY.observe(
+        (response.request.method, urlsplit(response.url).hostname or '', str(response.status_code)),
+        elapsed
+    )
+    add_request_time('http', elapsed)
+    return response
+
+
+# ==================== PERFILADO ====================
+
+class SamplingProfiler:
+    """
+    Muestrea la pila de un hilo cada `interval` segundos desde otro hilo
+    
+    No usa sys.setprofile, así el costo no depende de cuántas funciones se
+    llamen sino del intervalo de muestreo.
+    """
+    
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = StackCounter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+    
+    def collapsed(self):
+        """
+        Pilas en formato colapsado (una por línea con su número de muestras)
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+_profiles = LRUCache(config.PROFILE_KEEP)
+
+
+def get_profile(profile_id):
+    return _profiles.get(profile_id)
+
+
+def profiling_enabled():
+    """
+    El perfilado exige un token: sin PROFILING_TOKEN queda apagado aunque
+    PROFILING_ENABLED esté activo
+    """
+    return config.PROFILING_ENABLED and bool(config.PROFILING_TOKEN)
+
+
+def profiling_authorized():
+    """
+    True si la petición trae el token de perfilado en X-Profile
+    """
+    return profiling_enabled() and request.headers.get('X-Profile') == config.PROFILING_TOKEN
+
+
+# ==================== FLASK ====================
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    
+    if profiling_authorized():
+        g.metrics_profiler = SamplingProfiler(
+            threading.get_ident(), config.PROFILE_INTERVAL_MS / 1000
+        ).start()
+
+
+def _finish_request(response):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    
+    elapsed = time.perf_counter() - started
+    route = _route()
+    timings = g.get('metrics_timings') or dict.fromkeys(PHASES, 0.0)
+    
+    REQUEST_LATENCY.observe((request.method, route, str(response.status_code)), elapsed)
+    REQUEST_QUERIES.observe((route,), g.get('metrics_queries', 0))
+    for phase in PHASES:
+        REQUEST_PHASE.observe((route, phase), timings[phase])
+    
+    response.headers['Server-Timing'] = ', '.join(
+        [f'{phase};dur={timings[phase] * 1000:.1f}' for phase in PHASES]
+        + [f'total;dur={elapsed * 1000:.1f}']
+    )
+    
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        profile_id = uuid.uuid4().hex
+        _profiles.set(profile_id, {
+            'route': route,
+            'method': request.method,
+            'seconds': elapsed,
+            'samples': profiler.samples,
+            'stacks': profiler.collapsed()
+        })
+        response.headers['X-Profile-Id'] = profile_id
+    
+    return response
+
+
+def init_app(app, engine, http_session):
+    """
+    Registrar los hooks de la app, los eventos del engine y la sesión HTTP
+    
+    Llamarlo antes de registrar otros after_request para que la latencia
+    incluya su trabajo (Flask los ejecuta en orden inverso).
+    """
+    from sqlalchemy import event
+    
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+    
+    if _record_outbound not in http_session.hooks['response']:
+        http_session.hooks['response'].append(_record_outbound)
+    
+    if config.PROFILING_ENABLED and not config.PROFILING_TOKEN:
+        print("⚠️ PROFILING_ENABLED sin PROFILING_TOKEN: el perfilado queda desactivado")
@@ -0,0 +1,264 @@
+"""
+Inicialización, migraciones de esquema y de datos
+
+Uso:
+    flask --app app init-db     # esquema + migraciones + catálogo inicial
+    flask --app app migrate     # solo esquema y migraciones de datos
+    flask --app app seed        # solo catálogo inicial
+"""
+import json
+
+import click
+
+import archive
+import consolidation
+import ledger
+import payload_store
+import search
+from models import db, Report, CuentaContable, PeriodBalance, ReportDocument, split_document
+
+CUENTAS_INICIALES = [
+    {'cuenta': 'Caja', 'clasificacion': 'Activo', 'descripcion': 'Efectivo disponible'},
+    {'cuenta': 'Bancos', 'clasificacion': 'Activo', 'descripcion': 'Depósitos bancarios'},
+    {'cuenta': 'Clientes', 'clasificacion': 'Activo', 'descripcion': 'Cuentas por cobrar'},
+    {'cuenta': 'Inventarios', 'clasificacion': 'Activo', 'descripcion': 'Mercancías en almacén'},
+    {'cuenta': 'Equipo de Transporte', 'clasificacion': 'Activo', 'descripcion': 'Vehículos'},
+    {'cuenta': 'Mobiliario y Equipo', 'clasificacion': 'Activo', 'descripcion': 'Muebles y equipos'},
+    {'cuenta': 'Edificio', 'clasificacion': 'Activo', 'descripcion': 'Inmuebles'},
+    {'cuenta': 'Terrenos', 'clasificacion': 'Activo', 'descripcion': 'Propiedades'},
+    {'cuenta': 'Proveedores', 'clasificacion': 'Pasivo', 'descripcion': 'Cuentas por pagar'},
+    {'cuenta': 'Documentos por Pagar', 'clasificacion': 'Pasivo', 'descripcion': 'Obligaciones'},
+    {'cuenta': 'Acreedores Diversos', 'clasificacion': 'Pasivo', 'descripcion': 'Otras cuentas'},
+    {'cuenta': 'Hipotecas por Pagar', 'clasificacion': 'Pasivo', 'descripcion': 'Préstamos'},
+    {'cuenta': 'Capital Social', 'clasificacion': 'Capital', 'descripcion': 'Aportaciones'},
+    {'cuenta': 'Utilidad del Ejercicio', 'clasificacion': 'Capital', 'descripcion': 'Ganancias'},
+    {'cuenta': 'Reserva Legal', 'clasificacion': 'Capital', 'descripcion': 'Reservas'}
+]
+
+
+def seed_cuentas():
+    """
+    Cargar el catálogo inicial de cuentas con una sola inserción en bloque
+    """
+    if db.session.query(CuentaContable.id).first() is not None:
+        return 0
+    
+    db.session.execute(db.insert(CuentaContable), CUENTAS_INICIALES)
+    db.session.commit()
+    return len(CUENTAS_INICIALES)
+
+
+def backfill_report_lines(batch_size=200):
+    """
+    Mover las filas guardadas dentro de reports.data a report_lines
+    
+    Es idempotente: los reportes ya migrados solo tienen el esqueleto en
+    `data` y se omiten.
+    """
+    migrated = 0
+    last_id = 0
+    
+    while True:
+        reports = (
+            Report.query
+            .filter(Report.id > last_id)
+            .order_by(Report.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not reports:
+            break
+        
+        for report in reports:
+            document = json.loads(report.data) if report.data else []
+            _, sections = split_document(document)
+            
+            if any(rows for _, rows in sections):
+                report.save_document(document)
+                search.index_lines(report.id)
+                migrated += 1
+        
+        last_id = reports[-1].id
+        db.session.commit()
+    
+    return migrated
+
+
+def migrate_report_payloads(batch_size=200):
+    """
+    Pasar los documentos de la tabla anterior report_payloads (uno por
+    reporte, sin comprimir) a payload_store y borrar esa tabla
+    
+    Solo se copian los que corresponden a la versión actual del reporte;
+    los demás se volverían a generar de todos modos.
+    """
+    if 'report_payloads' not in db.inspect(db.engine).get_table_names():
+        return None
+    
+    legacy = db.Table('report_payloads', db.MetaData(), autoload_with=db.engine)
+    migrated = 0
+    last_id = 0
+    
+    while True:
+        rows = db.session.execute(
+            db.select(legacy.c.report_id, legacy.c.version, legacy.c.body)
+            .join(Report, db.and_(Report.id == legacy.c.report_id, Report.version == legacy.c.version))
+            .where(legacy.c.report_id > last_id)
+            .order_by(legacy.c.report_id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        
+        for row in rows:
+            digest = payload_store.store(row.body)
+            db.session.merge(ReportDocument(report_id=row.report_id, version=row.version, digest=digest))
+        
+        last_id = rows[-1].report_id
+        migrated += len(rows)
+        db.session.commit()
+    
+    legacy.drop(bind=db.engine)
+    return migrated
+
+
+def add_missing_columns():
+    """
+    Agregar a las tablas existentes las columnas nuevas de models.py
+    
+    db.create_all() no altera tablas que ya existen. Las columnas NOT NULL
+    deben declarar server_default para poder agregarse.
+    """
+    created = []
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = db.engine.dialect.identifier_preparer
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            
+            ddl = (f"ALTER TABLE {preparer.quote(table.name)} "
+                   f"ADD COLUMN {preparer.quote(column.name)} "
+                   f"{column.type.compile(dialect=db.engine.dialect)}")
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            
+            with db.engine.begin() as connection:
+                connection.execute(db.text(ddl))
+            created.append(f"{table.name}.{column.name}")
+    
+    return created
+
+
+def create_missing_indexes():
+    """
+    Crear los índices declarados en models.py que falten
+    
+    db.create_all() no agrega índices a tablas que ya existen.
+    """
+    created = []
+    existing_tables = set(db.inspect(db.engine).get_table_names())
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing = {index['name'] for index in db.inspect(db.engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    
+    return created
+
+
+def run_migrations():
+    """
+    Crear las tablas nuevas y migrar los datos existentes
+    """
+    db.create_all()
+    
+    for name in add_missing_columns():
+        print(f"✓ Columna agregada: {name}")
+    
+    for name in create_missing_indexes():
+        print(f"✓ Índice creado: {name}")
+    
+    migrated = backfill_report_lines()
+    print(f"✓ Reportes migrados a report_lines: {migrated}")
+    
+    migrated = migrate_report_payloads()
+    if migrated is not None:
+        print(f"✓ Documentos movidos a payload_blobs: {migrated}")
+    
+    if search.install():
+        print("✓ Índice de búsqueda creado")
+    
+    ledger.rebuild_account_balances()
+    db.session.commit()
+    print("✓ Saldos por cuenta reconstruidos")
+    
+    # Los acumulados por mes se mantienen al guardar; solo se llenan la primera vez
+    if not db.session.scalar(db.select(PeriodBalance.id).limit(1)):
+        consolidation.rebuild_period_balances()
+        db.session.commit()
+        print("✓ Acumulados por mes calculados")
+
+
+def init_db():
+    """
+    Dejar la base de datos lista: esquema, migraciones y catálogo inicial
+    """
+    run_migrations()
+    
+    if seed_cuentas():
+        print("✓ Cuentas contables inicializadas")
+
+
+def register_commands(app):
+    """
+    Registrar los comandos `flask init-db`, `flask migrate`, `flask seed` y
+    `flask archive-reports`
+    """
+    
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Crear el esquema, migrar datos y cargar el catálogo inicial."""
+        init_db()
+    
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Crear tablas nuevas y migrar datos existentes."""
+        run_migrations()
+    
+    @app.cli.command('seed')
+    def seed_command():
+        """Cargar el catálogo inicial de cuentas."""
+        click.echo(f"✓ Cuentas insertadas: {seed_cuentas()}")
+    
+    @app.cli.command('archive-reports')
+    @click.option('--days', type=int, default=None,
+                  help='Antigüedad mínima por fecha del reporte (ARCHIVE_AFTER_DAYS)')
+    @click.option('--restore', 'restore_id', type=int, default=None,
+                  help='Restaurar este reporte en lugar de archivar')
+    def archive_reports_command(days, restore_id):
+        """Mover reportes antiguos de todos los usuarios a los segmentos de archivo."""
+        if restore_id is not None:
+            report = db.session.get(Report, restore_id)
+            if report is None or report.archived_at is None:
+                raise click.ClickException(f'El reporte {restore_id} no está archivado')
+            archive.restore(report)
+            db.session.commit()
+            click.echo(f"✓ Reporte {restore_id} restaurado")
+            return
+        
+        archived = archive.run(older_than_days=days, on_batch=lambda count, total: click.echo(f"  {count}/{total}..."))
+        click.echo(f"✓ Reportes archivados: {archived}")
@@ -1,16 +1,32 @@
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from datetime import datetime, date
 import json
 
 db = SQLAlchemy()
 
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Configurar cada conexión SQLite nueva (listener del evento 'connect')
+    
+    WAL permite leer mientras otro proceso escribe; synchronous=NORMAL es
+    seguro con WAL y evita un fsync por transacción.
+    """
+    from config import config
+    
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
 class User(db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.String(50), unique=True, nullable=False)
+    user_id = db.Column(db.String(50), nullable=False)
     name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
+    email = db.Column(db.String(120), nullable=False)
     password_hash = db.Column(db.String(255), nullable=True)  # Nullable para OAuth
     
     # Campos para OAuth
@@ -23,6 +39,12 @@ class User(db.Model):
     
     reports = db.relationship('Report', backref='user', lazy=True, cascade='all, delete-orphan')
     
+    # Índices únicos explícitos: mismo nombre y comportamiento en cualquier motor
+    __table_args__ = (
+        db.Index('ix_users_user_id', user_id, unique=True),
+        db.Index('ix_users_email', email, unique=True),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -44,10 +66,24 @@ class Report(db.Model):
     report_type = db.Column(db.String(50), nullable=False)
     program_id = db.Column(db.Integer, nullable=True)
     date = db.Column(db.Date, nullable=False)
+    # Esqueleto del documento: las filas viven en report_lines
     data = db.Column(db.Text, nullable=False)
     totals = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Control de concurrencia optimista: aumenta en cada modificación
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Si tiene valor, el documento vive en un segmento de archivo (ver archive.py)
+    # y el reporte no tiene líneas en report_lines
+    archived_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Listado paginado: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_reports_user_created_id', user_id, created_at.desc(), id.desc()),
+        # Filtros por tipo y fecha
+        db.Index('ix_reports_user_type_date', user_id, report_type, date),
+        db.Index('ix_reports_program_id', program_id),
+    )
     
     def to_dict(self):
         return {
@@ -56,12 +92,460 @@ class Report(db.Model):
             'reportType': self.report_type,
             'programId': self.program_id,
             'date': self.date.isoformat(),
-            'data': json.loads(self.data) if self.data else [],
+            'data': self.get_document(),
+            'totals': json.loads(self.totals) if self.totals else {},
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'version': self.version
+        }
+    
+    # Columnas necesarias para el listado (nunca incluye `data`)
+    SUMMARY_COLUMNS = ('id', 'name', 'report_type', 'program_id', 'date',
+                       'totals', 'created_at', 'updated_at', 'version', 'archived_at')
+    
+    @classmethod
+    def list_query(cls, user_pk, report_type=None, program_id=None, after=None):
+        """
+        Consulta del listado de un usuario, solo con SUMMARY_COLUMNS
+        
+        `after` es la posición (created_at, id) del último reporte de la
+        página anterior.
+        """
+        query = cls.query.options(
+            db.load_only(*[getattr(cls, c) for c in cls.SUMMARY_COLUMNS])
+        ).filter(cls.user_id == user_pk)
+        
+        if report_type:
+            query = query.filter(cls.report_type == report_type)
+        if program_id is not None:
+            query = query.filter(cls.program_id == program_id)
+        
+        if after:
+            created_at, report_id = after
+            query = query.filter(db.or_(
+                cls.created_at < created_at,
+                db.and_(cls.created_at == created_at, cls.id < report_id)
+            ))
+        
+        return query.order_by(cls.created_at.desc(), cls.id.desc())
+    
+    def to_summary_dict(self):
+        """
+        Proyección ligera para listados: no lee ni parsea la columna `data`
+        """
+        return {
+            'id': self.id,
+            'name': self.name,
+            'reportType': self.report_type,
+            'programId': self.program_id,
+            'date': self.date.isoformat(),
             'totals': json.loads(self.totals) if self.totals else {},
             'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'updated_at': self.updated_at.isoformat(),
+            'version': self.version,
+            'archived': self.archived_at is not None
+        }
+    
+    def save_document(self, document):
+        """
+        Guardar el documento del reporte: el esqueleto queda en `data` y
+        cada fila se inserta en report_lines en bloque
+        """
+        skeleton, sections = split_document(document)
+        self.data = json.dumps(skeleton)
+        db.session.flush()
+        
+        ReportLine.query.filter_by(report_id=self.id).delete(synchronize_session=False)
+        ReportLine.bulk_insert(self.id, sections)
+    
+    def get_document(self):
+        """
+        Reconstruir el documento leyendo las líneas en lotes
+        """
+        skeleton = json.loads(self.data) if self.data else []
+        return assemble_document(skeleton, ReportLine.iter_rows(self.id))
+
+class PayloadBlob(db.Model):
+    """
+    Documento ya codificado en JSON, guardado una sola vez por contenido
+    
+    `digest` es el SHA-256 de los bytes sin comprimir y `codec` dice cómo
+    se comprimió `body` (ver payload_store).
+    """
+    __tablename__ = 'payload_blobs'
+    
+    digest = db.Column(db.String(64), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    body = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportDocument(db.Model):
+    """
+    Documento codificado de un reporte: apunta a su contenido en payload_blobs
+    
+    Se guarda junto con la versión del reporte; si no coincide (el reporte
+    se editó) se vuelve a generar en la siguiente lectura.
+    """
+    __tablename__ = 'report_documents'
+    
+    report_id = db.Column(db.Integer, db.ForeignKey('reports.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    digest = db.Column(db.String(64), db.ForeignKey('payload_blobs.digest'), nullable=False)
+    
+    __table_args__ = (
+        # Saber si un contenido sigue en uso antes de borrarlo
+        db.Index('ix_report_documents_digest', digest),
+    )
+
+class ArchivedReport(db.Model):
+    """
+    Índice de un reporte archivado: dónde está su documento en los
+    segmentos de archivo (ver archive.py)
+    
+    `offset` apunta al encabezado del registro dentro del segmento;
+    `digest` es el SHA-256 del documento sin comprimir.
+    """
+    __tablename__ = 'archived_reports'
+    
+    report_id = db.Column(db.Integer, db.ForeignKey('reports.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    segment = db.Column(db.Integer, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.Integer, nullable=False)
+    codec = db.Column(db.String(10), nullable=False)
+    digest = db.Column(db.String(64), nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ReportLine(db.Model):
+    """
+    Una fila de un reporte (balance, registros, inventario o proceso)
+    """
+    __tablename__ = 'report_lines'
+    __table_args__ = (
+        db.Index('ix_report_lines_report_section_position', 'report_id', 'section', 'position'),
+        # Ediciones por fila (PATCH) y recálculo de asientos afectados
+        db.Index('ix_report_lines_report_section_row', 'report_id', 'section', 'row_id'),
+        db.Index('ix_report_lines_report_asiento', 'report_id', 'no_asiento'),
+    )
+    
+    # Tamaño de lote para inserciones y lecturas
+    BATCH_SIZE = 1000
+    
+    id = db.Column(db.Integer, primary_key=True)
+    report_id = db.Column(db.Integer, db.ForeignKey('reports.id'), nullable=False)
+    section = db.Column(db.String(30), nullable=False, default='')  # '' en reportes tipo lista
+    position = db.Column(db.Integer, nullable=False)
+    row_id = db.Column(db.Integer)  # 'id' asignado por el frontend
+    
+    # Balance de Saldos / Registros Contables
+    cuenta = db.Column(db.String(200))
+    clasificacion = db.Column(db.String(50))
+    monto = db.Column(db.Numeric(18, 2, asdecimal=False))
+    debe = db.Column(db.Numeric(18, 2, asdecimal=False))
+    haber = db.Column(db.Numeric(18, 2, asdecimal=False))
+    fecha = db.Column(db.Date)
+    no_asiento = db.Column(db.Integer)
+    concepto = db.Column(db.Text)
+    
+    # Inventario
+    producto = db.Column(db.String(200))
+    unidades = db.Column(db.Numeric(18, 4, asdecimal=False))
+    costo_unitario = db.Column(db.Numeric(18, 4, asdecimal=False))
+    
+    # Productos en proceso
+    detalle = db.Column(db.String(200))
+    cantidad = db.Column(db.Numeric(18, 4, asdecimal=False))
+    materiales = db.Column(db.Numeric(18, 2, asdecimal=False))
+    mano_obra = db.Column(db.Numeric(18, 2, asdecimal=False))
+    gastos_f = db.Column(db.Numeric(18, 2, asdecimal=False))
+    
+    # Campos sin columna propia o que no se pudieron tipar (JSON)
+    extra = db.Column(db.Text)
+    
+    # Llave del frontend -> (columna, tipo)
+    FIELDS = {
+        'id': ('row_id', 'int'),
+        'cuenta': ('cuenta', 'str'),
+        'clasificacion': ('clasificacion', 'str'),
+        'monto': ('monto', 'number'),
+        'debe': ('debe', 'number'),
+        'haber': ('haber', 'number'),
+        'fecha': ('fecha', 'date'),
+        'noAsiento': ('no_asiento', 'int'),
+        'concepto': ('concepto', 'str'),
+        'producto': ('producto', 'str'),
+        'unidades': ('unidades', 'number'),
+        'costoUnitario': ('costo_unitario', 'number'),
+        'detalle': ('detalle', 'str'),
+        'cantidad': ('cantidad', 'number'),
+        'materiales': ('materiales', 'number'),
+        'manoObra': ('mano_obra', 'number'),
+        'gastosF': ('gastos_f', 'number'),
+    }
+    
+    @classmethod
+    def mapping_from_row(cls, row):
+        """
+        Convertir una fila del frontend en columnas tipadas; lo que no
+        encaja se conserva tal cual en `extra`
+        """
+        if not isinstance(row, dict):
+            raise ValueError('Cada fila del reporte debe ser un objeto')
+        
+        mapping = {}
+        extra = {}
+        
+        for key, value in row.items():
+            field = cls.FIELDS.get(key)
+            converted = _convert_value(value, field[1]) if field else None
+            
+            if converted is None:
+                extra[key] = value
+            else:
+                mapping[field[0]] = converted
+        
+        mapping['extra'] = json.dumps(extra) if extra else None
+        return mapping
+    
+    @classmethod
+    def row_from_record(cls, record):
+        """
+        Convertir un registro de report_lines de vuelta a la fila del frontend
+        """
+        row = {}
+        
+        for key, (column, kind) in cls.FIELDS.items():
+            value = record[column]
+            if value is not None:
+                row[key] = value.isoformat() if kind == 'date' else value
+        
+        if record['extra']:
+            row.update(json.loads(record['extra']))
+        
+        return row
+    
+    @classmethod
+    def bulk_insert(cls, report_id, sections):
+        """
+        Insertar las filas de cada sección con executemany por lotes
+        """
+        batch = []
+        
+        for section, rows in sections:
+            for position, row in enumerate(rows):
+                mapping = cls.mapping_from_row(row)
+                mapping.update(report_id=report_id, section=section, position=position)
+                batch.append(mapping)
+                
+                if len(batch) >= cls.BATCH_SIZE:
+                    db.session.execute(db.insert(cls), batch)
+                    batch = []
+        
+        if batch:
+            db.session.execute(db.insert(cls), batch)
+    
+    @classmethod
+    def find_rows(cls, report_id, keys):
+        """
+        Leer las filas indicadas por (sección, id del frontend)
+        
+        Regresa {(sección, id): (pk, fila)} solo con las que existen.
+        """
+        found = {}
+        by_section = {}
+        for section, row_id in keys:
+            by_section.setdefault(section, set()).add(row_id)
+        
+        for section, row_ids in by_section.items():
+            result = db.session.execute(
+                db.select(cls.__table__)
+                .where(cls.report_id == report_id, cls.section == section,
+                       cls.row_id.in_(list(row_ids)))
+            )
+            for record in result.mappings():
+                found.setdefault((section, record['row_id']), (record['id'], cls.row_from_record(record)))
+        
+        return found
+    
+    @classmethod
+    def append_rows(cls, report_id, section, rows):
+        """
+        Agregar filas al final de una sección sin tocar las existentes
+        """
+        last = db.session.scalar(
+            db.select(db.func.max(cls.position))
+            .where(cls.report_id == report_id, cls.section == section)
+        )
+        start = -1 if last is None else last
+        
+        batch = []
+        for offset, row in enumerate(rows, start=1):
+            mapping = cls.mapping_from_row(row)
+            mapping.update(report_id=report_id, section=section, position=start + offset)
+            batch.append(mapping)
+        
+        if batch:
+            db.session.execute(db.insert(cls), batch)
+    
+    @classmethod
+    def replace_rows(cls, rows_by_pk):
+        """
+        Reescribir filas existentes por su llave primaria (executemany)
+        """
+        empty = {column: None for column, _ in cls.FIELDS.values()}
+        batch = [{**empty, **cls.mapping_from_row(row), 'id': pk} for pk, row in rows_by_pk.items()]
+        
+        if batch:
+            db.session.execute(db.update(cls), batch)
+    
+    @classmethod
+    def iter_rows(cls, report_id):
+        """
+        Recorrer las filas de un reporte en orden, como (sección, fila)
+        """
+        result = db.session.execute(
+            db.select(cls.__table__)
+            .where(cls.report_id == report_id)
+            .order_by(cls.section, cls.position)
+            .execution_options(yield_per=cls.BATCH_SIZE)
+        )
+        
+        for record in result.mappings():
+            yield record['section'], cls.row_from_record(record)
+
+class LedgerBalance(db.Model):
+    """
+    Acumulado por cuenta de todos los registros contables de un usuario
+    
+    Se actualiza de forma incremental al guardar reportes (ver ledger.py).
+    Los importes se guardan en centavos para que las sumas sean exactas.
+    """
+    __tablename__ = 'ledger_balances'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'cuenta_key', name='uq_ledger_balances_user_cuenta'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    cuenta_key = db.Column(db.String(200), nullable=False)  # cuenta normalizada
+    cuenta = db.Column(db.String(200), nullable=False)
+    clasificacion = db.Column(db.String(50))
+    debe_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    haber_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    movimientos = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'cuenta': self.cuenta,
+            'clasificacion': self.clasificacion,
+            'totalDebe': self.debe_cents / 100,
+            'totalHaber': self.haber_cents / 100,
+            'movimientos': self.movimientos,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
+def _convert_value(value, kind):
+    """
+    Convertir un valor al tipo de su columna; None si no es posible
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    
+    try:
+        if kind == 'str':
+            return value if isinstance(value, str) else None
+        if kind == 'int':
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            return value if isinstance(value, int) else None
+        if kind == 'number':
+            return float(value) if isinstance(value, (int, float)) else None
+        if kind == 'date':
+            converted = date.fromisoformat(value)
+            return converted if converted.isoformat() == value else None
+    except (TypeError, ValueError):
+        return None
+    
+    return None
+
+def split_document(document):
+    """
+    Separar un documento de reporte en (esqueleto, [(sección, filas)])
+    
+    Los reportes tipo lista (balance, registros) usan la sección ''.
+    Los documentos con secciones {'rows': [...], ...} (inventario) conservan
+    en el esqueleto todo excepto las filas, que quedan como lista vacía.
+    """
+    if isinstance(document, list):
+        return [], [('', document)]
+    
+    if isinstance(document, dict):
+        skeleton = {}
+        sections = []
+        
+        for key, value in document.items():
+            if isinstance(value, dict) and isinstance(value.get('rows'), list):
+                skeleton[key] = {**value, 'rows': []}
+                sections.append((key, value['rows']))
+            else:
+                skeleton[key] = value
+        
+        return skeleton, sections
+    
+    return document, []
+
+def assemble_document(skeleton, lines):
+    """
+    Inverso de split_document a partir de las líneas (sección, fila)
+    
+    Si el esqueleto aún trae sus filas (reporte sin migrar) y no hay líneas
+    se devuelve tal cual.
+    """
+    sections = {}
+    for section, row in lines:
+        sections.setdefault(section, []).append(row)
+    
+    if isinstance(skeleton, list):
+        return skeleton + sections.get('', [])
+    
+    if isinstance(skeleton, dict):
+        for section, rows in sections.items():
+            skeleton.setdefault(section, {})['rows'] = rows
+    
+    return skeleton
+
+class PeriodBalance(db.Model):
+    """
+    Acumulado por (usuario, programa, mes, origen, cuenta) de todos los
+    reportes, para estados financieros por periodo (ver consolidation.py)
+    
+    `source` es 'saldos' (balance de saldos), 'registros', 'inventory' o
+    'process'; en inventario y proceso la "cuenta" es el producto.
+    """
+    __tablename__ = 'period_balances'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'program_id', 'period', 'source', 'cuenta_key',
+                            name='uq_period_balances_key'),
+        # Consultas por rango de meses de un usuario
+        db.Index('ix_period_balances_user_period', 'user_id', 'period'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    program_id = db.Column(db.Integer, nullable=False, default=0)  # 0 si el reporte no tiene programa
+    period = db.Column(db.Integer, nullable=False)  # YYYYMM
+    source = db.Column(db.String(20), nullable=False)
+    cuenta_key = db.Column(db.String(200), nullable=False)
+    cuenta = db.Column(db.String(200), nullable=False)
+    clasificacion = db.Column(db.String(50))
+    debe_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    haber_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    monto_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    cantidad = db.Column(db.Float, nullable=False, default=0)
+    lineas = db.Column(db.Integer, nullable=False, default=0)
+
 class CuentaContable(db.Model):
     __tablename__ = 'cuentas_contables'
     
@@ -76,4 +560,56 @@ class CuentaContable(db.Model):
             'cuenta': self.cuenta,
             'clasificacion': self.clasificacion,
             'descripcion': self.descripcion
-        }
\ No newline at end of file
+        }
+
+class Job(db.Model):
+    """
+    Trabajo en segundo plano (ver jobs.py)
+    
+    `payload` guarda el cuerpo original de la petición (reporte o archivo
+    a importar) tal como llegó; `params`, `result` y `checkpoint` son JSON.
+    `checkpoint` es hasta dónde llegó un trabajo que guarda por lotes; un
+    reintento lo retoma desde ahí.
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Toma del siguiente trabajo: WHERE status = 'queued' ORDER BY id
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+        # Límites por usuario y listado de sus trabajos
+        db.Index('ix_jobs_user_status', 'user_id', 'status'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, canceled
+    params = db.Column(db.Text, nullable=True)
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    checkpoint = db.Column(db.Text, nullable=True)
+    progress = db.Column(db.Float, nullable=False, default=0)
+    message = db.Column(db.String(200), nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_by = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self, include_result=True):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': round(self.progress or 0, 1),
+            'message': self.message,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if include_result:
+            data['result'] = json.loads(self.result) if self.result else None
+        return data
@@ -0,0 +1,100 @@
+"""
+Hash y verificación de contraseñas fuera del hilo de la petición
+
+El hash es costoso a propósito y retiene el GIL, así que se ejecuta en un
+pool de procesos. El número de operaciones pendientes está acotado: si el
+pool está saturado se lanza HashingBusyError y la ruta responde 429.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+from config import config
+
+
+class HashingBusyError(Exception):
+    """
+    El pool de hash tiene la cola llena
+    """
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(config.PASSWORD_HASH_QUEUE_MAX)
+
+
+def _get_executor():
+    global _executor
+    
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=config.PASSWORD_HASH_WORKERS)
+    
+    return _executor
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusyError('Demasiadas solicitudes de autenticación, intenta de nuevo')
+    
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    
+    # El lugar se libera cuando el hash termina, no cuando la petición deja
+    # de esperarlo: así la cota se mantiene aunque el pool esté saturado
+    future.add_done_callback(lambda _: _slots.release())
+    
+    try:
+        return future.result(timeout=config.PASSWORD_HASH_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        raise HashingBusyError('El servicio de autenticación está saturado, intenta de nuevo')
+
+
+def hash_password(password):
+    """
+    Generar el hash de una contraseña con el método configurado
+    """
+    return _run(generate_password_hash, password, config.PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    """
+    Verificar una contraseña contra su hash
+    """
+    if not password_hash:
+        return False
+    return _run(check_password_hash, password_hash, password)
+
+
+def _method_params(method):
+    """
+    (algoritmo, parámetros) de un método de werkzeug, con los valores por
+    omisión que werkzeug usa cuando no se indican
+    """
+    name, *args = method.split(':')
+    
+    if name == 'scrypt':
+        return name, tuple(int(arg) for arg in args) if args else (2 ** 15, 8, 1)
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return name, (hash_name, iterations)
+    return name, tuple(args)
+
+
+def needs_rehash(password_hash):
+    """
+    True si el hash se generó con parámetros distintos a los actuales
+    """
+    if not password_hash:
+        return True
+    
+    try:
+        return _method_params(password_hash.split('$', 1)[0]) != _method_params(config.PASSWORD_HASH_METHOD)
+    except ValueError:
+        return True
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Almacén de documentos por contenido, comprimidos
+
+Los usuarios suelen guardar copias casi idénticas de un mismo reporte con
+otro nombre. El documento codificado de cada reporte se guarda una sola
+vez en payload_blobs, identificado por el SHA-256 de sus bytes y
+comprimido con zstd (si está instalado) o zlib; report_documents solo
+apunta a esa huella. Solo se descomprime al servir /api/reports/<id>.
+
+Las funciones no hacen commit; eso le toca a quien las llama.
+"""
+import hashlib
+import zlib
+
+from config import config
+from models import db, PayloadBlob, ReportDocument
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+CODECS = ('zstd', 'zlib', 'identity')
+
+
+def digest_of(body):
+    return hashlib.sha256(body).hexdigest()
+
+
+def _codec():
+    if config.PAYLOAD_CODEC == 'zstd' and zstandard is None:
+        return 'zlib'
+    return config.PAYLOAD_CODEC if config.PAYLOAD_CODEC in CODECS else 'zlib'
+
+
+def compress(body):
+    """
+    Comprimir con el códec configurado; devuelve (códec, bytes)
+    
+    Si comprimido no ocupa menos, se guarda tal cual.
+    """
+    codec = _codec()
+    if codec == 'zstd':
+        data = zstandard.ZstdCompressor(level=config.PAYLOAD_ZSTD_LEVEL).compress(body)
+    elif codec == 'zlib':
+        data = zlib.compress(body, config.PAYLOAD_ZLIB_LEVEL)
+    else:
+        return 'identity', body
+    
+    if len(data) >= len(body):
+        return 'identity', body
+    return codec, data
+
+
+def decompress(codec, data):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('El documento está comprimido con zstd; instala zstandard')
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == 'zlib':
+        return zlib.decompress(data)
+    return data
+
+
+def store(body):
+    """
+    Guardar bytes si su contenido todavía no existe y devolver su huella
+    
+    Si otra petición guarda el mismo contenido al mismo tiempo, el commit
+    de quien llama falla con IntegrityError.
+    """
+    digest = digest_of(body)
+    
+    exists = db.session.scalar(db.select(PayloadBlob.digest).where(PayloadBlob.digest == digest))
+    if exists is None:
+        codec, data = compress(body)
+        db.session.add(PayloadBlob(digest=digest, codec=codec, size=len(body), body=data))
+    
+    return digest
+
+
+def load(digest):
+    """
+    Bytes sin comprimir de un contenido; None si ya no existe
+    """
+    row = db.session.execute(
+        db.select(PayloadBlob.codec, PayloadBlob.body).where(PayloadBlob.digest == digest)
+    ).first()
+    
+    if row is None:
+        return None
+    return decompress(row.codec, row.body)
+
+
+def release(digests):
+    """
+    Borrar los contenidos que ya no usa ningún reporte
+    """
+    digests = [digest for digest in set(digests) if digest]
+    if not digests:
+        return
+    
+    in_use = db.exists().where(ReportDocument.digest == PayloadBlob.digest)
+    db.session.execute(
+        db.delete(PayloadBlob)
+        .where(PayloadBlob.digest.in_(digests), ~in_use)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# ==================== DOCUMENTOS POR REPORTE ====================
+
+def load_report(report):
+    """
+    Documento codificado de la versión actual del reporte; None si no hay
+    
+    Un contenido borrado por release() justo cuando otra petición lo
+    reutilizaba también cuenta como ausente y se vuelve a generar.
+    """
+    row = db.session.execute(
+        db.select(PayloadBlob.codec, PayloadBlob.body)
+        .join(ReportDocument, ReportDocument.digest == PayloadBlob.digest)
+        .where(ReportDocument.report_id == report.id, ReportDocument.version == report.version)
+    ).first()
+    
+    if row is None:
+        return None
+    return decompress(row.codec, row.body)
+
+
+def load_reports(reports):
+    """
+    Como load_report, para varios reportes en una sola consulta
+    
+    Regresa {id del reporte: documento} solo con los que tienen copia de
+    su versión actual.
+    """
+    versions = {report.id: report.version for report in reports}
+    if not versions:
+        return {}
+    
+    rows = db.session.execute(
+        db.select(ReportDocument.report_id, ReportDocument.version, PayloadBlob.codec, PayloadBlob.body)
+        .join(PayloadBlob, PayloadBlob.digest == ReportDocument.digest)
+        .where(ReportDocument.report_id.in_(list(versions)))
+    )
+    
+    return {
+        row.report_id: decompress(row.codec, row.body)
+        for row in rows if versions[row.report_id] == row.version
+    }
+
+
+def save_report(report, body):
+    """
+    Guardar el documento codificado de la versión actual del reporte
+    """
+    previous = db.session.scalar(
+        db.select(ReportDocument.digest).where(ReportDocument.report_id == report.id)
+    )
+    digest = store(body)
+    db.session.merge(ReportDocument(report_id=report.id, version=report.version, digest=digest))
+    
+    if previous != digest:
+        db.session.flush()
+        release([previous])
+
+
+def forget_reports(report_ids):
+    """
+    Quitar el documento guardado de unos reportes (se editaron o borraron)
+    """
+    scope = ReportDocument.report_id.in_(report_ids)
+    digests = db.session.scalars(db.select(ReportDocument.digest).where(scope)).all()
+    if digests:
+        db.session.execute(db.delete(ReportDocument).where(scope))
+        release(digests)
@@ -0,0 +1,429 @@
+"""
+Operaciones de escritura sobre reportes compartidas por las rutas
+
+Mantiene en un solo lugar lo que debe pasar al guardar un reporte: totales
+calculados en el servidor, líneas normalizadas, caché de saldos por cuenta
+y acumulados por mes.
+Las funciones no hacen commit; eso le toca a quien las llama.
+"""
+import json
+from datetime import datetime
+
+import archive
+import consolidation
+import ledger
+import metrics
+import payload_store
+import search
+from aggregation import (
+    SECTION_TOTALS, adjust_balance_totals, adjust_registros_totals,
+    adjust_section_totals, apply_totals, compute_totals, is_registros, to_cents
+)
+from cache import LRUCache
+from config import config
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Report, ReportLine, split_document
+
+REQUIRED_FIELDS = ('name', 'reportType', 'date', 'data')
+PATCH_OPS = ('add', 'update', 'remove')
+
+# Documentos ya codificados por (id, versión). Cada edición sube la
+# versión, así que una entrada nunca queda desactualizada, ni en otros
+# procesos; patch_report solo libera la de la versión anterior
+_documents = LRUCache(maxsize=config.REPORT_CACHE_SIZE)
+metrics.watch_cache('report_documents', _documents)
+
+
+class ReportValidationError(ValueError):
+    """
+    El reporte enviado no es válido (se responde con 400)
+    """
+
+
+class ReportConflictError(Exception):
+    """
+    El reporte cambió desde la versión que tiene el cliente (se responde con 409)
+    """
+    
+    def __init__(self, current_version):
+        super().__init__('El reporte fue modificado en otra sesión; recárgalo e intenta de nuevo')
+        self.current_version = current_version
+
+
+def validate_report_payload(payload):
+    """
+    Validar un reporte tal como lo envía el frontend
+    """
+    if not isinstance(payload, dict):
+        raise ReportValidationError('El reporte debe ser un objeto JSON')
+    
+    if not all(k in payload for k in REQUIRED_FIELDS):
+        raise ReportValidationError('Faltan campos requeridos')
+    
+    try:
+        datetime.fromisoformat(payload['date'])
+    except (TypeError, ValueError):
+        raise ReportValidationError('Fecha inválida, usa el formato YYYY-MM-DD')
+    
+    if not isinstance(payload['data'], (list, dict)):
+        raise ReportValidationError('`data` debe ser una lista o un objeto')
+    
+    _, sections = split_document(payload['data'])
+    for section, rows in sections:
+        if not all(isinstance(row, dict) for row in rows):
+            where = f" de la sección '{section}'" if section else ''
+            raise ReportValidationError(f'Cada fila{where} del reporte debe ser un objeto')
+
+
+def create_report(user_pk, payload):
+    """
+    Crear un reporte con sus líneas y actualizar los acumulados del usuario
+    """
+    validate_report_payload(payload)
+    
+    # Los totales se recalculan en el servidor; no se confía en el cliente
+    totals = apply_totals(payload['data'], payload.get('totals'))
+    
+    report = Report(
+        user_id=user_pk,
+        name=payload['name'],
+        report_type=payload['reportType'],
+        program_id=payload.get('programId'),
+        date=datetime.fromisoformat(payload['date']),
+        totals=json.dumps(totals)
+    )
+    
+    db.session.add(report)
+    report.save_document(payload['data'])
+    search.index_lines(report.id)
+    ledger.update_account_balances(user_pk, payload['data'])
+    consolidation.update_for_document(user_pk, report.program_id, report.date, payload['data'])
+    
+    return report
+
+
+def _is_row_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def validate_patch_payload(payload):
+    """
+    Validar un cambio por filas:
+    
+        {"version": 3, "name": "...", "date": "YYYY-MM-DD",
+         "ops": [{"op": "add", "section": "", "row": {...}},
+                 {"op": "update", "id": 17, "fields": {"debe": 150}},
+                 {"op": "remove", "id": 18}]}
+    
+    `section` solo se usa en reportes con secciones (inventory, process).
+    """
+    if not isinstance(payload, dict):
+        raise ReportValidationError('El cambio debe ser un objeto JSON')
+    
+    ops = payload.get('ops', [])
+    if not isinstance(ops, list):
+        raise ReportValidationError('`ops` debe ser una lista')
+    if len(ops) > config.REPORT_PATCH_MAX_OPS:
+        raise ReportValidationError(f'Máximo {config.REPORT_PATCH_MAX_OPS} operaciones por petición')
+    
+    for op in ops:
+        if not isinstance(op, dict) or op.get('op') not in PATCH_OPS:
+            raise ReportValidationError('Operación inválida, usa add, update o remove')
+        if not isinstance(op.get('section', ''), str):
+            raise ReportValidationError('`section` debe ser texto')
+        
+        if op['op'] == 'add':
+            if not isinstance(op.get('row'), dict):
+                raise ReportValidationError('add requiere la fila en `row`')
+            if op['row'].get('id') is not None and not _is_row_id(op['row']['id']):
+                raise ReportValidationError('El id de la fila debe ser un entero')
+        else:
+            if not _is_row_id(op.get('id')):
+                raise ReportValidationError(f"{op['op']} requiere el id entero de la fila")
+            if op['op'] == 'update' and not isinstance(op.get('fields'), dict):
+                raise ReportValidationError('update requiere los campos en `fields`')
+    
+    if 'name' in payload and not (isinstance(payload['name'], str) and payload['name'].strip()):
+        raise ReportValidationError('El nombre no puede estar vacío')
+    
+    if 'date' in payload:
+        try:
+            datetime.fromisoformat(payload['date'])
+        except (TypeError, ValueError):
+            raise ReportValidationError('Fecha inválida, usa el formato YYYY-MM-DD')
+
+
+def _claim_version(report, expected_version):
+    """
+    Subir la versión solo si sigue siendo la que tiene el cliente
+    
+    El UPDATE condicional toma el candado de la fila antes de tocar las
+    líneas, así dos ediciones simultáneas no pueden pisarse.
+    """
+    result = db.session.execute(
+        db.update(Report)
+        .where(Report.id == report.id, Report.version == expected_version)
+        .values(version=Report.version + 1, updated_at=datetime.utcnow())
+    )
+    
+    if result.rowcount != 1:
+        current = db.session.scalar(db.select(Report.version).where(Report.id == report.id))
+        raise ReportConflictError(current)
+
+
+def _next_row_id(report_id, section, state, next_ids):
+    if section not in next_ids:
+        next_ids[section] = db.session.scalar(
+            db.select(db.func.max(ReportLine.row_id))
+            .where(ReportLine.report_id == report_id, ReportLine.section == section)
+        ) or 0
+    
+    in_patch = max((row_id for s, row_id in state if s == section), default=0)
+    next_ids[section] = max(next_ids[section], in_patch) + 1
+    return next_ids[section]
+
+
+def _asiento_diffs(report_id, rows):
+    """
+    Diferencia debe - haber (centavos) de los asientos tocados, ya guardados
+    """
+    asientos = {row.get('noAsiento') for row in rows if _is_row_id(row.get('noAsiento'))}
+    diffs = dict.fromkeys(asientos, 0)
+    
+    if asientos:
+        lines = db.session.execute(
+            db.select(ReportLine.no_asiento, ReportLine.debe, ReportLine.haber)
+            .where(ReportLine.report_id == report_id, ReportLine.section == '',
+                   ReportLine.no_asiento.in_(list(asientos)))
+        )
+        for no_asiento, debe, haber in lines:
+            diffs[no_asiento] += to_cents(debe) - to_cents(haber)
+    
+    return diffs
+
+
+def patch_report(report, expected_version, payload):
+    """
+    Aplicar operaciones por fila (add / update / remove) a un reporte
+    
+    Solo se leen y escriben las filas tocadas. Los totales y el caché de
+    saldos se ajustan con la diferencia entre la versión anterior y la
+    nueva de esas filas, así el costo depende del cambio y no del tamaño
+    del reporte. No hace commit.
+    
+    Un reporte archivado vuelve primero a las tablas calientes.
+    """
+    validate_patch_payload(payload)
+    
+    if report.archived_at is not None:
+        archive.restore(report)
+    
+    skeleton = json.loads(report.data) if report.data else []
+    if isinstance(skeleton, list):
+        sections = {''}
+    else:
+        sections = {key for key, value in skeleton.items()
+                    if isinstance(value, dict) and isinstance(value.get('rows'), list)}
+    
+    ops = payload.get('ops', [])
+    for op in ops:
+        if op.get('section', '') not in sections:
+            raise ReportValidationError(f"Sección desconocida: {op.get('section', '')!r}")
+    
+    _claim_version(report, expected_version)
+    _documents.pop((report.id, expected_version))
+    old_date = report.date
+    
+    if 'name' in payload:
+        report.name = payload['name']
+    if 'date' in payload:
+        report.date = datetime.fromisoformat(payload['date'])
+    
+    keys = {(op.get('section', ''), op['id'] if op['op'] != 'add' else op['row'].get('id'))
+            for op in ops}
+    original = ReportLine.find_rows(report.id, {key for key in keys if key[1] is not None})
+    state = {key: row for key, (_, row) in original.items()}
+    next_ids = {}
+    
+    for op in ops:
+        section = op.get('section', '')
+        
+        if op['op'] == 'add':
+            row = dict(op['row'])
+            if row.get('id') is None:
+                row['id'] = _next_row_id(report.id, section, state, next_ids)
+            key = (section, row['id'])
+            if state.get(key) is not None:
+                raise ReportValidationError(f"Ya existe una fila con id {row['id']}")
+            state[key] = row
+            continue
+        
+        key = (section, op['id'])
+        if state.get(key) is None:
+            raise ReportValidationError(f"Fila {op['id']} no encontrada")
+        
+        if op['op'] == 'update':
+            state[key] = {**state[key], **op['fields'], 'id': op['id']}
+        else:
+            state[key] = None
+    
+    # Versión anterior y nueva de cada fila que realmente cambió
+    old_rows = {section: [] for section in sections}
+    new_rows = {section: [] for section in sections}
+    removed, replaced, added = [], {}, {}
+    
+    for key, row in state.items():
+        section = key[0]
+        pk, before = original.get(key, (None, None))
+        if row == before:
+            continue
+        
+        if before is not None:
+            old_rows[section].append(before)
+        if row is not None:
+            new_rows[section].append(row)
+        
+        if pk is None:
+            added.setdefault(section, []).append(row)
+        elif row is None:
+            removed.append(pk)
+        else:
+            replaced[pk] = row
+    
+    if removed:
+        db.session.execute(db.delete(ReportLine).where(ReportLine.id.in_(removed)))
+    ReportLine.replace_rows(replaced)
+    if added:
+        last_id = db.session.scalar(
+            db.select(db.func.max(ReportLine.id)).where(ReportLine.report_id == report.id)
+        )
+        for section, rows in added.items():
+            ReportLine.append_rows(report.id, section, rows)
+        search.index_lines(report.id, last_id)
+    
+    _adjust_totals(report, skeleton, old_rows, new_rows)
+    payload_store.forget_reports([report.id])
+    
+    if isinstance(skeleton, list):
+        ledger.apply_account_deltas(report.user_id, ledger.aggregate_rows(old_rows['']), sign=-1)
+        ledger.apply_account_deltas(report.user_id, ledger.aggregate_rows(new_rows['']))
+    
+    consolidation.update_for_patch(report, old_date, old_rows, new_rows)
+    
+    return report
+
+
+def _adjust_totals(report, skeleton, old_rows, new_rows):
+    """
+    Actualizar report.totals (y los totales de sección del esqueleto) con
+    las filas que cambiaron; si los totales guardados no tienen la forma
+    esperada se recalculan desde el documento completo
+    """
+    totals = json.loads(report.totals) if report.totals else {}
+    
+    if isinstance(skeleton, list):
+        old, new = old_rows[''], new_rows['']
+        if not old and not new:
+            return
+        
+        if is_registros(old + new) and {'debe', 'haber', 'porClasificacion'} <= totals.keys():
+            computed = adjust_registros_totals(totals, old, new, _asiento_diffs(report.id, old + new))
+        elif not is_registros(old + new) and {'deudor', 'porClasificacion'} <= totals.keys():
+            computed = adjust_balance_totals(totals, old, new)
+        else:
+            computed = compute_totals(report.get_document())
+        
+        report.totals = json.dumps({**totals, **computed})
+        return
+    
+    for section in old_rows:
+        if section not in SECTION_TOTALS or not (old_rows[section] or new_rows[section]):
+            continue
+        
+        section_totals = adjust_section_totals(
+            section, totals.get(section) or {}, old_rows[section], new_rows[section]
+        )
+        totals[section] = {**(totals.get(section) or {}), **section_totals}
+        skeleton[section]['totals'] = {**(skeleton[section].get('totals') or {}), **section_totals}
+    
+    report.totals = json.dumps(totals)
+    report.data = json.dumps(skeleton)
+
+
+def get_document_json(report):
+    """
+    Documento del reporte ya codificado (bytes)
+    
+    Se busca primero en la caché del proceso y después en payload_store,
+    que guarda una copia comprimida por versión (o en el archivo, si el
+    reporte está archivado); si no hay ninguna, se genera y se guarda.
+    Puede hacer commit.
+    """
+    key = (report.id, report.version)
+    body = _documents.get(key)
+    if body is not None:
+        return body
+    
+    if report.archived_at is not None:
+        body = archive.load_document_json(report)
+    else:
+        body = payload_store.load_report(report)
+    
+    if body is None:
+        body = current_app.json.dumps_bytes(report.get_document())
+        _save_documents([(report, body)])
+    
+    _documents.set(key, body)
+    return body
+
+
+def get_documents_json(reports):
+    """
+    Documentos de varios reportes, {id: bytes}
+    
+    Los que no están en caché se leen de payload_store con una sola
+    consulta y solo se reconstruyen los que no tienen copia. Puede hacer
+    commit.
+    """
+    keys = {report.id: (report.id, report.version) for report in reports}
+    found = {}
+    pending = []
+    
+    for report in reports:
+        body = _documents.get(keys[report.id])
+        if body is None:
+            pending.append(report)
+        else:
+            found[report.id] = body
+    
+    if pending:
+        stored = archive.load_documents_json([report for report in pending if report.archived_at is not None])
+        stored.update(payload_store.load_reports([report for report in pending if report.archived_at is None]))
+        built = []
+        for report in pending:
+            if report.id not in stored:
+                stored[report.id] = current_app.json.dumps_bytes(report.get_document())
+                built.append((report, stored[report.id]))
+        
+        _save_documents(built)
+        
+        for report_id, body in stored.items():
+            _documents.set(keys[report_id], body)
+            found[report_id] = body
+    
+    return found
+
+
+def _save_documents(documents):
+    if not documents:
+        return
+    
+    try:
+        for report, body in documents:
+            payload_store.save_report(report, body)
+        db.session.commit()
+    except IntegrityError:
+        # Otra petición guardó el mismo documento al mismo tiempo
+        db.session.rollback()
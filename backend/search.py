@@ -0,0 +1,356 @@
+"""
+Búsqueda de texto completo sobre reportes y líneas
+
+Indexa el nombre de cada reporte y, de cada línea, la cuenta, el concepto,
+el número de asiento, el producto y el detalle.
+
+- SQLite: tablas FTS5 de contenido externo (report_lines_fts, reports_fts)
+  que leen el texto de report_lines y reports. Triggers las mantienen al
+  día en UPDATE y DELETE; las líneas nuevas se indexan con index_lines()
+  en una sola sentencia por reporte, porque un trigger AFTER INSERT por
+  fila hace que guardar un reporte grande sea ~4 veces más lento.
+- PostgreSQL: columnas tsvector generadas (search_vector) con índice GIN.
+
+Se califican por relevancia (bm25 / ts_rank) las coincidencias más
+recientes del usuario, hasta SEARCH_MAX_CANDIDATES; así una palabra muy
+común no obliga a calificar todas las líneas que la contienen. Los
+resultados se paginan con limit/offset y las facetas cuentan los
+reportes que coinciden por tipo, programa y mes.
+"""
+import re
+import unicodedata
+
+from sqlalchemy.exc import OperationalError
+
+from config import config
+from models import db, Report, ReportLine
+
+# Términos máximos por búsqueda
+MAX_TERMS = 8
+
+HIGHLIGHT = ('**', '**')
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS report_lines_fts USING fts5(
+        cuenta, concepto, no_asiento, producto, detalle,
+        content='report_lines', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+        name, content='reports', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS report_lines_fts_ad AFTER DELETE ON report_lines BEGIN
+        INSERT INTO report_lines_fts(report_lines_fts, rowid, cuenta, concepto, no_asiento, producto, detalle)
+        VALUES ('delete', old.id, old.cuenta, old.concepto, old.no_asiento, old.producto, old.detalle);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS report_lines_fts_au
+    AFTER UPDATE OF cuenta, concepto, no_asiento, producto, detalle ON report_lines BEGIN
+        INSERT INTO report_lines_fts(report_lines_fts, rowid, cuenta, concepto, no_asiento, producto, detalle)
+        VALUES ('delete', old.id, old.cuenta, old.concepto, old.no_asiento, old.producto, old.detalle);
+        INSERT INTO report_lines_fts(rowid, cuenta, concepto, no_asiento, producto, detalle)
+        VALUES (new.id, new.cuenta, new.concepto, new.no_asiento, new.producto, new.detalle);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reports_fts_ai AFTER INSERT ON reports BEGIN
+        INSERT INTO reports_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reports_fts_ad AFTER DELETE ON reports BEGIN
+        INSERT INTO reports_fts(reports_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS reports_fts_au AFTER UPDATE OF name ON reports BEGIN
+        INSERT INTO reports_fts(reports_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO reports_fts(rowid, name) VALUES (new.id, new.name);
+    END
+    """,
+]
+
+
+def _postgres_ddl():
+    language = config.SEARCH_PG_CONFIG.replace("'", "''")
+    return [
+        f"""
+        ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{language}'::regconfig, coalesce(name, ''))) STORED
+        """,
+        f"""
+        ALTER TABLE report_lines ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{language}'::regconfig,
+            coalesce(cuenta, '') || ' ' || coalesce(concepto, '') || ' ' ||
+            coalesce(no_asiento::text, '') || ' ' || coalesce(producto, '') || ' ' ||
+            coalesce(detalle, ''))) STORED
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_reports_search ON reports USING gin (search_vector)",
+        "CREATE INDEX IF NOT EXISTS ix_report_lines_search ON report_lines USING gin (search_vector)",
+    ]
+
+
+def available():
+    """
+    Si el índice de búsqueda existe en la base de datos actual
+    """
+    if config.IS_SQLITE:
+        query = "SELECT 1 FROM sqlite_master WHERE name = 'report_lines_fts'"
+    else:
+        query = ("SELECT 1 FROM information_schema.columns "
+                 "WHERE table_name = 'report_lines' AND column_name = 'search_vector'")
+    return db.session.scalar(db.text(query)) is not None
+
+
+def install():
+    """
+    Crear el índice y llenarlo con lo que ya existe
+    
+    Es idempotente; regresa True si el índice se creó en esta llamada.
+    Si SQLite no se compiló con FTS5 la búsqueda queda desactivada.
+    """
+    if available():
+        return False
+    
+    try:
+        with db.engine.begin() as connection:
+            for ddl in (SQLITE_DDL if config.IS_SQLITE else _postgres_ddl()):
+                connection.execute(db.text(ddl))
+            
+            if config.IS_SQLITE:
+                connection.execute(db.text("INSERT INTO report_lines_fts(report_lines_fts) VALUES ('rebuild')"))
+                connection.execute(db.text("INSERT INTO reports_fts(reports_fts) VALUES ('rebuild')"))
+    except OperationalError as e:
+        print(f"⚠️ Búsqueda de texto completo no disponible: {str(e)}")
+        return False
+    
+    return True
+
+
+def index_lines(report_id, after_id=0):
+    """
+    Indexar las líneas de un reporte con id mayor que `after_id`
+    
+    Se llama después de ReportLine.bulk_insert / append_rows. En
+    PostgreSQL la columna generada ya está al día y no hace nada.
+    """
+    if not config.IS_SQLITE or not available():
+        return
+    
+    db.session.execute(
+        db.text("""
+            INSERT INTO report_lines_fts(rowid, cuenta, concepto, no_asiento, producto, detalle)
+            SELECT id, cuenta, concepto, no_asiento, producto, detalle
+            FROM report_lines WHERE report_id = :report_id AND id > :after_id
+        """),
+        {'report_id': report_id, 'after_id': after_id or 0}
+    )
+
+
+# ==================== CONSULTA ====================
+
+def terms(text):
+    """
+    Palabras de la búsqueda como (palabra, prefijo); `pago*` también
+    encuentra «pagos». Se descarta el resto de la sintaxis para que el
+    texto del usuario no se interprete como operadores
+    """
+    return [(word, star == '*') for word, star in re.findall(r'(\w+)(\*?)', text or '')][:MAX_TERMS]
+
+
+def _match_expression(words):
+    # Todas las palabras; las marcadas con * como prefijo
+    if config.IS_SQLITE:
+        return ' '.join(f'"{word}"' + ('*' if prefix else '') for word, prefix in words)
+    return ' & '.join(word + (':*' if prefix else '') for word, prefix in words)
+
+
+def _filters(report_type, program_id, date_from, date_to):
+    clauses = ['r.user_id = :user_pk']
+    if report_type:
+        clauses.append('r.report_type = :report_type')
+    if program_id is not None:
+        clauses.append('r.program_id = :program_id')
+    if date_from:
+        clauses.append('r.date >= :date_from')
+    if date_to:
+        clauses.append('r.date <= :date_to')
+    return ' AND '.join(clauses)
+
+
+def _candidates_sql(kind, where):
+    """
+    Coincidencias más recientes (id, reporte, relevancia) de nombres o de
+    líneas
+    
+    Recorrer el índice en orden de rowid descendente permite detenerse al
+    juntar :window coincidencias del usuario en lugar de calificar todas.
+    """
+    if config.IS_SQLITE:
+        if kind == 'report':
+            return f"""
+                SELECT r.id AS id, r.id AS report_id, -bm25(reports_fts) AS score
+                FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid
+                WHERE reports_fts MATCH :query AND {where}
+                ORDER BY reports_fts.rowid DESC LIMIT :window
+            """
+        return f"""
+            SELECT l.id AS id, l.report_id AS report_id, -bm25(report_lines_fts) AS score
+            FROM report_lines_fts
+            JOIN report_lines l ON l.id = report_lines_fts.rowid
+            JOIN reports r ON r.id = l.report_id
+            WHERE report_lines_fts MATCH :query AND {where}
+            ORDER BY report_lines_fts.rowid DESC LIMIT :window
+        """
+    
+    query = 'to_tsquery(CAST(:language AS regconfig), :query)'
+    if kind == 'report':
+        return f"""
+            SELECT r.id AS id, r.id AS report_id, ts_rank(r.search_vector, {query}) AS score
+            FROM reports r
+            WHERE r.search_vector @@ {query} AND {where}
+            ORDER BY r.id DESC LIMIT :window
+        """
+    return f"""
+        SELECT l.id AS id, l.report_id AS report_id, ts_rank(l.search_vector, {query}) AS score
+        FROM report_lines l JOIN reports r ON r.id = l.report_id
+        WHERE l.search_vector @@ {query} AND {where}
+        ORDER BY l.id DESC LIMIT :window
+    """
+
+
+def _candidates(kind, where, params):
+    statement = db.text(_candidates_sql(kind, where))
+    for name in ('date_from', 'date_to'):
+        if params.get(name):
+            statement = statement.bindparams(db.bindparam(name, type_=db.Date))
+    return db.session.execute(statement, params).all()
+
+
+def _fold(text):
+    # Minúsculas y sin acentos, como el tokenizador (remove_diacritics)
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def highlight(text, words):
+    """
+    Marcar con HIGHLIGHT las palabras del texto que coinciden con la búsqueda
+    
+    Se hace aquí con las filas de la página y no con snippet()/ts_headline:
+    esas funciones vuelven a evaluar la búsqueda completa y, con prefijos,
+    cuestan más que la búsqueda misma.
+    """
+    start, end = HIGHLIGHT
+    folded = [(_fold(word), prefix) for word, prefix in words]
+    
+    def mark(match):
+        token = _fold(match.group())
+        if any(token.startswith(word) if prefix else token == word for word, prefix in folded):
+            return f'{start}{match.group()}{end}'
+        return match.group()
+    
+    return re.sub(r'\w+', mark, text)
+
+
+def _line_text(line):
+    fields = (line.cuenta, line.concepto, line.no_asiento, line.producto, line.detalle)
+    return ' · '.join(str(value) for value in fields if value not in (None, ''))
+
+
+def _facets(reports):
+    """
+    Reportes que coinciden por tipo, programa y mes
+    """
+    facets = {'reportType': {}, 'programId': {}, 'month': {}}
+    
+    for report in reports:
+        program = str(report.program_id) if report.program_id is not None else 'none'
+        for name, key in (('reportType', report.report_type), ('programId', program),
+                          ('month', report.date.strftime('%Y-%m'))):
+            facets[name][key] = facets[name].get(key, 0) + 1
+    
+    return {name: dict(sorted(counts.items())) for name, counts in facets.items()}
+
+
+def search(user_pk, text, report_type=None, program_id=None, date_from=None, date_to=None,
+           limit=20, offset=0, with_facets=True):
+    """
+    Buscar en los reportes de un usuario
+    
+    Se califican las SEARCH_MAX_CANDIDATES coincidencias más recientes de
+    nombres y de líneas; `truncated` indica que había más. Regresa
+    {'results', 'hasMore', 'truncated', 'facets'}; cada resultado es un
+    reporte cuyo nombre coincide o una línea, con su fragmento resaltado.
+    """
+    words = terms(text)
+    if not words:
+        raise ValueError('La búsqueda debe tener al menos una palabra')
+    
+    window = config.SEARCH_MAX_CANDIDATES
+    params = {
+        'query': _match_expression(words), 'language': config.SEARCH_PG_CONFIG, 'window': window,
+        'user_pk': user_pk, 'report_type': report_type, 'program_id': program_id,
+        'date_from': date_from, 'date_to': date_to
+    }
+    where = _filters(report_type, program_id, date_from, date_to)
+    
+    candidates = []
+    truncated = False
+    for kind in ('report', 'line'):
+        rows = _candidates(kind, where, params)
+        truncated = truncated or len(rows) >= window
+        candidates.extend((kind, row) for row in rows)
+    
+    # Más relevantes primero; a igual relevancia, nombres antes que líneas
+    candidates.sort(key=lambda hit: (-hit[1].score, hit[0] != 'report', -hit[1].id))
+    page = candidates[offset:offset + limit]
+    
+    report_ids = {hit.report_id for _, hit in (candidates if with_facets else page)}
+    reports = {
+        report.id: report for report in Report.query.options(
+            db.load_only(Report.id, Report.name, Report.report_type, Report.program_id, Report.date)
+        ).filter(Report.id.in_(report_ids))
+    } if report_ids else {}
+    
+    line_ids = [hit.id for kind, hit in page if kind == 'line']
+    lines = {
+        row.id: row for row in db.session.execute(
+            db.select(ReportLine.id, ReportLine.section, ReportLine.row_id, ReportLine.cuenta,
+                      ReportLine.concepto, ReportLine.no_asiento, ReportLine.producto, ReportLine.detalle)
+            .where(ReportLine.id.in_(line_ids))
+        )
+    } if line_ids else {}
+    
+    results = []
+    for kind, hit in page:
+        report = reports[hit.report_id]
+        text = report.name if kind == 'report' else _line_text(lines[hit.id])
+        result = {
+            'match': kind,
+            'score': round(float(hit.score), 4),
+            'snippet': highlight(text, words),
+            'reportId': report.id,
+            'name': report.name,
+            'reportType': report.report_type,
+            'programId': report.program_id,
+            'date': report.date.isoformat()
+        }
+        if kind == 'line':
+            result['section'] = lines[hit.id].section
+            result['rowId'] = lines[hit.id].row_id
+        results.append(result)
+    
+    return {
+        'results': results,
+        'hasMore': len(candidates) > offset + limit,
+        'truncated': truncated,
+        'facets': _facets(reports.values()) if with_facets else None
+    }
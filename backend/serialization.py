@@ -0,0 +1,122 @@
+"""
+Serialización JSON rápida y compresión de respuestas
+
+Si orjson está instalado se usa como codificador de jsonify (compacto, sin
+espacios); si no, Flask sigue con su codificador por defecto. Las
+respuestas grandes se comprimen con brotli (si está instalado) o gzip
+según lo que acepte el cliente.
+"""
+import gzip
+import time
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import metrics
+from config import config
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+    'text/html',
+}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask que usa orjson cuando está disponible
+    
+    Las fechas y los tipos que orjson no conoce pasan por el `default` de
+    Flask, así la salida es la misma que con el proveedor por defecto.
+    """
+    
+    def dumps_bytes(self, obj):
+        """
+        Codificar directo a bytes (sin pasar por str)
+        """
+        started = time.perf_counter()
+        
+        if orjson is not None:
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            body = orjson.dumps(obj, default=self.default, option=option)
+        else:
+            body = super().dumps(obj, separators=(',', ':')).encode()
+        
+        metrics.add_request_time('json', time.perf_counter() - started)
+        return body
+    
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return self.dumps_bytes(obj).decode()
+        return super().dumps(obj, **kwargs)
+    
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def _accepted_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """
+    Comprimir respuestas grandes (registrar con app.after_request)
+    
+    No toca respuestas en streaming, ya comprimidas, pequeñas o de tipos
+    que no se benefician. El ETag se vuelve débil porque los bytes cambian
+    según la codificación.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    
+    if (response.content_length or 0) < config.COMPRESS_MIN_SIZE:
+        return response
+    
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+    
+    body = response.get_data()
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=config.BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=config.GZIP_LEVEL, mtime=0)
+    
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    
+    return response